@@ -1,28 +1,80 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, jsonify, g, abort, send_file,
+                   make_response)
 from config import Config
-from models import Database, UserModel, NovelModel, OrderModel, ReadingRecordModel
+from models import (Database, BatchLoader, UserModel, NovelModel, ChapterModel, CommentModel, OrderModel,
+                    ImportJobModel, ReadingRecordModel)
+from write_behind import WriteBehindBuffer
+from import_jobs import ImportJobRunner
+from passwords import PasswordHasher, HasherBusy
+from recommend import ItemCF, READ_WEIGHT, PURCHASE_WEIGHT
+from warmup import enable_template_cache
+from chapter_codec import ChapterCodec
+from blob_store import BlobStore
+from rollups import RollupStore
+from http_cache import page_etag, last_modified, is_fresh, cache_privately, not_modified
 from functools import wraps
 from bson.objectid import ObjectId
+from pymongo.errors import ExecutionTimeout
 from datetime import datetime
-from pymongo import DESCENDING
 import os
-import PyPDF2
 
 app = Flask(__name__)
 app.config.from_object(Config)
+enable_template_cache(app)
 
 # 初始化数据库
 db = Database(app.config['MONGODB_URI'], app.config['MONGODB_DB'])
-user_model = UserModel(db)
-novel_model = NovelModel(db)
+password_hasher = PasswordHasher(rounds=app.config['BCRYPT_ROUNDS'],
+                                 threads=app.config['PASSWORD_HASH_THREADS'],
+                                 max_queue=app.config['PASSWORD_HASH_QUEUE'],
+                                 timeout=app.config['PASSWORD_HASH_TIMEOUT'])
+user_model = UserModel(db, cache_size=app.config['PRINCIPAL_CACHE_SIZE'],
+                       cache_ttl=app.config['PRINCIPAL_CACHE_TTL'], hasher=password_hasher)
+novel_model = NovelModel(db, rollups=RollupStore(db, app.config['ROLLUP_HOURLY_RETENTION_DAYS']))
+chapter_model = ChapterModel(db, codec=ChapterCodec(db, app.config['CHAPTER_COMPRESSION'],
+                                                    level=app.config['CHAPTER_COMPRESSION_LEVEL'],
+                                                    dictionary_size=app.config['CHAPTER_DICTIONARY_SIZE'],
+                                                    min_chapters=app.config['CHAPTER_DICTIONARY_MIN_CHAPTERS'],
+                                                    storage=app.config['CHAPTER_STORAGE'],
+                                                    blob_store=BlobStore(app.config['CHAPTER_BLOB_DIR'])))
+comment_model = CommentModel(db)
 order_model = OrderModel(db)
 reading_record_model = ReadingRecordModel(db)
+import_job_model = ImportJobModel(db)
+item_cf = ItemCF(db, top_k=app.config['RECOMMEND_TOP_K'])
+activity_buffer = WriteBehindBuffer(novel_model, reading_record_model,
+                                    enabled=app.config['WRITE_BEHIND_ENABLED'],
+                                    flush_interval=app.config['WRITE_BEHIND_INTERVAL'],
+                                    max_pending=app.config['WRITE_BEHIND_MAX_PENDING'])
 
 # 确保上传文件夹存在
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
 
+# 请求级批量加载器：同一请求内按ID查询用户/小说时合并为一次$in查询并缓存
+def get_user_loader():
+    """获取当前请求的用户加载器"""
+    if 'user_loader' not in g:
+        g.user_loader = BatchLoader(user_model.find_by_ids)
+    return g.user_loader
+
+
+def get_novel_loader():
+    """获取当前请求的小说加载器（卡片字段）"""
+    if 'novel_loader' not in g:
+        g.novel_loader = BatchLoader(novel_model.find_by_ids)
+    return g.novel_loader
+
+
+def attach_author_names(novels):
+    """批量为小说填充作者名"""
+    authors = get_user_loader().load_many([novel['authorId'] for novel in novels])
+    for novel, author in zip(novels, authors):
+        novel['author_name'] = author['username'] if author else '未知'
+    return novels
+
+
 # 装饰器：要求登录
 def login_required(f):
     @wraps(f)
@@ -43,10 +95,12 @@ def role_required(role):
                 flash('请先登录', 'warning')
                 return redirect(url_for('login'))
             
-            user = user_model.find_by_id(session['user_id'])
+            user = user_model.find_principal(session['user_id'])
             if not user or user['role'] != role:
                 flash('无权限访问此页面', 'danger')
                 return redirect(url_for('index'))
+            # 放入请求级加载器，路由内再次查询当前用户时无需访问数据库
+            get_user_loader().prime(user)
             return f(*args, **kwargs)
         return decorated_function
     return decorator
@@ -57,23 +111,13 @@ def role_required(role):
 def index():
     """首页 - 悦读坊"""
     # 获取精选推荐（热门小说）
-    featured_novels = list(
-        novel_model.collection.find({"status": "online"})
-        .sort("readCount", DESCENDING)
-        .limit(6)
-    )
+    featured_novels = novel_model.find_novels({"status": "online"}, limit=6, sort_by="readCount")
     
     # 获取新书上架
-    new_novels = list(
-        novel_model.collection.find({"status": "online"})
-        .sort("createTime", DESCENDING)
-        .limit(6)
-    )
+    new_novels = novel_model.find_novels({"status": "online"}, limit=6, sort_by="createTime")
     
     # 为所有小说添加作者信息
-    for novel in featured_novels + new_novels:
-        author = user_model.find_by_id(str(novel['authorId']))
-        novel['author_name'] = author['username'] if author else '未知'
+    attach_author_names(featured_novels + new_novels)
     
     # 如果已登录，添加用户信息
     logged_in = 'user_id' in session
@@ -84,6 +128,12 @@ def index():
                          logged_in=logged_in)
 
 
+def busy(template):
+    """密码哈希线程池已满：返回503，提示稍后重试"""
+    flash('当前登录人数较多，请稍后重试', 'warning')
+    return render_template(template), 503, {'Retry-After': '5'}
+
+
 # 登录页面
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -91,7 +141,11 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         
-        user = user_model.verify_password(username, password)
+        try:
+            user = user_model.verify_password(username, password)
+        except HasherBusy:
+            return busy('login.html')
+        
         if user:
             session['user_id'] = str(user['_id'])
             session['username'] = user['username']
@@ -134,6 +188,8 @@ def register():
             session.permanent = True
             flash('注册成功！欢迎来到悦读坊', 'success')
             return redirect(url_for('index'))
+        except HasherBusy:
+            return busy('register.html')
         except Exception as e:
             flash(f'注册失败：{str(e)}', 'danger')
     
@@ -175,6 +231,34 @@ def admin_users():
     return render_template('admin/users.html', users=users)
 
 
+# 批量创建用户
+@app.route('/admin/users/bulk', methods=['POST'])
+@role_required('admin')
+def admin_bulk_create_users():
+    users = []
+    for line in request.form.get('users', '').splitlines():
+        parts = [p.strip() for p in line.replace('，', ',').split(',')]
+        if not parts[0]:
+            continue
+        role = parts[2] if len(parts) > 2 and parts[2] else 'reader'
+        if len(parts) < 2 or not parts[1] or role not in ('reader', 'creator', 'admin'):
+            flash(f'格式错误：{line}（应为 用户名,密码,角色）', 'danger')
+            return redirect(url_for('admin_users'))
+        users.append((parts[0], parts[1], role))
+    
+    if not users:
+        flash('请填写要创建的用户', 'warning')
+        return redirect(url_for('admin_users'))
+    
+    created, existing, duplicates = user_model.create_users(users)
+    flash(f'已创建 {created} 个用户', 'success')
+    if existing:
+        flash(f'以下用户名已存在，已跳过：{"、".join(existing)}', 'warning')
+    if duplicates:
+        flash(f'以下用户名重复填写，只创建了第一行：{"、".join(duplicates)}', 'warning')
+    return redirect(url_for('admin_users'))
+
+
 # 删除用户
 @app.route('/admin/users/<user_id>/delete', methods=['POST'])
 @role_required('admin')
@@ -184,6 +268,13 @@ def admin_delete_user(user_id):
     return redirect(url_for('admin_users'))
 
 
+# 已登录用户缓存统计
+@app.route('/admin/cache/stats')
+@role_required('admin')
+def admin_cache_stats():
+    return jsonify(user_model.principal_cache.stats())
+
+
 # 待审核小说列表
 @app.route('/admin/review')
 @role_required('admin')
@@ -191,9 +282,7 @@ def admin_review():
     pending_novels = novel_model.find_novels({"status": "pending"})
     
     # 获取作者信息
-    for novel in pending_novels:
-        author = user_model.find_by_id(str(novel['authorId']))
-        novel['author_name'] = author['username'] if author else '未知'
+    attach_author_names(pending_novels)
     
     return render_template('admin/review.html', novels=pending_novels)
 
@@ -227,19 +316,28 @@ def creator_dashboard():
     online_novels = len([n for n in my_novels if n['status'] == 'online'])
     total_reads = sum(n.get('readCount', 0) for n in my_novels)
     
+    # 近期阅读量/销量趋势
+    trend = novel_model.rollups.recent_series("author", session['user_id'], app.config['TREND_DAYS'])
+    
     return render_template('creator/dashboard.html',
                          novels=my_novels,
                          total_novels=total_novels,
                          online_novels=online_novels,
-                         total_reads=total_reads)
+                         total_reads=total_reads,
+                         trend=trend)
 
 
 # 小说列表
 @app.route('/creator/novels')
 @role_required('creator')
 def creator_novels():
-    novels = novel_model.find_novels({"authorId": ObjectId(session['user_id'])})
-    return render_template('creator/novels.html', novels=novels)
+    novels, next_cursor, prev_cursor = novel_model.find_novels_page(
+        {"authorId": ObjectId(session['user_id'])},
+        cursor=request.args.get('cursor'), limit=app.config['NOVELS_PER_PAGE'])
+    return render_template('creator/novels.html',
+                         novels=novels,
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor)
 
 
 # 创建小说
@@ -275,7 +373,7 @@ def creator_create_novel():
 @app.route('/creator/novels/<novel_id>/edit', methods=['GET', 'POST'])
 @role_required('creator')
 def creator_edit_novel(novel_id):
-    novel = novel_model.find_by_id(novel_id)
+    novel = get_novel_loader().load(novel_id)
     
     if not novel or str(novel['authorId']) != session['user_id']:
         flash('无权限编辑此小说', 'danger')
@@ -303,7 +401,7 @@ def creator_edit_novel(novel_id):
 @app.route('/creator/novels/<novel_id>/import', methods=['GET', 'POST'])
 @role_required('creator')
 def creator_import_chapters(novel_id):
-    novel = novel_model.find_by_id(novel_id)
+    novel = get_novel_loader().load(novel_id)
     
     if not novel or str(novel['authorId']) != session['user_id']:
         flash('无权限操作此小说', 'danger')
@@ -313,88 +411,99 @@ def creator_import_chapters(novel_id):
         file = request.files.get('file')
         
         if file and file.filename:
-            filename = file.filename
-            if filename.endswith('.txt'):
-                # 处理TXT文件
-                content = file.read().decode('utf-8', errors='ignore')
-                chapters = parse_txt_chapters(content)
-                
-                for idx, chapter in enumerate(chapters):
-                    chapter_data = {
-                        'chapterId': f"CH{idx+1:03d}",
-                        'title': chapter['title'],
-                        'content': chapter['content'],
-                        'isFree': idx < 3,  # 前3章免费
-                        'createTime': datetime.utcnow()
-                    }
-                    novel_model.add_chapter(novel_id, chapter_data)
-                
-                flash(f'成功导入 {len(chapters)} 个章节', 'success')
-                return redirect(url_for('creator_chapters', novel_id=novel_id))
-            elif filename.endswith('.pdf'):
-                # 处理PDF文件
-                try:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    content = ''
-                    for page in pdf_reader.pages:
-                        content += page.extract_text()
-                    
-                    chapters = parse_txt_chapters(content)
-                    
-                    for idx, chapter in enumerate(chapters):
-                        chapter_data = {
-                            'chapterId': f"CH{idx+1:03d}",
-                            'title': chapter['title'],
-                            'content': chapter['content'],
-                            'isFree': idx < 3,
-                            'createTime': datetime.utcnow()
-                        }
-                        novel_model.add_chapter(novel_id, chapter_data)
-                    
-                    flash(f'成功导入 {len(chapters)} 个章节', 'success')
-                    return redirect(url_for('creator_chapters', novel_id=novel_id))
-                except Exception as e:
-                    flash(f'PDF解析失败：{str(e)}', 'danger')
-    
-    return render_template('creator/import_chapters.html', novel=novel)
-
-
-def parse_txt_chapters(content):
-    """解析TXT文本为章节"""
-    import re
-    
-    # 尝试匹配章节标题（第X章、第X回等）
-    chapter_pattern = r'第[零一二三四五六七八九十百千0-9]+[章回节][\s：:]*(.+?)(?=\n)'
-    
-    chapters = []
-    matches = list(re.finditer(chapter_pattern, content))
-    
-    if not matches:
-        # 如果没有找到章节标记，将整个内容作为一章
-        chapters.append({
-            'title': '正文',
-            'content': content
-        })
+            if file.filename.lower().endswith(('.txt', '.pdf')):
+                # 保存文件并提交后台导入任务，页面轮询任务进度
+                job_id = import_runner.submit(novel_id, session['user_id'], file)
+                flash('文件已上传，正在后台导入章节', 'info')
+                return redirect(url_for('creator_import_chapters', novel_id=novel_id, job=str(job_id)))
+            flash('仅支持 TXT / PDF 格式文件', 'danger')
+    
+    return render_template('creator/import_chapters.html', novel=novel, job_id=request.args.get('job'))
+
+
+# 阅读量/销量趋势（按天）
+@app.route('/stats/trends')
+@login_required
+def trend_series():
+    scope = request.args.get('scope', 'site')
+    key = request.args.get('key', 'all')
+    days = min(request.args.get('days', app.config['TREND_DAYS'], type=int), 366)
+    
+    # 管理员可查看全部维度，创作者只能查看自己及自己作品的趋势
+    user = user_model.find_principal(session['user_id'])
+    role = user['role'] if user else None
+    if role == 'creator':
+        if scope == 'author':
+            allowed = key == session['user_id']
+        elif scope == 'novel':
+            novel = get_novel_loader().load(key) if ObjectId.is_valid(key) else None
+            allowed = novel is not None and str(novel['authorId']) == session['user_id']
+        else:
+            allowed = False
     else:
-        for i, match in enumerate(matches):
-            title = match.group(0).strip()
-            start = match.end()
-            end = matches[i+1].start() if i+1 < len(matches) else len(content)
-            chapter_content = content[start:end].strip()
-            
-            chapters.append({
-                'title': title,
-                'content': chapter_content
-            })
+        allowed = role == 'admin'
+    if not allowed:
+        return jsonify({"success": False, "message": "无权限查看此数据"})
     
-    return chapters
+    points = novel_model.rollups.recent_series(scope, key, days)
+    return jsonify({
+        "success": True,
+        "dates": [p['time'].strftime('%Y-%m-%d') for p in points],
+        "reads": [p['reads'] for p in points],
+        "sales": [p['sales'] for p in points]
+    })
+
+
+# 导入任务进度
+@app.route('/creator/import-jobs/<job_id>')
+@role_required('creator')
+def creator_import_job_status(job_id):
+    job = import_job_model.find_by_id(job_id)
+    
+    if not job or str(job['authorId']) != session['user_id']:
+        return jsonify({"success": False, "message": "导入任务不存在"})
+    
+    # 执行任务的进程已退出时标记为失败，前端不再轮询
+    job = import_runner.recover_if_stale(job)
+    
+    return jsonify({
+        "success": True,
+        "status": job['status'],
+        "filename": job['filename'],
+        "pagesTotal": job['pagesTotal'],
+        "pagesProcessed": job['pagesProcessed'],
+        "chaptersFound": job['chaptersFound'],
+        "error": job['error']
+    })
+
+
+def import_chapters(novel_id, chapters, progress=None, job_id=None):
+    """批量导入解析出的章节（前3章免费），失败时整体回滚"""
+    chapter_data = (
+        {
+            'title': chapter['title'],
+            'content': chapter['content'],
+            'isFree': idx < 3,  # 前3章免费
+            'createTime': datetime.utcnow()
+        }
+        for idx, chapter in enumerate(chapters)
+    )
+    return chapter_model.add_chapters(novel_id, chapter_data, progress=progress, import_job_id=job_id)
+
+
+import_runner = ImportJobRunner(import_job_model, import_chapters, chapter_model.rollback_import,
+                                app.config['UPLOAD_FOLDER'],
+                                job_threads=app.config['IMPORT_JOB_THREADS'],
+                                pdf_workers=app.config['IMPORT_PDF_WORKERS'],
+                                pages_per_task=app.config['IMPORT_PAGES_PER_TASK'],
+                                stale_seconds=app.config['IMPORT_JOB_STALE_SECONDS'])
 
 
 # 章节管理
 @app.route('/creator/novels/<novel_id>/chapters')
 @role_required('creator')
 def creator_chapters(novel_id):
-    novel = novel_model.find_by_id(novel_id)
+    novel = novel_model.find_by_id(novel_id, view='toc')
     
     if not novel or str(novel['authorId']) != session['user_id']:
         flash('无权限访问此小说', 'danger')
@@ -407,23 +516,21 @@ def creator_chapters(novel_id):
 @app.route('/creator/novels/<novel_id>/chapters/add', methods=['GET', 'POST'])
 @role_required('creator')
 def creator_add_chapter(novel_id):
-    novel = novel_model.find_by_id(novel_id)
+    novel = get_novel_loader().load(novel_id)
     
     if not novel or str(novel['authorId']) != session['user_id']:
         flash('无权限操作此小说', 'danger')
         return redirect(url_for('creator_novels'))
     
     if request.method == 'POST':
-        chapter_count = len(novel.get('chapters', []))
         chapter_data = {
-            'chapterId': f"CH{chapter_count+1:03d}",
             'title': request.form.get('title'),
             'content': request.form.get('content'),
             'isFree': request.form.get('isFree') == 'on',
             'createTime': datetime.utcnow()
         }
         
-        novel_model.add_chapter(novel_id, chapter_data)
+        chapter_model.add_chapter(novel_id, chapter_data)
         flash('章节添加成功', 'success')
         return redirect(url_for('creator_chapters', novel_id=novel_id))
     
@@ -434,13 +541,13 @@ def creator_add_chapter(novel_id):
 @app.route('/creator/novels/<novel_id>/chapters/<chapter_id>/edit', methods=['GET', 'POST'])
 @role_required('creator')
 def creator_edit_chapter(novel_id, chapter_id):
-    novel = novel_model.find_by_id(novel_id)
+    novel = get_novel_loader().load(novel_id)
     
     if not novel or str(novel['authorId']) != session['user_id']:
         flash('无权限操作此小说', 'danger')
         return redirect(url_for('creator_novels'))
     
-    chapter = next((c for c in novel.get('chapters', []) if c['chapterId'] == chapter_id), None)
+    chapter = chapter_model.find_chapter(novel_id, chapter_id)
     
     if not chapter:
         flash('章节不存在', 'danger')
@@ -451,7 +558,7 @@ def creator_edit_chapter(novel_id, chapter_id):
         chapter['content'] = request.form.get('content')
         chapter['isFree'] = request.form.get('isFree') == 'on'
         
-        novel_model.update_chapter(novel_id, chapter_id, chapter)
+        chapter_model.update_chapter(novel_id, chapter_id, chapter)
         flash('章节已更新', 'success')
         return redirect(url_for('creator_chapters', novel_id=novel_id))
     
@@ -462,13 +569,13 @@ def creator_edit_chapter(novel_id, chapter_id):
 @app.route('/creator/novels/<novel_id>/chapters/<chapter_id>/delete', methods=['POST'])
 @role_required('creator')
 def creator_delete_chapter(novel_id, chapter_id):
-    novel = novel_model.find_by_id(novel_id)
+    novel = get_novel_loader().load(novel_id)
     
     if not novel or str(novel['authorId']) != session['user_id']:
         flash('无权限操作此小说', 'danger')
         return redirect(url_for('creator_novels'))
     
-    novel_model.delete_chapter(novel_id, chapter_id)
+    chapter_model.delete_chapter(novel_id, chapter_id)
     flash('章节已删除', 'success')
     return redirect(url_for('creator_chapters', novel_id=novel_id))
 
@@ -477,13 +584,13 @@ def creator_delete_chapter(novel_id, chapter_id):
 @app.route('/creator/novels/<novel_id>/submit', methods=['POST'])
 @role_required('creator')
 def creator_submit_novel(novel_id):
-    novel = novel_model.find_by_id(novel_id)
+    novel = get_novel_loader().load(novel_id)
     
     if not novel or str(novel['authorId']) != session['user_id']:
         flash('无权限操作此小说', 'danger')
         return redirect(url_for('creator_novels'))
     
-    if len(novel.get('chapters', [])) == 0:
+    if novel.get('chapterCount', 0) == 0:
         flash('请至少添加一个章节后再提交审核', 'warning')
         return redirect(url_for('creator_chapters', novel_id=novel_id))
     
@@ -498,19 +605,29 @@ def creator_submit_novel(novel_id):
 @app.route('/reader/dashboard')
 @role_required('reader')
 def reader_dashboard():
-    # 获取已购小说
-    orders = order_model.find_user_orders(session['user_id'])
-    purchased_novel_ids = [str(o['novelId']) for o in orders if o['status'] == 'paid']
+    reader_id = session['user_id']
+    per_page = app.config['ORDERS_PER_PAGE']
     
-    purchased_novels = []
-    for novel_id in purchased_novel_ids:
-        novel = novel_model.find_by_id(novel_id)
-        if novel:
-            purchased_novels.append(novel)
+    # 已购小说和阅读历史各自按游标分页
+    orders, next_cursor, prev_cursor = order_model.find_user_orders_page(
+        reader_id, cursor=request.args.get('cursor'), limit=per_page, status='paid')
+    history, history_next, history_prev = reading_record_model.get_reading_history_page(
+        reader_id, cursor=request.args.get('history_cursor'), limit=per_page)
+    
+    # 两部分的小说一次批量加载
+    novels = get_novel_loader().load_many([o['novelId'] for o in orders] + [r['novelId'] for r in history])
+    purchased_novels = [n for n in novels[:len(orders)] if n]
+    for record, novel in zip(history, novels[len(orders):]):
+        record['novel_info'] = novel
     
     return render_template('reader/dashboard.html', 
                          purchased_novels=purchased_novels,
-                         total_purchased=len(purchased_novels))
+                         total_purchased=order_model.count_user_orders(reader_id)['paid'],
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor,
+                         history=[r for r in history if r['novel_info']],
+                         history_next=history_next,
+                         history_prev=history_prev)
 
 
 # 小说广场（包含搜索功能）
@@ -518,77 +635,47 @@ def reader_dashboard():
 @role_required('reader')
 def reader_novels():
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     category = request.args.get('category', '')
     keyword = request.args.get('keyword', '').strip()
     
-    query = {"status": "online"}
-    
-    # 分类筛选
-    if category:
-        query['category'] = category
+    per_page = app.config['NOVELS_PER_PAGE']
+    next_cursor = prev_cursor = None
     
-    # 搜索功能 - 使用MongoDB正则匹配
     if keyword:
-        # 使用$or操作符，支持按书名或标签搜索
-        # 使用$regex进行不区分大小写的模糊匹配
-        query['$or'] = [
-            {"title": {"$regex": keyword, "$options": "i"}},  # 按书名搜索
-            {"tags": {"$regex": keyword, "$options": "i"}},   # 按标签搜索
-        ]
-    
-    skip = (page - 1) * app.config['NOVELS_PER_PAGE']
-    novels = novel_model.find_novels(query, skip=skip, limit=app.config['NOVELS_PER_PAGE'])
-    
-    # 获取作者信息，并支持按作者名搜索
-    matched_novels = []
-    for novel in novels:
-        author = user_model.find_by_id(str(novel['authorId']))
-        novel['author_name'] = author['username'] if author else '未知'
-        matched_novels.append(novel)
-    
-    # 如果有关键词，需要额外处理作者名搜索
-    if keyword:
-        # 先搜索匹配关键词的作者
-        author_query = {"username": {"$regex": keyword, "$options": "i"}, "role": "creator"}
-        matching_authors = list(user_model.collection.find(author_query))
-        
-        if matching_authors:
-            author_ids = [author['_id'] for author in matching_authors]
-            # 搜索这些作者的小说
-            author_novel_query = {
-                "status": "online",
-                "authorId": {"$in": author_ids}
-            }
-            if category:
-                author_novel_query['category'] = category
-            
-            author_novels = novel_model.find_novels(author_novel_query, skip=0, limit=100)
-            
-            # 合并结果并去重
-            novel_ids = {str(n['_id']) for n in matched_novels}
-            for novel in author_novels:
-                if str(novel['_id']) not in novel_ids:
-                    author = user_model.find_by_id(str(novel['authorId']))
-                    novel['author_name'] = author['username'] if author else '未知'
-                    matched_novels.append(novel)
-        
-        # 重新分页
-        total = len(matched_novels)
-        start = (page - 1) * app.config['NOVELS_PER_PAGE']
-        end = start + app.config['NOVELS_PER_PAGE']
-        novels = matched_novels[start:end]
+        # 搜索功能 - 倒排索引检索书名、作者、标签、分类和简介，按相关度排序（结果按页码分页）
+        skip = (page - 1) * per_page
+        try:
+            novel_ids, total = novel_model.search_index.search(keyword, category=category, skip=skip, limit=per_page)
+        except ExecutionTimeout:
+            flash('搜索超时，请使用更具体的关键词', 'warning')
+            novel_ids, total = [], 0
+        novels = [n for n in get_novel_loader().load_many(novel_ids) if n]
+        # 命中总数是精确值，但只有排在前面的候选参与排序，页码只翻到这里
+        paged = min(total, novel_model.search_index.max_postings)
     else:
-        novels = matched_novels
-        total = novel_model.count_novels(query)
+        query = {"status": "online"}
+        # 分类筛选
+        if category:
+            query['category'] = category
+        # 浏览按游标分页，总数取缓存值
+        novels, next_cursor, prev_cursor = novel_model.find_novels_page(query, cursor=cursor, limit=per_page)
+        total = paged = novel_model.count_novels_cached(query)
+    
+    # 获取作者信息
+    attach_author_names(novels)
     
-    total_pages = (total + app.config['NOVELS_PER_PAGE'] - 1) // app.config['NOVELS_PER_PAGE']
+    total_pages = (paged + per_page - 1) // per_page
     
     categories = ['玄幻', '言情', '武侠', '科幻', '悬疑', '历史', '校园', '其他']
     
     return render_template('reader/novels.html', 
                          novels=novels,
                          page=page,
+                         total=total,
                          total_pages=total_pages,
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor,
                          categories=categories,
                          current_category=category,
                          keyword=keyword)
@@ -598,39 +685,80 @@ def reader_novels():
 @app.route('/reader/novels/<novel_id>')
 @role_required('reader')
 def reader_novel_detail(novel_id):
-    novel = novel_model.find_by_id(novel_id)
+    # 先只查询版本号，页面未变化时直接返回304
+    novel = novel_model.find_by_id(novel_id, view='version')
     
     if not novel or novel['status'] != 'online':
         flash('小说不存在或未上线', 'warning')
         return redirect(url_for('reader_novels'))
     
-    # 获取作者信息
-    author = user_model.find_by_id(str(novel['authorId']))
-    novel['author_name'] = author['username'] if author else '未知'
+    cursor = request.args.get('cursor')
+    similar_time = novel_model.content_index.updated_at(novel_id)
+    etag = page_etag(session, 'detail', novel_id, novel.get('version'), novel.get('commentVersion'), similar_time, cursor)
+    if is_fresh(request, session, etag):
+        return not_modified(app.response_class, etag,
+                            last_modified(novel.get('updateTime'), novel.get('commentTime'), similar_time))
     
-    # 检查是否已购买
-    purchased = order_model.check_purchased(session['user_id'], novel_id)
+    novel = novel_model.find_by_id(novel_id, view='detail')
     
-    # 获取阅读进度
-    progress = reading_record_model.get_progress(session['user_id'], novel_id)
+    # 获取作者信息
+    attach_author_names([novel])
+    
+    # 评论按游标分页
+    comments, next_cursor, prev_cursor = comment_model.find_comments(
+        novel_id, cursor=cursor, limit=app.config['COMMENTS_PER_PAGE'],
+        reply_limit=app.config['COMMENT_REPLY_PREVIEW'])
+    
+    # 内容相似的作品
+    similar_ids = novel_model.content_index.similar(novel_id, limit=12)
+    similar_novels = [n for n in get_novel_loader().load_many(similar_ids) if n and n['status'] == 'online'][:6]
+    attach_author_names(similar_novels)
+    
+    # 购买状态、阅读量和销量由页面单独请求，页面只随小说版本变化
+    response = make_response(render_template('reader/novel_detail.html',
+                                             novel=novel,
+                                             comments=comments,
+                                             cursor=cursor,
+                                             next_cursor=next_cursor,
+                                             prev_cursor=prev_cursor,
+                                             similar_novels=similar_novels))
+    etag = page_etag(session, 'detail', novel_id, novel.get('version'), novel.get('commentVersion'), similar_time, cursor)
+    return cache_privately(response, etag,
+                           last_modified(novel.get('updateTime'), novel.get('commentTime'), similar_time))
+
+
+# 小说详情页中与读者相关、变化频繁的部分
+@app.route('/reader/novels/<novel_id>/state')
+@role_required('reader')
+def reader_novel_state(novel_id):
+    novel = get_novel_loader().load(novel_id)
+    if not novel or novel['status'] != 'online':
+        return jsonify({"success": False, "message": "小说不存在或未上线"}), 404
     
-    return render_template('reader/novel_detail.html', 
-                         novel=novel,
-                         purchased=purchased,
-                         progress=progress)
+    progress = activity_buffer.get_progress(session['user_id'], novel_id)
+    response = jsonify({
+        "success": True,
+        "purchased": order_model.check_purchased(session['user_id'], novel_id),
+        "progress": progress['currentChapterId'] if progress else None,
+        "readCount": novel.get('readCount', 0),
+        "saleCount": novel.get('saleCount', 0)
+    })
+    response.cache_control.no_store = True
+    return response
 
 
 # 阅读章节
 @app.route('/reader/novels/<novel_id>/read/<chapter_id>')
 @role_required('reader')
 def reader_read_chapter(novel_id, chapter_id):
-    novel = novel_model.find_by_id(novel_id)
+    novel = get_novel_loader().load(novel_id)
     
     if not novel or novel['status'] != 'online':
         flash('小说不存在或未上线', 'warning')
         return redirect(url_for('reader_novels'))
     
-    chapter = next((c for c in novel.get('chapters', []) if c['chapterId'] == chapter_id), None)
+    # 先只查询章节的版本字段，页面未变化时不读取正文
+    chapter = chapter_model.find_chapter_version(novel_id, chapter_id)
     
     if not chapter:
         flash('章节不存在', 'warning')
@@ -643,33 +771,65 @@ def reader_read_chapter(novel_id, chapter_id):
             flash('请先购买小说', 'warning')
             return redirect(url_for('reader_novel_detail', novel_id=novel_id))
     
-    # 保存阅读进度
-    reading_record_model.save_progress(session['user_id'], novel_id, chapter_id)
+    # 保存阅读进度（写缓冲批量落库）
+    activity_buffer.record_progress(session['user_id'], novel_id, chapter_id)
+    
+    # 增加阅读量（写缓冲批量落库）
+    activity_buffer.record_read(novel_id)
     
-    # 增加阅读量
-    novel_model.increment_read_count(novel_id)
+    # 小说（标题、目录，评论不计）和章节都未变化时直接返回304，不读取正文
+    etag = page_etag(session, 'chapter', novel_id, chapter_id, novel.get('version'), chapter.get('version'),
+                     chapter.get('contentFormat') == 'blob')
+    modified = last_modified(novel.get('updateTime'), chapter.get('updateTime') or chapter.get('createTime'))
+    if is_fresh(request, session, etag):
+        return not_modified(app.response_class, etag, modified)
+    
+    # 读取正文；期间章节若被修改，页面带着旧的ETag，下次请求会重新渲染
+    chapter = chapter_model.find_chapter(novel_id, chapter_id)
+    if not chapter:
+        flash('章节不存在', 'warning')
+        return redirect(url_for('reader_novel_detail', novel_id=novel_id))
     
     # 获取作者信息
-    author = user_model.find_by_id(str(novel['authorId']))
-    novel['author_name'] = author['username'] if author else '未知'
+    attach_author_names([novel])
+    
+    # 获取相邻章节
+    prev_chapter, next_chapter = chapter_model.find_neighbours(novel_id, chapter['order'])
+    
+    response = make_response(render_template('reader/read_chapter.html',
+                                             novel=novel,
+                                             chapter=chapter,
+                                             prev_chapter=prev_chapter,
+                                             next_chapter=next_chapter))
+    return cache_privately(response, etag, modified)
+
+
+# 章节正文（文件存储的章节由阅读页单独加载）
+@app.route('/reader/novels/<novel_id>/read/<chapter_id>/text')
+@role_required('reader')
+def reader_chapter_text(novel_id, chapter_id):
+    novel = get_novel_loader().load(novel_id)
+    chapter = chapter_model.find_chapter(novel_id, chapter_id)
+    if not novel or novel['status'] != 'online' or not chapter:
+        abort(404)
     
-    # 获取章节索引
-    chapter_index = next(i for i, c in enumerate(novel['chapters']) if c['chapterId'] == chapter_id)
-    prev_chapter = novel['chapters'][chapter_index - 1] if chapter_index > 0 else None
-    next_chapter = novel['chapters'][chapter_index + 1] if chapter_index < len(novel['chapters']) - 1 else None
+    if not chapter.get('isFree', False) and not order_model.check_purchased(session['user_id'], novel_id):
+        abort(403)
     
-    return render_template('reader/read_chapter.html',
-                         novel=novel,
-                         chapter=chapter,
-                         prev_chapter=prev_chapter,
-                         next_chapter=next_chapter)
+    if chapter.get('contentFormat') != 'blob':
+        return app.response_class(str(chapter['content']), mimetype='text/plain')
+    
+    # 文件交给WSGI服务器发送（gunicorn 使用 sendfile），文件名即内容摘要，用作ETag
+    response = send_file(chapter['content'].path, mimetype='text/plain', etag=chapter['blobKey'], max_age=0)
+    response.cache_control.private = True
+    return response
 
 
 # 购买小说
 @app.route('/reader/novels/<novel_id>/purchase', methods=['POST'])
 @role_required('reader')
 def reader_purchase_novel(novel_id):
-    novel = novel_model.find_by_id(novel_id)
+    novel = get_novel_loader().load(novel_id)
     
     if not novel or novel['status'] != 'online':
         return jsonify({"success": False, "message": "小说不存在或未上线"})
@@ -678,33 +838,36 @@ def reader_purchase_novel(novel_id):
     if order_model.check_purchased(session['user_id'], novel_id):
         return jsonify({"success": False, "message": "您已购买过此小说"})
     
-    # 创建订单
-    order_id = order_model.create_order(session['user_id'], novel_id, novel['price'])
-    
-    # 模拟支付
-    order_model.pay_order(order_id)
-    
-    # 增加销量
-    novel_model.collection.update_one(
-        {"_id": ObjectId(novel_id)},
-        {"$inc": {"saleCount": 1}}
-    )
+    complete_purchase(session['user_id'], novel_id, novel['price'])
     
     return jsonify({"success": True, "message": "购买成功"})
 
 
+def complete_purchase(reader_id, novel_id, price):
+    """创建订单、模拟支付并增加销量（ASGI应用在线程中调用）"""
+    order_id = order_model.create_order(reader_id, novel_id, price)
+    order_model.pay_order(order_id)
+    novel_model.record_sale(novel_id)
+
+
 # 我的订单
 @app.route('/reader/orders')
 @role_required('reader')
 def reader_orders():
-    orders = order_model.find_user_orders(session['user_id'])
+    orders, next_cursor, prev_cursor = order_model.find_user_orders_page(
+        session['user_id'], cursor=request.args.get('cursor'), limit=app.config['ORDERS_PER_PAGE'])
     
     # 获取小说信息
-    for order in orders:
-        novel = novel_model.find_by_id(str(order['novelId']))
-        order['novel'] = novel
+    novels = get_novel_loader().load_many([order['novelId'] for order in orders])
+    attach_author_names([n for n in novels if n])
+    for order, novel in zip(orders, novels):
+        order['novel_info'] = novel
     
-    return render_template('reader/orders.html', orders=orders)
+    return render_template('reader/orders.html',
+                         orders=orders,
+                         order_counts=order_model.count_user_orders(session['user_id']),
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor)
 
 
 # 添加评论
@@ -717,68 +880,66 @@ def add_comment(novel_id):
         return jsonify({"success": False, "message": "评论内容不能为空"})
     
     # 添加评论
-    novel_model.add_comment(novel_id, session['user_id'], content.strip())
+    comment_model.add_comment(novel_id, session['user_id'], session.get('username'), content.strip())
     
     return jsonify({"success": True, "message": "评论成功"})
 
 
 # 回复评论
-@app.route('/reader/novels/<novel_id>/comment/<int:comment_index>/reply', methods=['POST'])
+@app.route('/reader/novels/<novel_id>/comment/<comment_id>/reply', methods=['POST'])
 @login_required
-def reply_comment(novel_id, comment_index):
+def reply_comment(novel_id, comment_id):
     content = request.form.get('content')
     
     if not content or not content.strip():
         return jsonify({"success": False, "message": "回复内容不能为空"})
     
-    novel = novel_model.find_by_id(novel_id)
-    if not novel or comment_index >= len(novel.get('comments', [])):
+    comment = comment_model.find_comment(novel_id, comment_id)
+    if not comment or comment.get('parentId'):
         return jsonify({"success": False, "message": "评论不存在"})
     
-    # 获取用户信息
-    user = user_model.find_by_id(session['user_id'])
-    
-    # 构建回复数据
-    reply_data = {
-        "userId": ObjectId(session['user_id']),
-        "username": user['username'],
-        "content": content.strip(),
-        "createTime": datetime.utcnow()
-    }
-    
     # 添加回复到指定评论
-    novel_model.collection.update_one(
-        {"_id": ObjectId(novel_id)},
-        {"$push": {f"comments.{comment_index}.replies": reply_data}}
-    )
+    comment_model.add_comment(novel_id, session['user_id'], session.get('username'),
+                              content.strip(), parent_id=comment_id)
     
     return jsonify({"success": True, "message": "回复成功"})
 
 
-# 删除评论
-@app.route('/reader/novels/<novel_id>/comment/<int:comment_index>/delete', methods=['POST'])
+# 评论的更早回复（游标分页）
+@app.route('/reader/novels/<novel_id>/comment/<comment_id>/replies')
 @login_required
-def delete_comment(novel_id, comment_index):
-    novel = novel_model.find_by_id(novel_id)
-    if not novel:
-        return jsonify({"success": False, "message": "小说不存在"})
-    
-    comments = novel.get('comments', [])
-    if comment_index >= len(comments):
+def comment_replies(novel_id, comment_id):
+    comment = comment_model.find_comment(novel_id, comment_id)
+    if not comment or comment.get('parentId'):
         return jsonify({"success": False, "message": "评论不存在"})
     
-    comment = comments[comment_index]
+    replies, next_cursor = comment_model.find_replies(comment_id, cursor=request.args.get('cursor'),
+                                                      limit=app.config['REPLIES_PER_PAGE'])
+    return jsonify({
+        "success": True,
+        "replies": [{
+            "username": reply.get('username') or '匿名用户',
+            "content": reply['content'],
+            "createTime": reply['createTime'].strftime('%Y-%m-%d %H:%M') if reply.get('createTime') else '-'
+        } for reply in replies],
+        "nextCursor": next_cursor
+    })
+
+
+# 删除评论
+@app.route('/reader/novels/<novel_id>/comment/<comment_id>/delete', methods=['POST'])
+@login_required
+def delete_comment(novel_id, comment_id):
+    comment = comment_model.find_comment(novel_id, comment_id)
+    if not comment:
+        return jsonify({"success": False, "message": "评论不存在"})
     
     # 只能删除自己的评论
     if str(comment['userId']) != session['user_id']:
         return jsonify({"success": False, "message": "无权删除此评论"})
     
     # 删除评论
-    comments.pop(comment_index)
-    novel_model.collection.update_one(
-        {"_id": ObjectId(novel_id)},
-        {"$set": {"comments": comments}}
-    )
+    comment_model.delete_comment(comment)
     
     return jsonify({"success": True, "message": "评论已删除"})
 
@@ -787,84 +948,46 @@ def delete_comment(novel_id, comment_index):
 @app.route('/admin/statistics')
 @role_required('admin')
 def admin_statistics():
-    """管理员数据统计页面"""
-    # 1. 小说分类统计
-    category_stats = list(novel_model.collection.aggregate([
-        {"$match": {"status": "online"}},
-        {"$group": {
-            "_id": "$category",
-            "count": {"$sum": 1},
-            "totalRead": {"$sum": "$readCount"},
-            "totalSales": {"$sum": "$saleCount"}
-        }},
-        {"$sort": {"count": -1}}
-    ]))
-    
-    # 2. 热门小说Top10（按阅读量）
-    top_novels_read = list(novel_model.collection.find(
-        {"status": "online"}
-    ).sort("readCount", -1).limit(10))
-    
-    # 获取作者信息
-    for novel in top_novels_read:
-        author = user_model.find_by_id(str(novel['authorId']))
-        novel['author_name'] = author['username'] if author else '未知'
-    
-    # 3. 热门小说Top10（按销量）
-    top_novels_sales = list(novel_model.collection.find(
-        {"status": "online"}
-    ).sort("saleCount", -1).limit(10))
-    
-    for novel in top_novels_sales:
-        author = user_model.find_by_id(str(novel['authorId']))
-        novel['author_name'] = author['username'] if author else '未知'
-    
-    # 4. 创作者统计（发布量Top10）
-    creator_stats = list(novel_model.collection.aggregate([
-        {"$match": {"status": "online"}},
-        {"$group": {
-            "_id": "$authorId",
-            "novelCount": {"$sum": 1},
-            "totalRead": {"$sum": "$readCount"},
-            "totalSales": {"$sum": "$saleCount"},
-            "totalRevenue": {"$sum": {"$multiply": ["$saleCount", "$price"]}}
-        }},
-        {"$sort": {"novelCount": -1}},
-        {"$limit": 10}
-    ]))
-    
-    # 获取创作者名称
-    for stat in creator_stats:
-        author = user_model.find_by_id(str(stat['_id']))
+    """管理员数据统计页面：读取物化统计（stats集合），不扫描源数据"""
+    snapshot = novel_model.stats.snapshot()
+    trend = novel_model.rollups.recent_series("site", "all", app.config['TREND_DAYS'])
+    totals = snapshot['totals']
+    
+    # 获取创作者名称（一次批量查询）
+    creator_stats = snapshot['creators']
+    for stat, author in zip(creator_stats, get_user_loader().load_many([s['_id'] for s in creator_stats])):
         stat['author_name'] = author['username'] if author else '未知'
     
-    # 5. 用户角色统计
-    user_role_stats = list(user_model.collection.aggregate([
-        {"$match": {"status": 1}},
-        {"$group": {
-            "_id": "$role",
-            "count": {"$sum": 1}
-        }}
-    ]))
-    
-    # 6. 总体统计
     total_stats = {
-        "total_users": user_model.collection.count_documents({"status": 1}),
-        "total_novels": novel_model.collection.count_documents({"status": "online"}),
-        "total_chapters": sum([len(n.get('chapters', [])) for n in novel_model.collection.find({"status": "online"})]),
-        "total_orders": order_model.collection.count_documents({}),
-        "total_revenue": sum([o['amount'] for o in order_model.collection.find({"status": "paid"})])
+        "total_users": totals.get('users', 0),
+        "total_novels": totals.get('novels', 0),
+        "total_chapters": totals.get('chapters', 0),
+        "total_reads": totals.get('totalRead', 0),
+        "total_orders": totals.get('orders', 0),
+        "total_revenue": totals.get('revenue', 0),
+        "update_time": totals.get('updateTime'),
+        "reconciled_at": totals.get('reconciledAt')
     }
     
     return render_template('admin/statistics.html',
-                         category_stats=category_stats,
-                         top_novels_read=top_novels_read,
-                         top_novels_sales=top_novels_sales,
+                         category_stats=snapshot['categories'],
+                         top_novels_read=snapshot['top_read'],
+                         top_novels_sales=snapshot['top_sales'],
                          creator_stats=creator_stats,
-                         user_role_stats=user_role_stats,
+                         user_role_stats=snapshot['roles'],
+                         trend=trend,
                          total_stats=total_stats)
 
 
+# 校准统计数据
+@app.route('/admin/statistics/reconcile', methods=['POST'])
+@role_required('admin')
+def admin_reconcile_statistics():
+    novel_model.stats.reconcile()
+    flash('统计数据已校准', 'success')
+    return redirect(url_for('admin_statistics'))
+
+
 # 推荐系统
 @app.route('/reader/recommendations')
 @role_required('reader')
@@ -872,22 +995,19 @@ def reader_recommendations():
     """智能推荐页面"""
     reader_id = session['user_id']
     
-    # 1. 获取用户购买历史
-    purchased_novels = []
-    orders = order_model.find_user_orders(reader_id)
-    for order in orders:
-        if order['status'] == 'paid':
-            novel = novel_model.find_by_id(str(order['novelId']))
-            if novel:
-                purchased_novels.append(novel)
-    
-    # 2. 获取用户阅读历史
-    reading_history = reading_record_model.get_user_reading_history(reader_id, limit=10)
-    read_novels = []
-    for record in reading_history:
-        novel = novel_model.find_by_id(str(record['novelId']))
-        if novel:
-            read_novels.append(novel)
+    # 1. 获取用户最近的购买记录（只取最近的，历史再长查询量也不变）
+    history_size = app.config['RECOMMEND_HISTORY_SIZE']
+    orders, _, _ = order_model.find_user_orders_page(reader_id, limit=history_size, status='paid')
+    paid_novel_ids = [order['novelId'] for order in orders]
+    
+    # 2. 获取用户最近的阅读历史
+    reading_history, _, _ = reading_record_model.get_reading_history_page(reader_id, limit=history_size)
+    read_novel_ids = [record['novelId'] for record in reading_history]
+    
+    # 购买与阅读过的小说一次批量加载
+    novels = get_novel_loader().load_many(paid_novel_ids + read_novel_ids)
+    purchased_novels = [n for n in novels[:len(paid_novel_ids)] if n]
+    read_novels = [n for n in novels[len(paid_novel_ids):] if n]
     
     # 3. 提取用户兴趣标签和分类
     interested_tags = set()
@@ -900,9 +1020,28 @@ def reader_recommendations():
             for tag in novel['tags']:
                 interested_tags.add(tag)
     
-    # 4. 基于内容的推荐（相似标签和分类）
-    content_based_recommendations = []
-    if interested_tags or interested_categories:
+    # 4. 协同过滤推荐：合并历史小说的相似小说列表（离线计算，见recommend.py）
+    history = {}
+    for novel_id in paid_novel_ids:
+        history[novel_id] = history.get(novel_id, 0) + PURCHASE_WEIGHT
+    for novel_id in read_novel_ids:
+        history[novel_id] = history.get(novel_id, 0) + READ_WEIGHT
+    # 多取一些候选，过滤掉已下线的小说
+    cf_ids = item_cf.recommend(history, limit=12)
+    
+    # 5. 内容相似推荐：合并历史小说的内容相似列表，新书没有行为数据也能被推荐
+    content_ids = [i for i in novel_model.content_index.recommend(history, limit=24) if i not in set(cf_ids)]
+    
+    candidates = get_novel_loader().load_many(cf_ids + content_ids)
+    content_based_recommendations = [n for n in candidates[:len(cf_ids)] if n and n['status'] == 'online'][:6]
+    similar_recommendations = [n for n in candidates[len(cf_ids):] if n and n['status'] == 'online']
+    # 协同过滤结果不足时用内容相似结果补足
+    fill = 6 - len(content_based_recommendations)
+    content_based_recommendations += similar_recommendations[:fill]
+    similar_recommendations = similar_recommendations[fill:][:6]
+    
+    # 都没有相似列表时（相似列表尚未计算）按兴趣标签和分类推荐
+    if not content_based_recommendations and (interested_tags or interested_categories):
         query = {"status": "online"}
         or_conditions = []
         
@@ -919,27 +1058,21 @@ def reader_recommendations():
         if excluded_ids:
             query["_id"] = {"$nin": excluded_ids}
         
-        content_based_recommendations = list(
-            novel_model.collection.find(query).sort("readCount", DESCENDING).limit(6)
-        )
+        content_based_recommendations = novel_model.find_novels(query, limit=6, sort_by="readCount")
     
-    # 5. 热门推荐（阅读量Top6）- 作为补充
-    hot_recommendations = list(
-        novel_model.collection.find({"status": "online"}).sort("readCount", DESCENDING).limit(6)
-    )
+    # 6. 热门推荐（阅读量Top6）- 作为补充
+    hot_recommendations = novel_model.find_novels({"status": "online"}, limit=6, sort_by="readCount")
     
-    # 6. 新书推荐（最新上线的6本）
-    new_recommendations = list(
-        novel_model.collection.find({"status": "online"}).sort("createTime", DESCENDING).limit(6)
-    )
+    # 7. 新书推荐（最新上线的6本）
+    new_recommendations = novel_model.find_novels({"status": "online"}, limit=6, sort_by="createTime")
     
     # 为所有推荐添加作者信息
-    for novel in content_based_recommendations + hot_recommendations + new_recommendations:
-        author = user_model.find_by_id(str(novel['authorId']))
-        novel['author_name'] = author['username'] if author else '未知'
+    attach_author_names(content_based_recommendations + similar_recommendations +
+                        hot_recommendations + new_recommendations)
     
     return render_template('reader/recommendations.html',
                          content_based=content_based_recommendations,
+                         similar_recommendations=similar_recommendations,
                          hot_recommendations=hot_recommendations,
                          new_recommendations=new_recommendations,
                          interested_tags=list(interested_tags),
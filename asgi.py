@@ -0,0 +1,258 @@
+"""
+ASGI 入口：hypercorn asgi:application --workers 4 --bind 0.0.0.0:5000
+阅读热点路由（小说详情及其购买状态、阅读章节、购买）由 Quart 应用处理：用 async_models 中的异步模型，
+把一个请求内互不依赖的查询用 asyncio.gather 并发执行，等待数据库时事件循环继续处理其他读者的请求。
+其余路由和静态文件转交 app.py 中的 Flask 应用（在线程池中运行）。
+两个应用共用模板、配置和 SECRET_KEY，登录 Session 和闪现消息可以互通。
+"""
+
+from quart import Quart, render_template, request, redirect, url_for, session, flash, jsonify, g, make_response
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.exceptions import HTTPException
+from functools import wraps
+from config import Config
+from http_cache import page_etag, last_modified, is_fresh, cache_privately, not_modified
+from async_models import (AsyncDatabase, AsyncBatchLoader, AsyncUserModel, AsyncNovelModel, AsyncChapterModel,
+                          AsyncCommentModel, AsyncOrderModel, AsyncReadingRecordModel)
+import app as wsgi
+import asyncio
+
+app = Quart(__name__)
+app.config.from_object(Config)
+
+adb = AsyncDatabase(app.config['MONGODB_URI'], app.config['MONGODB_DB'])
+user_model = AsyncUserModel(adb, wsgi.user_model.principal_cache)
+novel_model = AsyncNovelModel(adb)
+chapter_model = AsyncChapterModel(adb, wsgi.chapter_model.codec)
+comment_model = AsyncCommentModel(adb)
+order_model = AsyncOrderModel(adb)
+reading_record_model = AsyncReadingRecordModel(adb)
+activity_buffer = wsgi.activity_buffer
+
+# 由异步视图处理的端点
+ASYNC_ENDPOINTS = {'reader_novel_detail', 'reader_novel_state', 'reader_read_chapter', 'reader_purchase_novel'}
+
+
+def get_user_loader():
+    """获取当前请求的用户加载器"""
+    if 'user_loader' not in g:
+        g.user_loader = AsyncBatchLoader(user_model.find_by_ids)
+    return g.user_loader
+
+
+async def attach_author_names(novels):
+    """批量为小说填充作者名"""
+    authors = await get_user_loader().load_many([novel['authorId'] for novel in novels])
+    for novel, author in zip(novels, authors):
+        novel['author_name'] = author['username'] if author else '未知'
+    return novels
+
+
+async def get_progress(reader_id, novel_id):
+    """获取阅读进度，优先返回写缓冲中尚未落库的进度"""
+    pending = activity_buffer.pending_progress(reader_id, novel_id)
+    if pending is not None:
+        return pending
+    return await reading_record_model.get_progress(reader_id, novel_id)
+
+
+async def record_reading(reader_id, novel_id, chapter_id):
+    """记录阅读进度和阅读量；写缓冲关闭时为同步写库，放到线程中执行"""
+    def record():
+        activity_buffer.record_progress(reader_id, novel_id, chapter_id)
+        activity_buffer.record_read(novel_id)
+
+    if activity_buffer.enabled:
+        record()
+    else:
+        await asyncio.to_thread(record)
+
+
+# 装饰器：要求特定角色
+def role_required(role):
+    def decorator(f):
+        @wraps(f)
+        async def decorated_function(*args, **kwargs):
+            if 'user_id' not in session:
+                await flash('请先登录', 'warning')
+                return redirect(url_for('login'))
+
+            user = await user_model.find_principal(session['user_id'])
+            if not user or user['role'] != role:
+                await flash('无权限访问此页面', 'danger')
+                return redirect(url_for('index'))
+            get_user_loader().prime(user)
+            return await f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+# 小说详情
+@app.route('/reader/novels/<novel_id>')
+@role_required('reader')
+async def reader_novel_detail(novel_id):
+    # 先只查询版本号，页面未变化时直接返回304
+    cursor = request.args.get('cursor')
+    novel, similar_time = await asyncio.gather(
+        novel_model.find_by_id(novel_id, view='version'),
+        novel_model.similar_updated_at(novel_id)
+    )
+
+    if not novel or novel['status'] != 'online':
+        await flash('小说不存在或未上线', 'warning')
+        return redirect(url_for('reader_novels'))
+
+    etag = page_etag(session, 'detail', novel_id, novel.get('version'), novel.get('commentVersion'), similar_time, cursor)
+    if is_fresh(request, session, etag):
+        return not_modified(app.response_class, etag,
+                            last_modified(novel.get('updateTime'), novel.get('commentTime'), similar_time))
+
+    novel, (comments, next_cursor, prev_cursor), similar_ids = await asyncio.gather(
+        novel_model.find_by_id(novel_id, view='detail'),
+        comment_model.find_comments(novel_id, cursor=cursor, limit=app.config['COMMENTS_PER_PAGE'],
+                                    reply_limit=app.config['COMMENT_REPLY_PREVIEW']),
+        novel_model.similar(novel_id, limit=12)
+    )
+
+    found = {n['_id']: n for n in await novel_model.find_by_ids(similar_ids)}
+    similar_novels = [found[i] for i in similar_ids if i in found and found[i]['status'] == 'online'][:6]
+    await attach_author_names([novel] + similar_novels)
+
+    # 购买状态、阅读量和销量由页面单独请求，页面只随小说版本变化
+    response = await make_response(await render_template('reader/novel_detail.html',
+                                                         novel=novel,
+                                                         comments=comments,
+                                                         cursor=cursor,
+                                                         next_cursor=next_cursor,
+                                                         prev_cursor=prev_cursor,
+                                                         similar_novels=similar_novels))
+    etag = page_etag(session, 'detail', novel_id, novel.get('version'), novel.get('commentVersion'), similar_time, cursor)
+    return cache_privately(response, etag,
+                           last_modified(novel.get('updateTime'), novel.get('commentTime'), similar_time))
+
+
+# 小说详情页中与读者相关、变化频繁的部分
+@app.route('/reader/novels/<novel_id>/state')
+@role_required('reader')
+async def reader_novel_state(novel_id):
+    reader_id = session['user_id']
+    novel, purchased, progress = await asyncio.gather(
+        novel_model.find_by_id(novel_id, view='card'),
+        order_model.check_purchased(reader_id, novel_id),
+        get_progress(reader_id, novel_id)
+    )
+    if not novel or novel['status'] != 'online':
+        return jsonify({"success": False, "message": "小说不存在或未上线"}), 404
+
+    response = jsonify({
+        "success": True,
+        "purchased": purchased,
+        "progress": progress['currentChapterId'] if progress else None,
+        "readCount": novel.get('readCount', 0),
+        "saleCount": novel.get('saleCount', 0)
+    })
+    response.cache_control.no_store = True
+    return response
+
+
+# 阅读章节
+@app.route('/reader/novels/<novel_id>/read/<chapter_id>')
+@role_required('reader')
+async def reader_read_chapter(novel_id, chapter_id):
+    reader_id = session['user_id']
+    # 购买状态与小说、章节版本一起查询，免费章节时结果不使用；页面未变化时不读取正文
+    novel, chapter, purchased = await asyncio.gather(
+        novel_model.find_by_id(novel_id, view='card'),
+        chapter_model.find_chapter_version(novel_id, chapter_id),
+        order_model.check_purchased(reader_id, novel_id)
+    )
+
+    if not novel or novel['status'] != 'online':
+        await flash('小说不存在或未上线', 'warning')
+        return redirect(url_for('reader_novels'))
+
+    if not chapter:
+        await flash('章节不存在', 'warning')
+        return redirect(url_for('reader_novel_detail', novel_id=novel_id))
+
+    if not chapter.get('isFree', False) and not purchased:
+        await flash('请先购买小说', 'warning')
+        return redirect(url_for('reader_novel_detail', novel_id=novel_id))
+
+    await record_reading(reader_id, novel_id, chapter_id)
+
+    # 小说（标题、目录，评论不计）和章节都未变化时直接返回304，不读取正文
+    etag = page_etag(session, 'chapter', novel_id, chapter_id, novel.get('version'), chapter.get('version'),
+                     chapter.get('contentFormat') == 'blob')
+    modified = last_modified(novel.get('updateTime'), chapter.get('updateTime') or chapter.get('createTime'))
+    if is_fresh(request, session, etag):
+        return not_modified(app.response_class, etag, modified)
+
+    # 读取正文；期间章节若被修改，页面带着旧的ETag，下次请求会重新渲染
+    chapter, (prev_chapter, next_chapter), _ = await asyncio.gather(
+        chapter_model.find_chapter(novel_id, chapter_id),
+        chapter_model.find_neighbours(novel_id, chapter['order']),
+        attach_author_names([novel])
+    )
+    if not chapter:
+        await flash('章节不存在', 'warning')
+        return redirect(url_for('reader_novel_detail', novel_id=novel_id))
+
+    response = await make_response(await render_template('reader/read_chapter.html',
+                                                         novel=novel,
+                                                         chapter=chapter,
+                                                         prev_chapter=prev_chapter,
+                                                         next_chapter=next_chapter))
+    return cache_privately(response, etag, modified)
+
+
+# 购买小说
+@app.route('/reader/novels/<novel_id>/purchase', methods=['POST'])
+@role_required('reader')
+async def reader_purchase_novel(novel_id):
+    reader_id = session['user_id']
+    novel, purchased = await asyncio.gather(
+        novel_model.find_by_id(novel_id, view='card'),
+        order_model.check_purchased(reader_id, novel_id)
+    )
+
+    if not novel or novel['status'] != 'online':
+        return jsonify({"success": False, "message": "小说不存在或未上线"})
+
+    if purchased:
+        return jsonify({"success": False, "message": "您已购买过此小说"})
+
+    # 订单、支付和销量依次依赖，且要维护统计与趋势分桶，沿用同步模型在线程中执行
+    await asyncio.to_thread(wsgi.complete_purchase, reader_id, novel_id, novel['price'])
+
+    return jsonify({"success": True, "message": "购买成功"})
+
+
+@app.after_serving
+async def shutdown():
+    activity_buffer.shutdown()
+    adb.close()
+
+
+# 其余端点只注册URL规则，供模板中的 url_for 生成链接，请求由 Flask 应用处理
+for rule in wsgi.app.url_map.iter_rules():
+    if rule.endpoint not in ASYNC_ENDPOINTS and rule.endpoint != 'static':
+        app.add_url_rule(rule.rule, rule.endpoint, methods=rule.methods, defaults=rule.defaults)
+
+fallback = WsgiToAsgi(wsgi.app)
+
+
+def dispatch_to(path, method):
+    """按URL规则判断请求由哪个应用处理"""
+    try:
+        endpoint, _ = app.url_map.bind('').match(path, method=method)
+    except HTTPException:
+        return fallback
+    return app if endpoint in ASYNC_ENDPOINTS else fallback
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http':
+        await dispatch_to(scope['path'], scope['method'])(scope, receive, send)
+    else:
+        await app(scope, receive, send)
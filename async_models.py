@@ -0,0 +1,229 @@
+"""
+阅读热点路径的异步数据模型（motor）
+与 models.py 中同名模型的查询一致，供 asgi.py 在一个请求内用 asyncio.gather 并发执行互不依赖的查询，
+请求耗时取决于最慢的一次查询而不是各次查询之和。
+索引、统计、趋势分桶等写入仍由同步模型负责，这里只包含阅读路径需要的读操作。
+"""
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING
+from bson.objectid import ObjectId
+from models import BatchLoader, LazyCollection, NovelModel, ChapterModel, keyset_query, keyset_result
+import asyncio
+import os
+
+
+class AsyncDatabase:
+    """异步数据库连接管理
+
+    motor 客户端绑定创建它的事件循环，按(进程, 事件循环)在第一次访问时创建。
+    结构版本检查由同步的 Database 完成。
+    """
+
+    def __init__(self, uri, db_name):
+        if not uri or uri == "mongodb://localhost:27017/novel_platform":
+            uri = 'mongodb://localhost:27017/'
+        self.uri = uri
+        self.db_name = db_name
+        self.owner = None
+        self._client = None
+        self._db = None
+
+    @property
+    def client(self):
+        owner = (os.getpid(), asyncio.get_running_loop())
+        if self.owner != owner:
+            self._client = AsyncIOMotorClient(self.uri)
+            self._db = self._client[self.db_name]
+            self.owner = owner
+        return self._client
+
+    @property
+    def db(self):
+        self.client
+        return self._db
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+        self._client = None
+        self._db = None
+        self.owner = None
+
+    def get_collection(self, name):
+        """获取集合"""
+        return LazyCollection(self, name)
+
+
+class AsyncBatchLoader(BatchLoader):
+    """BatchLoader 的异步版本，fetch_many 为协程函数"""
+
+    async def load_many(self, ids):
+        object_ids = [ObjectId(i) for i in ids]
+        missing = list({i for i in object_ids if i not in self.cache})
+        if missing:
+            for doc in await self.fetch_many(missing):
+                self.cache[doc['_id']] = doc
+            for i in missing:
+                self.cache.setdefault(i, None)
+        return [self.cache[i] for i in object_ids]
+
+    async def load(self, id_):
+        return (await self.load_many([id_]))[0]
+
+
+async def keyset_page(collection, query, sort_key, cursor=None, limit=12, projection=None):
+    """models.keyset_page 的异步版本"""
+    query, sort, position = keyset_query(query, sort_key, cursor)
+    docs = await collection.find(query, projection).sort(sort).limit(limit + 1).to_list(None)
+    return keyset_result(docs, sort_key, limit, position)
+
+
+class AsyncUserModel:
+    """用户数据模型（异步）"""
+
+    def __init__(self, db, principal_cache):
+        self.collection = db.get_collection('users')
+        # 与同步 UserModel 共用缓存，本进程内修改用户后立即失效
+        self.principal_cache = principal_cache
+
+    async def find_principal(self, user_id):
+        """查找已登录用户（不含密码），优先读取缓存"""
+        user = self.principal_cache.get(user_id)
+        if user is None:
+            user = await self.collection.find_one({"_id": ObjectId(user_id), "status": 1}, {"password": 0})
+            if user is not None:
+                self.principal_cache.set(user_id, user)
+        return user
+
+    async def find_by_ids(self, user_ids):
+        """根据ID列表批量查找用户"""
+        return await self.collection.find(
+            {"_id": {"$in": [ObjectId(i) for i in user_ids]}, "status": 1}
+        ).to_list(None)
+
+
+class AsyncNovelModel:
+    """小说数据模型（异步）"""
+
+    def __init__(self, db):
+        self.collection = db.get_collection('novels')
+        self.content_neighbours = db.get_collection('content_neighbours')
+
+    async def find_by_id(self, novel_id, view=None):
+        """根据ID查找小说，view指定命名投影"""
+        return await self.collection.find_one({"_id": ObjectId(novel_id)}, NovelModel.PROJECTIONS.get(view))
+
+    async def find_by_ids(self, novel_ids, view="card"):
+        """根据ID列表批量查找小说"""
+        return await self.collection.find(
+            {"_id": {"$in": [ObjectId(i) for i in novel_ids]}},
+            NovelModel.PROJECTIONS[view]
+        ).to_list(None)
+
+    async def similar(self, novel_id, limit=6):
+        """内容相似的小说_id列表（同 ContentIndex.similar）"""
+        doc = await self.content_neighbours.find_one({"_id": ObjectId(novel_id)})
+        return [n['novelId'] for n in doc['neighbours'][:limit]] if doc else []
+
+    async def similar_updated_at(self, novel_id):
+        """相似列表的更新时间（同 ContentIndex.updated_at）"""
+        doc = await self.content_neighbours.find_one({"_id": ObjectId(novel_id)}, {"updateTime": 1})
+        return doc and doc.get('updateTime')
+
+
+class AsyncChapterModel:
+    """章节数据模型（异步）"""
+
+    def __init__(self, db, codec):
+        self.collection = db.get_collection('chapters')
+        self.dicts = db.get_collection('chapter_dicts')
+        # 与同步 ChapterModel 共用正文编解码器和字典缓存
+        self.codec = codec
+
+    async def find_chapter(self, novel_id, chapter_id):
+        """查找单个章节（含正文，压缩的正文在渲染时才解压）"""
+        chapter = await self.collection.find_one({
+            "novelId": ObjectId(novel_id),
+            "chapterId": chapter_id
+        })
+        if chapter is not None and self.codec.needs_dictionary(chapter):
+            self.codec.remember(await self.dicts.find_one({"_id": chapter['dictId']}))
+        return self.codec.load(chapter)
+
+    async def find_chapter_version(self, novel_id, chapter_id):
+        """查找章节的版本字段（不含正文，同 ChapterModel.find_chapter_version）"""
+        return await self.collection.find_one({
+            "novelId": ObjectId(novel_id),
+            "chapterId": chapter_id
+        }, ChapterModel.VERSION_FIELDS)
+
+    async def find_neighbours(self, novel_id, order):
+        """并发查找相邻的上一章和下一章（不含正文）"""
+        projection = {"content": 0}
+        return tuple(await asyncio.gather(
+            self.collection.find_one(
+                {"novelId": ObjectId(novel_id), "order": {"$lt": order}},
+                projection,
+                sort=[("order", DESCENDING)]
+            ),
+            self.collection.find_one(
+                {"novelId": ObjectId(novel_id), "order": {"$gt": order}},
+                projection,
+                sort=[("order", ASCENDING)]
+            )
+        ))
+
+
+class AsyncCommentModel:
+    """评论数据模型（异步）"""
+
+    def __init__(self, db):
+        self.collection = db.get_collection('comments')
+
+    async def find_comments(self, novel_id, cursor=None, limit=10, reply_limit=3):
+        """按时间倒序分页获取顶层评论，每条评论附带最新的回复（同 CommentModel.find_comments）"""
+        comments, next_cursor, prev_cursor = await keyset_page(
+            self.collection, {"novelId": ObjectId(novel_id), "parentId": None},
+            "createTime", cursor=cursor, limit=limit)
+
+        # 各评论的回复并发读取
+        with_replies = [c for c in comments if c.get('replyCount')]
+        pages = await asyncio.gather(*(keyset_page(self.collection, {"parentId": c['_id']}, "createTime",
+                                                   limit=reply_limit) for c in with_replies))
+        for comment in comments:
+            comment['replies'], comment['replies_cursor'] = [], None
+        for comment, (replies, replies_cursor, _) in zip(with_replies, pages):
+            comment['replies'] = replies[::-1]
+            comment['replies_cursor'] = replies_cursor
+
+        return comments, next_cursor, prev_cursor
+
+
+class AsyncOrderModel:
+    """订单数据模型（异步）"""
+
+    def __init__(self, db):
+        self.collection = db.get_collection('orders')
+
+    async def check_purchased(self, reader_id, novel_id):
+        """检查是否已购买"""
+        return await self.collection.find_one({
+            "readerId": ObjectId(reader_id),
+            "novelId": ObjectId(novel_id),
+            "status": "paid"
+        }, {"_id": 1}) is not None
+
+
+class AsyncReadingRecordModel:
+    """阅读记录数据模型（异步）"""
+
+    def __init__(self, db):
+        self.collection = db.get_collection('reading_records')
+
+    async def get_progress(self, reader_id, novel_id):
+        """获取阅读进度"""
+        return await self.collection.find_one({
+            "readerId": ObjectId(reader_id),
+            "novelId": ObjectId(novel_id)
+        })
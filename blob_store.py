@@ -0,0 +1,125 @@
+"""
+章节正文文件存储（CHAPTER_STORAGE = "file"）
+正文以不可变文件保存在 CHAPTER_BLOB_DIR（默认 UPLOAD_FOLDER/chapters）下，文件名为正文的 SHA-256，
+相同正文只存一份，文件写入后不再修改（编辑章节时写入新文件）。章节文档只保存文件名和大小：
+
+  {content: null, contentFormat: "blob", blobKey: "3fa9...", rawSize: 9360, storedSize: 9360}
+
+阅读页只渲染页面框架，正文由浏览器单独请求 /reader/novels/<id>/read/<章节>/text：
+send_file 把打开的文件交给 WSGI 服务器的 wsgi.file_wrapper，gunicorn 用 sendfile 直接从页缓存发送，
+正文不经过 Python 对象（不支持 file_wrapper 的服务器按块读取）。多台服务器部署时 CHAPTER_BLOB_DIR 需为共享存储。
+
+  python blob_store.py rebuild    把数据库中的章节正文导出为文件（可重复执行）
+  python blob_store.py gc         删除不再被任何章节引用的文件（只删除1小时前写入的文件）
+"""
+
+from markupsafe import escape
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+KEY_PATTERN = re.compile(r'[0-9a-f]{64}')
+# 清理时跳过最近写入的文件：章节文档可能还没有写入
+GC_GRACE_SECONDS = 3600
+
+
+class BlobText:
+    """文件存储的章节正文，转为字符串（编辑页面等）时才读取文件"""
+
+    __slots__ = ('path', 'text')
+
+    def __init__(self, path):
+        self.path = path
+        self.text = None
+
+    def __str__(self):
+        if self.text is None:
+            with open(self.path, 'rb') as f:
+                self.text = f.read().decode('utf-8')
+        return self.text
+
+    def __html__(self):
+        # 模板自动转义时调用，正文仍需转义
+        return str(escape(str(self)))
+
+
+class BlobStore:
+    """内容寻址的不可变文件存储"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        """文件路径：<root>/<前2位>/<3-4位>/<SHA-256>"""
+        if not KEY_PATTERN.fullmatch(key or ''):
+            raise ValueError(f"无效的文件名：{key}")
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def put(self, text):
+        """写入正文，返回(文件名, 字节数)；相同内容的文件已存在时不重复写入"""
+        data = text.encode('utf-8')
+        key = hashlib.sha256(data).hexdigest()
+        path = self.path(key)
+        if not os.path.exists(path):
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            # 先写临时文件再原子改名，读者不会读到写了一半的文件
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return key, len(data)
+
+    def open_text(self, key):
+        """延迟读取的正文"""
+        return BlobText(self.path(key))
+
+    def keys(self):
+        """遍历全部文件，生成(文件名, 路径)"""
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if KEY_PATTERN.fullmatch(name):
+                    yield name, os.path.join(directory, name)
+
+    def gc(self, referenced, grace=GC_GRACE_SECONDS):
+        """删除不在referenced集合中、且写入超过grace秒的文件，返回删除数"""
+        removed = 0
+        cutoff = time.time() - grace
+        for key, path in list(self.keys()):
+            if key not in referenced and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        return removed
+
+
+if __name__ == '__main__':
+    import sys
+    from pymongo import MongoClient
+    from config import Config
+    from chapter_codec import from_config
+
+    try:
+        db = MongoClient(Config.MONGODB_URI)[Config.MONGODB_DB]
+        command = sys.argv[1] if len(sys.argv) > 1 else 'rebuild'
+
+        if command == 'gc':
+            store = BlobStore(Config.CHAPTER_BLOB_DIR)
+            referenced = set(db.chapters.distinct("blobKey", {"contentFormat": "blob"}))
+            print(f"✓ 已删除 {store.gc(referenced)} 个未引用的文件")
+        else:
+            codec = from_config(db, storage='file')
+            print(f"✓ 已导出 {codec.compress_all()} 章到 {Config.CHAPTER_BLOB_DIR}")
+            if Config.CHAPTER_STORAGE != 'file':
+                print("提示：设置 CHAPTER_STORAGE=file 后新写入的章节才会保存为文件")
+    except Exception as e:
+        print(f"\n错误: {str(e)}")
+        print("请确保 MongoDB 服务已启动，并检查连接配置。")
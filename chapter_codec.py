@@ -0,0 +1,330 @@
+"""
+章节正文压缩存储
+章节正文是存储空间和读取流量的主要部分，以压缩后的二进制存放在 chapters.content 中，
+每个文档用 contentFormat 标记格式，新旧格式的章节可以共存，通过同一个 ChapterModel 读写：
+
+  {content: "正文"}                                               未压缩（旧数据，或压缩后不比原文小，contentFormat 为 "text"）
+  {content: <二进制>, contentFormat: "zlib"/"zstd", dictId: 字典_id或None,
+   rawSize: 原文字节数, storedSize: 存储字节数}
+  {content: null, contentFormat: "blob", blobKey: 文件名, ...}      文件存储（CHAPTER_STORAGE = "file"，见 blob_store.py）
+
+同一部小说的章节人名、地名、用词高度重复：章节数达到 CHAPTER_DICTIONARY_MIN_CHAPTERS 后用已有章节
+生成一个共享字典（chapter_dicts 集合；zstd 为训练出的字典，zlib 没有训练算法，使用各章节片段拼成的预置字典），
+单章也能压缩得很小。读取时正文包装为 ChapterText，模板渲染（{{ chapter.content }}）时才解压。
+zstd 需要安装 zstandard，未安装时使用 zlib。
+
+  python chapter_codec.py                    统计各格式章节的原文与存储大小
+  python chapter_codec.py compress           压缩格式与配置不同的章节，为章节足够的小说生成字典
+  python chapter_codec.py train <小说_id>     重新生成小说的字典并重新压缩其章节
+"""
+
+from pymongo import UpdateOne
+from blob_store import BlobStore
+from bson.binary import Binary
+from bson.objectid import ObjectId
+from collections import OrderedDict
+from datetime import datetime
+from markupsafe import escape
+import os
+import threading
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# zlib 预置字典只有最后32KB有效
+ZLIB_DICTIONARY_SIZE = 32 * 1024
+# 生成字典最多使用的章节数
+MAX_SAMPLES = 200
+
+
+def resolve_codec(name):
+    """配置的压缩格式：none为不压缩，zstd 不可用时使用 zlib"""
+    name = (name or 'none').lower()
+    if name == 'none':
+        return None
+    if name not in ('zlib', 'zstd'):
+        raise ValueError(f"不支持的章节压缩格式：{name}")
+    if name == 'zstd' and zstandard is None:
+        return 'zlib'
+    return name
+
+
+def compress(raw, codec, level=None, dictionary=None):
+    """压缩字节串"""
+    if codec == 'zlib':
+        options = {'zdict': dictionary} if dictionary else {}
+        compressor = zlib.compressobj(level if level is not None else 6, **options)
+        return compressor.compress(raw) + compressor.flush()
+    return zstandard.ZstdCompressor(
+        level=level if level is not None else 3,
+        dict_data=zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+    ).compress(raw)
+
+
+def decompress(data, codec, dictionary=None):
+    """解压字节串"""
+    if codec == 'zlib':
+        decompressor = zlib.decompressobj(**({'zdict': dictionary} if dictionary else {}))
+        return decompressor.decompress(data) + decompressor.flush()
+    if zstandard is None:
+        raise RuntimeError("章节以 zstd 压缩存储，请安装 zstandard")
+    return zstandard.ZstdDecompressor(
+        dict_data=zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+    ).decompress(data)
+
+
+class ChapterText:
+    """延迟解压的章节正文，转为字符串（模板渲染）时才解压"""
+
+    __slots__ = ('data', 'codec', 'dictionary', 'text')
+
+    def __init__(self, data, codec, dictionary=None):
+        self.data = data
+        self.codec = codec
+        self.dictionary = dictionary
+        self.text = None
+
+    def __str__(self):
+        if self.text is None:
+            self.text = decompress(self.data, self.codec, self.dictionary).decode('utf-8')
+        return self.text
+
+    def __html__(self):
+        # 模板自动转义时调用，正文仍需转义
+        return str(escape(str(self)))
+
+
+class ChapterCodec:
+    """章节正文的压缩、解压与字典管理
+
+    字典写入后不再修改，本进程用到的字典缓存在内存中。
+    """
+
+    def __init__(self, db, codec='zstd', level=None, dictionary_size=16 * 1024, min_chapters=8,
+                 cache_size=64, storage='mongo', blob_store=None):
+        self.chapters = db.get_collection('chapters')
+        self.novels = db.get_collection('novels')
+        self.dicts = db.get_collection('chapter_dicts')
+        self.codec = resolve_codec(codec)
+        self.level = level
+        self.dictionary_size = dictionary_size
+        self.min_chapters = min_chapters  # 0为不使用字典
+        # storage为file时新正文写入文件；已有的文件存储章节在任何配置下都可以读取
+        self.storage = storage
+        self.blob_store = blob_store or BlobStore(os.path.join(os.path.dirname(__file__), 'uploads', 'chapters'))
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # 字典_id -> 字典文档
+        self.lock = threading.Lock()
+
+    # ---------- 字典缓存 ----------
+
+    def remember(self, dict_doc):
+        """缓存字典文档"""
+        if dict_doc is None:
+            return
+        with self.lock:
+            self.cache[dict_doc['_id']] = dict_doc
+            self.cache.move_to_end(dict_doc['_id'])
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def cached(self, dict_id):
+        with self.lock:
+            return self.cache.get(dict_id)
+
+    def needs_dictionary(self, chapter):
+        """章节使用的字典尚未缓存（异步模型据此先异步加载字典）"""
+        return bool(chapter.get('dictId')) and self.cached(chapter['dictId']) is None
+
+    def dictionary(self, dict_id):
+        """获取字典文档，不存在时返回None"""
+        if not dict_id:
+            return None
+        dict_doc = self.cached(dict_id)
+        if dict_doc is None:
+            dict_doc = self.dicts.find_one({"_id": dict_id})
+            self.remember(dict_doc)
+        return dict_doc
+
+    # ---------- 编码与解码 ----------
+
+    def encode(self, content, dict_id=None):
+        """编码正文，返回章节文档中的正文字段"""
+        if self.storage == 'file':
+            key, size = self.blob_store.put(content or '')
+            return {"content": None, "contentFormat": "blob", "dictId": None, "blobKey": key,
+                    "rawSize": size, "storedSize": size}
+
+        raw = (content or '').encode('utf-8')
+        dict_doc = self.dictionary(dict_id) if self.codec else None
+        if dict_doc is not None and dict_doc['codec'] != self.codec:
+            dict_doc = None  # 压缩格式配置变化后旧字典不再使用
+        data = compress(raw, self.codec, self.level, dict_doc and dict_doc['data']) if self.codec else None
+
+        if data is None or len(data) >= len(raw):
+            return {"content": content or '', "contentFormat": "text", "dictId": None, "blobKey": None,
+                    "rawSize": len(raw), "storedSize": len(raw)}
+        return {"content": Binary(data), "contentFormat": self.codec, "dictId": dict_doc and dict_doc['_id'],
+                "blobKey": None, "rawSize": len(raw), "storedSize": len(data)}
+
+    def load(self, chapter):
+        """把读出的章节正文包装为 ChapterText（渲染时才解压），未压缩的章节原样返回"""
+        if chapter is None or chapter.get('contentFormat') in (None, 'text'):
+            return chapter
+        if chapter['contentFormat'] == 'blob':
+            chapter['content'] = self.blob_store.open_text(chapter['blobKey'])
+            return chapter
+        dict_doc = self.dictionary(chapter.get('dictId'))
+        if chapter.get('dictId') and dict_doc is None:
+            raise RuntimeError(f"章节字典 {chapter['dictId']} 不存在")
+        chapter['content'] = ChapterText(bytes(chapter['content']), chapter['contentFormat'],
+                                         dict_doc and dict_doc['data'])
+        return chapter
+
+    def text(self, chapter):
+        """章节正文字符串"""
+        return str(self.load(chapter)['content'])
+
+    # ---------- 字典生成与批量压缩 ----------
+
+    def _build_dictionary(self, samples):
+        """由章节正文样本生成字典内容，样本不足时返回None"""
+        if self.codec == 'zstd':
+            try:
+                return zstandard.train_dictionary(self.dictionary_size, samples).as_bytes()
+            except zstandard.ZstdError:
+                return None
+        # zlib：每章取开头片段拼接，越靠后的内容匹配距离越近
+        size = min(self.dictionary_size, ZLIB_DICTIONARY_SIZE)
+        piece = max(size // len(samples), 256)
+        return b''.join(sample[:piece] for sample in samples)[-size:]
+
+    def train(self, novel_id):
+        """为小说生成新字典并用它重新压缩全部章节，返回(字典_id, 重新编码的章节数)，章节不足时字典_id为None"""
+        if not self.codec or not self.min_chapters or self.storage == 'file':
+            return None, 0
+        novel_id = ObjectId(novel_id)
+        total = self.chapters.count_documents({"novelId": novel_id})
+        if total < self.min_chapters:
+            return None, 0
+
+        # 均匀抽样，长篇小说不必读取全部章节
+        step = max(total // MAX_SAMPLES, 1)
+        samples = [self.text(chapter).encode('utf-8') for i, chapter in
+                   enumerate(self.chapters.find({"novelId": novel_id}).sort("order", 1)) if i % step == 0]
+        data = self._build_dictionary(samples[:MAX_SAMPLES])
+        if not data:
+            return None, 0
+
+        dict_id = self.dicts.insert_one({
+            "novelId": novel_id,
+            "codec": self.codec,
+            "data": Binary(data),
+            "size": len(data),
+            "samples": len(samples[:MAX_SAMPLES]),
+            "createTime": datetime.utcnow()
+        }).inserted_id
+        self.novels.update_one({"_id": novel_id}, {"$set": {"chapterDict": dict_id}})
+        count = self.recompress(novel_id, dict_id)
+
+        # 删除不再被任何章节引用的旧字典
+        for old in self.dicts.find({"novelId": novel_id, "_id": {"$ne": dict_id}}, {"_id": 1}):
+            if not self.chapters.find_one({"novelId": novel_id, "dictId": old['_id']}, {"_id": 1}):
+                self.dicts.delete_one({"_id": old['_id']})
+        return dict_id, count
+
+    def train_if_needed(self, novel_id):
+        """小说还没有当前格式的字典且章节数已足够时生成字典，返回同 train"""
+        if not self.codec or not self.min_chapters or self.storage == 'file':
+            return None, 0
+        novel = self.novels.find_one({"_id": ObjectId(novel_id)}, {"chapterDict": 1, "chapterCount": 1})
+        if not novel or novel.get('chapterCount', 0) < self.min_chapters:
+            return None, 0
+        dict_doc = self.dictionary(novel.get('chapterDict'))
+        if dict_doc is not None and dict_doc['codec'] == self.codec:
+            return None, 0
+        return self.train(novel_id)
+
+    def recompress(self, novel_id, dict_id=None, batch_size=200):
+        """按当前格式和字典重新编码小说中格式不同的章节，返回重新编码的章节数"""
+        target = self.dictionary(dict_id) if self.storage != 'file' else None
+        target_format = 'blob' if self.storage == 'file' else self.codec or 'text'
+        target_dict = target['_id'] if target is not None and target['codec'] == self.codec else None
+
+        updates = []
+        count = 0
+        for chapter in self.chapters.find({"novelId": ObjectId(novel_id)}):
+            if (chapter.get('contentFormat') or 'text') == target_format and chapter.get('dictId') == target_dict \
+                    and 'rawSize' in chapter:
+                continue
+            stored = chapter['content']
+            # 以原内容为条件，期间被编辑过的章节不覆盖
+            updates.append(UpdateOne({"_id": chapter['_id'], "content": stored},
+                                     {"$set": self.encode(self.text(chapter), target_dict)}))
+            if len(updates) >= batch_size:
+                count += self.chapters.bulk_write(updates, ordered=False).modified_count
+                updates = []
+        if updates:
+            count += self.chapters.bulk_write(updates, ordered=False).modified_count
+        return count
+
+    def compress_all(self):
+        """压缩全部小说的章节：章节足够的生成字典，其余按当前格式重新编码"""
+        total = 0
+        for novel in self.novels.find({}, {"title": 1, "chapterDict": 1}):
+            dict_id, count = self.train_if_needed(novel['_id'])
+            if dict_id is None:
+                count = self.recompress(novel['_id'], novel.get('chapterDict'))
+            total += count
+            if count or dict_id:
+                print(f"  ✓ {novel.get('title')}：{count} 章{'（已生成字典）' if dict_id else ''}")
+        return total
+
+    def stats(self):
+        """各存储格式的章节数、原文与存储字节数"""
+        return list(self.chapters.aggregate([
+            {"$group": {
+                "_id": {"$ifNull": ["$contentFormat", "text"]},
+                "chapters": {"$sum": 1},
+                "rawSize": {"$sum": {"$ifNull": ["$rawSize", {"$strLenBytes": "$content"}]}},
+                "storedSize": {"$sum": {"$ifNull": ["$storedSize", {"$strLenBytes": "$content"}]}}
+            }},
+            {"$sort": {"_id": 1}}
+        ]))
+
+
+def from_config(db, storage=None):
+    """按 config.Config 创建 ChapterCodec（迁移和命令行使用），storage指定时覆盖配置"""
+    from config import Config
+    return ChapterCodec(db, Config.CHAPTER_COMPRESSION, level=Config.CHAPTER_COMPRESSION_LEVEL,
+                        dictionary_size=Config.CHAPTER_DICTIONARY_SIZE,
+                        min_chapters=Config.CHAPTER_DICTIONARY_MIN_CHAPTERS,
+                        storage=storage or Config.CHAPTER_STORAGE, blob_store=BlobStore(Config.CHAPTER_BLOB_DIR))
+
+
+if __name__ == '__main__':
+    import sys
+    from pymongo import MongoClient
+    from config import Config
+
+    try:
+        db = MongoClient(Config.MONGODB_URI)[Config.MONGODB_DB]
+        codec = from_config(db)
+        command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+
+        if command == 'compress':
+            print(f"✓ 已重新编码 {codec.compress_all()} 章（格式：{codec.codec or 'text'}）")
+        elif command == 'train':
+            dict_id, count = codec.train(sys.argv[2])
+            print(f"✓ 已生成字典 {dict_id}，重新编码 {count} 章" if dict_id else "章节数不足或未启用压缩，未生成字典")
+        else:
+            for row in codec.stats():
+                ratio = row['storedSize'] / row['rawSize'] if row['rawSize'] else 1
+                print(f"{row['_id']:>5}：{row['chapters']} 章，原文 {row['rawSize'] / 1024:.1f} KB，"
+                      f"存储 {row['storedSize'] / 1024:.1f} KB（{ratio:.1%}）")
+    except Exception as e:
+        print(f"\n错误: {str(e)}")
+        print("请确保 MongoDB 服务已启动，并检查连接配置。")
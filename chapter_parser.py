@@ -0,0 +1,143 @@
+"""
+章节解析
+按行流式切分章节：上传文件分块读取、增量解码，识别“第X章/回/节”标题后逐章产出，
+内存占用只与单章大小有关，与整本小说大小无关。
+"""
+
+import codecs
+import re
+
+# 章节标题（第X章、第X回、第X节），标题文字取到行尾
+CHAPTER_PATTERN = re.compile(r'第[零一二三四五六七八九十百千0-9]+[章回节][\s：:]*')
+
+# 用于识别编码的样本大小
+SAMPLE_SIZE = 64 * 1024
+
+
+def detect_encoding(sample):
+    """根据文件开头的字节识别编码，支持 UTF-8（含BOM）/UTF-16（含BOM）/GBK/GB18030"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith(codecs.BOM_UTF16_LE) or sample.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16'
+    try:
+        sample.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # 样本末尾截断的多字节字符不影响判断
+        if e.start >= len(sample) - 3 and e.reason == 'unexpected end of data':
+            return 'utf-8'
+    # GB18030 兼容 GBK/GB2312
+    return 'gb18030'
+
+
+def _line_ended(line):
+    """行已结束：以换行符结尾（单独的\r可能是被切开的\r\n，不算结束）"""
+    return not line.endswith('\r') and line.splitlines() != [line]
+
+
+def iter_text_lines(texts):
+    """将若干段文本（如分块解码结果、PDF逐页文本）重新按行切分产出"""
+    # 未结束的最后一行按段保存，只切分新到的文本，超长的行也不会反复拼接
+    partial = []
+    for text in texts:
+        lines = text.splitlines(keepends=True)
+        if partial and lines:
+            if partial[-1].endswith('\r'):
+                # 被切开的\r\n
+                if lines[0] == '\n':
+                    partial.append(lines.pop(0))
+                yield ''.join(partial)
+                partial = []
+            else:
+                partial.append(lines.pop(0))
+                if lines or _line_ended(partial[-1]):
+                    yield ''.join(partial)
+                    partial = []
+        if lines:
+            last = lines.pop()
+            yield from lines
+            if _line_ended(last):
+                yield last
+            else:
+                partial = [last]
+    if partial:
+        yield ''.join(partial)
+
+
+def iter_decoded(stream, chunk_size=SAMPLE_SIZE):
+    """分块读取二进制流，自动识别编码并增量解码
+
+    编码只根据开头的样本识别，后面出现无法解码的字节时抛出ValueError（导入任务失败并回滚），
+    不会静默丢弃字符。
+    """
+    sample = stream.read(chunk_size)
+    encoding = detect_encoding(sample)
+    decoder = codecs.getincrementaldecoder(encoding)()
+
+    offset = 0  # 已读取的字节数
+    chunk = sample
+    try:
+        while chunk:
+            yield decoder.decode(chunk)
+            offset += len(chunk)
+            chunk = stream.read(chunk_size)
+        yield decoder.decode(b'', final=True)
+    except UnicodeDecodeError as e:
+        # e.start 从解码器中上一块剩余的半个字符算起
+        position = offset - len(decoder.getstate()[0]) + e.start
+        raise ValueError(f"文件编码识别为 {encoding}，但第 {position} 字节处无法解码，"
+                         f"请将文件转换为 UTF-8 后重新导入") from e
+
+
+def iter_lines(stream, chunk_size=SAMPLE_SIZE):
+    """分块读取二进制流并逐行产出文本"""
+    return iter_text_lines(iter_decoded(stream, chunk_size))
+
+
+def split_chapters(lines):
+    """将文本行切分为章节，逐章产出 {'title', 'content'}
+
+    第一个章节标题之前的内容会被忽略；全文没有章节标题时整体作为一章“正文”。
+    """
+    title = None
+    body = []
+    found = False
+    awaiting_title = False
+
+    for line in lines:
+        if awaiting_title:
+            # 标题行只有“第X章”时，下一个非空行作为标题文字
+            if line.strip():
+                title = f"{title} {line.strip()}"
+                awaiting_title = False
+            continue
+
+        match = CHAPTER_PATTERN.search(line)
+        if not match:
+            body.append(line)
+            continue
+
+        if found:
+            body.append(line[:match.start()])
+            yield {'title': title, 'content': ''.join(body).strip()}
+        found = True
+        body = []
+        title = line[match.start():].strip()
+        awaiting_title = not line[match.end():].strip()
+
+    if found:
+        yield {'title': title, 'content': ''.join(body).strip()}
+    else:
+        # 没有找到章节标记，将整个内容作为一章
+        yield {'title': '正文', 'content': ''.join(body)}
+
+
+def iter_txt_chapters(stream, chunk_size=SAMPLE_SIZE):
+    """流式解析上传的TXT文件，逐章产出"""
+    return split_chapters(iter_lines(stream, chunk_size))
+
+
+def parse_txt_chapters(content):
+    """解析已解码的文本为章节列表"""
+    return list(split_chapters(content.splitlines(keepends=True)))
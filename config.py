@@ -22,14 +22,78 @@ class Config:
         # 本地模式：无认证
         MONGODB_URI = f"mongodb://{MONGODB_HOST}:{MONGODB_PORT}/{MONGODB_DB}"
     
+    # 生产服务器配置（python serve.py）
+    SERVER_BIND = os.environ.get('SERVER_BIND', '0.0.0.0:5000')
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', (os.cpu_count() or 1) * 2 + 1))
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 4))  # 每个工作进程的线程数
+    SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', 60))
+    SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))  # 重载/停止时等待请求完成的时间
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', 0))
+    
+    # 冷启动配置：模板字节码缓存目录（为空则不缓存，构建时由 python warmup.py 预编译）、
+    # 工作进程启动后是否预热（建立数据库连接、访问预热地址）后再接收请求
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR',
+                                        os.path.join(os.path.dirname(__file__), 'data', 'jinja_cache'))
+    WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', 'true').lower() == 'true'
+    WARMUP_URLS = [url for url in os.environ.get('WARMUP_URLS', '/login').split(',') if url]
+    
     # Session配置
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     
     # 文件上传配置
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
+    # TXT导入为流式解析，上传文件由Werkzeug暂存到磁盘，上限可以放宽
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 200 * 1024 * 1024))  # 200MB
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
     ALLOWED_EXTENSIONS = {'txt', 'pdf'}
     
+    # 章节正文压缩配置：格式 zstd/zlib/none（zstd 需要安装 zstandard，未安装时使用 zlib）、压缩级别（为空使用默认值）、
+    # 每部小说共享字典的大小和生成字典所需的最少章节数（0为不使用字典）
+    CHAPTER_COMPRESSION = os.environ.get('CHAPTER_COMPRESSION', 'zstd')
+    CHAPTER_COMPRESSION_LEVEL = int(os.environ['CHAPTER_COMPRESSION_LEVEL']) if os.environ.get('CHAPTER_COMPRESSION_LEVEL') else None
+    CHAPTER_DICTIONARY_SIZE = int(os.environ.get('CHAPTER_DICTIONARY_SIZE', 16 * 1024))
+    CHAPTER_DICTIONARY_MIN_CHAPTERS = int(os.environ.get('CHAPTER_DICTIONARY_MIN_CHAPTERS', 8))
+    
+    # 章节正文存储位置：mongo-数据库（按上面的配置压缩）、file-不可变文件（阅读页单独加载正文，见 blob_store.py）
+    CHAPTER_STORAGE = os.environ.get('CHAPTER_STORAGE', 'mongo')
+    CHAPTER_BLOB_DIR = os.environ.get('CHAPTER_BLOB_DIR', os.path.join(UPLOAD_FOLDER, 'chapters'))
+    
+    # 章节导入后台任务配置
+    IMPORT_JOB_THREADS = int(os.environ.get('IMPORT_JOB_THREADS', 2))  # 同时执行的导入任务数
+    IMPORT_PDF_WORKERS = int(os.environ.get('IMPORT_PDF_WORKERS', os.cpu_count() or 1))  # PDF提取进程数
+    IMPORT_PAGES_PER_TASK = int(os.environ.get('IMPORT_PAGES_PER_TASK', 10))
+    IMPORT_JOB_STALE_SECONDS = int(os.environ.get('IMPORT_JOB_STALE_SECONDS', 120))  # 心跳超过该秒数未刷新的任务视为失败
+    
+    # 已登录用户缓存配置（删除/修改用户后，其他进程最多延迟TTL秒生效）
+    PRINCIPAL_CACHE_SIZE = int(os.environ.get('PRINCIPAL_CACHE_SIZE', 1024))
+    PRINCIPAL_CACHE_TTL = int(os.environ.get('PRINCIPAL_CACHE_TTL', 30))
+    
+    # 密码哈希配置：bcrypt计算成本（修改后已有用户在下次登录时重新哈希）、
+    # 每个进程的哈希线程数、排队上限（超过后登录/注册返回“请稍后重试”）、请求最长等待秒数
+    BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+    PASSWORD_HASH_THREADS = int(os.environ.get('PASSWORD_HASH_THREADS', 2))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 16))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    
+    # 阅读量/阅读进度写缓冲配置（关闭后恢复为每次阅读同步写库）
+    WRITE_BEHIND_ENABLED = os.environ.get('WRITE_BEHIND_ENABLED', 'true').lower() == 'true'
+    WRITE_BEHIND_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL', 5))
+    WRITE_BEHIND_MAX_PENDING = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', 1000))
+    
+    # 趋势分桶配置：小时桶保留天数（超过后合并为日桶）、趋势图天数
+    ROLLUP_HOURLY_RETENTION_DAYS = int(os.environ.get('ROLLUP_HOURLY_RETENTION_DAYS', 2))
+    TREND_DAYS = 90
+    
+    # 推荐配置：每部小说保留的相似小说数、参与推荐的阅读历史条数、协同过滤矩阵状态文件
+    RECOMMEND_TOP_K = int(os.environ.get('RECOMMEND_TOP_K', 20))
+    RECOMMEND_HISTORY_SIZE = 50
+    RECOMMEND_STATE_PATH = os.environ.get('RECOMMEND_STATE_PATH',
+                                          os.path.join(os.path.dirname(__file__), 'data', 'item_cf.npz'))
+    CONTENT_STATE_PATH = os.environ.get('CONTENT_STATE_PATH',
+                                        os.path.join(os.path.dirname(__file__), 'data', 'content.npz'))
+    
     # 分页配置
     NOVELS_PER_PAGE = 12
     COMMENTS_PER_PAGE = 10
+    COMMENT_REPLY_PREVIEW = 3  # 评论列表中每条评论显示的最新回复数，更早的回复按需加载
+    REPLIES_PER_PAGE = 20
+    ORDERS_PER_PAGE = 10
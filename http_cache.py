@@ -0,0 +1,46 @@
+"""
+小说详情页、章节阅读页的条件请求（ETag / Last-Modified / 304）
+ETag 由页面依赖数据的版本号（novels.version、chapters.version、相似列表更新时间）和当前用户生成，
+浏览器带 If-None-Match 请求且页面未变化时直接返回 304，不再查询评论、相邻章节等数据，也不渲染模板。
+页面中与读者相关的购买状态、变化频繁的阅读量和销量由页面单独请求（/reader/novels/<id>/state），
+页面都需要登录，内容随用户不同，因此以 Cache-Control: private, no-cache 返回：只由浏览器缓存，
+每次使用前用 ETag 校验；private 禁止反向代理等共享缓存保存页面，304 节省的是渲染和传输。
+Flask 与 Quart 的请求、响应对象都基于 Werkzeug，两边共用这里的函数。
+"""
+
+import hashlib
+
+
+def page_etag(session, *parts):
+    """由页面依赖数据的版本和当前用户（页面头部显示用户名）生成强ETag"""
+    key = [session.get('user_id'), session.get('username'), session.get('role')] + list(parts)
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+
+def last_modified(*times):
+    """页面最后修改时间：各数据更新时间中最晚的一个"""
+    times = [t for t in times if t]
+    return max(times) if times else None
+
+
+def is_fresh(request, session, etag):
+    """浏览器缓存的页面仍然有效；有待显示的闪现消息时总是重新渲染"""
+    if session.get('_flashes'):
+        return False
+    return bool(request.if_none_match) and request.if_none_match.contains(etag)
+
+
+def cache_privately(response, etag, modified):
+    """设置缓存响应头：只允许浏览器缓存（共享缓存不保存），每次使用前校验"""
+    response.set_etag(etag)
+    if modified:
+        response.last_modified = modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+
+def not_modified(response_class, etag, modified):
+    """304响应"""
+    return cache_privately(response_class('', status=304), etag, modified)
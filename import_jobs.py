@@ -0,0 +1,163 @@
+"""
+章节导入后台任务
+上传请求只负责保存文件并登记任务，解析与入库在后台线程中进行；
+PDF 按页分段交给本地进程池并行提取文本，任务状态与进度持久化在 import_jobs 集合中。
+任务所在进程定时刷新心跳；工作进程被回收、超时或崩溃后心跳停止，查询进度时发现心跳超时的任务
+标记为失败，并撤销它已写入的章节。
+"""
+
+from chapter_parser import iter_lines, iter_text_lines, split_chapters
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import atexit
+import os
+import socket
+import threading
+import time
+
+
+def count_pdf_pages(path):
+    """统计PDF页数"""
+    import PyPDF2
+    with open(path, 'rb') as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def extract_pdf_pages(path, start, end):
+    """提取PDF第[start, end)页的文本（在进程池中执行）"""
+    import PyPDF2
+    with open(path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        return [reader.pages[i].extract_text() or '' for i in range(start, end)]
+
+
+class JobCancelled(Exception):
+    """任务已被标记为失败（心跳超时），停止导入"""
+
+
+class ImportJobRunner:
+    """章节导入任务执行器"""
+
+    def __init__(self, job_model, import_chapters, rollback_import, upload_folder,
+                 job_threads=2, pdf_workers=None, pages_per_task=10, stale_seconds=120):
+        self.job_model = job_model
+        # import_chapters(novel_id, chapters, progress, job_id) -> 导入章数
+        self.import_chapters = import_chapters
+        # rollback_import(novel_id, job_id)：撤销任务已写入的章节
+        self.rollback_import = rollback_import
+        self.upload_folder = upload_folder
+        self.job_threads = job_threads
+        self.pdf_workers = pdf_workers or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        self.stale_seconds = stale_seconds
+        self.lock = threading.Lock()
+        self.pid = None
+        self.job_executor = None
+        self.pdf_executor = None
+        self.active = set()  # 本进程中排队和执行中的任务
+        self.heartbeat_thread = None
+
+    def _ensure_executors(self):
+        """按需创建线程池和进程池（fork后在子进程中重新创建）"""
+        # 进程池模块在第一次导入任务时才导入，不增加Web进程的启动时间
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.job_executor = ThreadPoolExecutor(self.job_threads, thread_name_prefix='import-job')
+                # spawn方式启动工作进程，不继承父进程中的数据库连接
+                self.pdf_executor = ProcessPoolExecutor(
+                    self.pdf_workers, mp_context=multiprocessing.get_context('spawn'))
+                # 解释器退出前关闭进程池，避免模块清理后再回收进程池
+                atexit.register(self.pdf_executor.shutdown)
+                self.active = set()
+                self.heartbeat_thread = threading.Thread(target=self._heartbeat, name='import-heartbeat', daemon=True)
+                self.heartbeat_thread.start()
+
+    def _heartbeat(self):
+        """定时刷新本进程任务的心跳，间隔为超时时间的四分之一"""
+        while True:
+            time.sleep(self.stale_seconds / 4)
+            with self.lock:
+                job_ids = list(self.active)
+            try:
+                self.job_model.heartbeat(job_ids)
+            except Exception as e:
+                print(f"导入任务心跳刷新失败：{e}")
+
+    def submit(self, novel_id, author_id, file):
+        """保存上传文件并提交导入任务，返回任务ID"""
+        filename = file.filename
+        kind = 'pdf' if filename.lower().endswith('.pdf') else 'txt'
+        job_id = self.job_model.create_job(novel_id, author_id, filename, kind)
+        path = os.path.join(self.upload_folder, f"{job_id}.{kind}")
+        file.save(path)
+
+        self._ensure_executors()
+        with self.lock:
+            self.active.add(job_id)
+        self.job_executor.submit(self.run, job_id, novel_id, kind, path)
+        return job_id
+
+    def run(self, job_id, novel_id, kind, path):
+        """执行导入任务"""
+        try:
+            now = datetime.utcnow()
+            started = self.job_model.update_job(job_id, {
+                "status": "running",
+                "worker": f"{socket.gethostname()}:{os.getpid()}",
+                "startedAt": now,
+                "heartbeatTime": now
+            }, status="queued")
+            # 排队期间已被标记为失败
+            if started.matched_count == 0:
+                return
+            try:
+                if kind == 'pdf':
+                    count = self._import(job_id, novel_id, iter_text_lines(self._iter_pdf_text(job_id, path)))
+                else:
+                    with open(path, 'rb') as f:
+                        count = self._import(job_id, novel_id, iter_lines(f))
+                self.job_model.update_job(job_id, {"status": "done", "chaptersFound": count}, status="running")
+            except Exception as e:
+                self.job_model.update_job(job_id, {"status": "failed", "error": str(e)}, status="running")
+        finally:
+            with self.lock:
+                self.active.discard(job_id)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _import(self, job_id, novel_id, lines):
+        """切分章节并批量入库，每写入一批更新一次进度"""
+        def progress(n):
+            if self.job_model.update_job(job_id, {"chaptersFound": n}, status="running").matched_count == 0:
+                # 任务已被判定为超时失败，停止导入并回滚已写入的章节
+                raise JobCancelled("导入任务已被标记为失败")
+
+        return self.import_chapters(novel_id, split_chapters(lines), progress=progress, job_id=job_id)
+
+    def recover_if_stale(self, job):
+        """任务心跳超时（所在进程已退出）时标记为失败并撤销已写入的章节，返回最新的任务"""
+        error = "导入进程意外退出，已撤销本次导入的章节，请重新导入"
+        if not self.job_model.fail_if_stale(job, self.stale_seconds, error):
+            return job
+        self.rollback_import(job['novelId'], job['_id'])
+        path = os.path.join(self.upload_folder, f"{job['_id']}.{job['kind']}")
+        if os.path.exists(path):
+            os.remove(path)
+        return self.job_model.find_by_id(job['_id'])
+
+    def _iter_pdf_text(self, job_id, path):
+        """并行提取PDF文本，按页序逐页产出并记录进度"""
+        total = count_pdf_pages(path)
+        self.job_model.update_job(job_id, {"pagesTotal": total})
+
+        ranges = [(start, min(start + self.pages_per_task, total))
+                  for start in range(0, total, self.pages_per_task)]
+        futures = [self.pdf_executor.submit(extract_pdf_pages, path, start, end)
+                   for start, end in ranges]
+        for (start, end), future in zip(ranges, futures):
+            yield from future.result()
+            self.job_model.update_job(job_id, {"pagesProcessed": end})
@@ -6,6 +6,10 @@
 from pymongo import MongoClient
 import bcrypt
 from datetime import datetime
+from models import ChapterModel, count_words
+from search import SearchIndex
+from stats import StatsStore
+from migrations import migrate
 import os
 
 # 数据库配置
@@ -27,12 +31,19 @@ def init_database():
     client = MongoClient(MONGODB_URI)
     db = client[MONGODB_DB]
     
+    # 创建索引等结构迁移
+    print("执行数据库结构迁移...")
+    migrate(db)
+    
     # 清空现有数据（可选）
     print("清理现有数据...")
     db.users.delete_many({})
     db.novels.delete_many({})
+    db.chapters.delete_many({})
+    db.comments.delete_many({})
     db.orders.delete_many({})
     db.reading_records.delete_many({})
+    db.stats.delete_many({})
     
     # 创建管理员账号
     print("创建管理员账号...")
@@ -241,7 +252,7 @@ def init_database():
                 "createTime": datetime.utcnow()
             }
         ],
-        "comments": [],
+        "commentCount": 0,
         "review": {
             "adminId": admin_id,
             "opinion": "内容健康，情节精彩，通过审核。",
@@ -251,8 +262,24 @@ def init_database():
         "saleCount": 237,
         "createTime": datetime.utcnow()
     }
+    # 章节正文单独存入chapters集合，小说文档只保留目录
+    sample_chapters = sample_novel.pop('chapters')
+    for order, chapter in enumerate(sample_chapters, start=1):
+        chapter['order'] = order
+        chapter['wordCount'] = count_words(chapter['content'])
+        chapter['version'] = 1
+        chapter['updateTime'] = chapter['createTime']
+    sample_novel['chapters'] = [ChapterModel.toc_entry(c) for c in sample_chapters]
+    sample_novel['chapterCount'] = len(sample_chapters)
+    sample_novel['chapterSeq'] = len(sample_chapters)
+    sample_novel['version'] = 1
+    sample_novel['updateTime'] = sample_novel['createTime']
     novel_id = db.novels.insert_one(sample_novel).inserted_id
+    for chapter in sample_chapters:
+        chapter['novelId'] = novel_id
+    db.chapters.insert_many(sample_chapters)
     print(f"✓ 示例小说创建成功: {sample_novel['title']}")
+    SearchIndex(db).rebuild()
     
     # 创建示例订单
     print("\n创建示例订单...")
@@ -267,6 +294,7 @@ def init_database():
     }
     db.orders.insert_one(sample_order)
     print(f"✓ 示例订单创建成功")
+    StatsStore(db).reconcile()
     
     print("\n" + "="*50)
     print("数据库初始化完成！")
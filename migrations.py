@@ -0,0 +1,374 @@
+"""
+数据库结构迁移
+索引和数据结构的变更按版本号登记在 MIGRATIONS 中，已执行到的版本记录在 schema_version 集合：
+  {_id: "schema", version: 7, history: [{version, description, appliedAt, seconds}], lock: {...}}
+应用启动时只读取一次版本号做检查，索引创建和数据迁移由部署时执行本脚本完成：
+
+  python migrations.py            执行全部未执行的迁移
+  python migrations.py --to 3     只执行到第3版
+  python migrations.py status     查看当前版本和待执行的迁移
+  python migrations.py plan       列出待执行迁移要创建的索引（副本集可据此逐个节点滚动建索引）
+  python migrations.py check      有待执行的迁移时以状态码1退出，用于部署检查
+
+索引以 background 方式创建（MongoDB 4.2 起所有索引构建只在开始和结束时短暂加锁）。
+多个进程同时执行迁移时通过 schema_version 文档上的锁保证只有一个进程在执行。
+新增迁移：在列表末尾追加更大的版本号，已发布的迁移不要修改。
+"""
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta
+import os
+import re
+import socket
+import time
+
+SCHEMA_ID = "schema"
+# 迁移进程异常退出后锁的失效时间
+LOCK_TIMEOUT = timedelta(hours=1)
+
+
+class SchemaVersionError(Exception):
+    """数据库结构版本低于代码要求"""
+
+
+class Migration:
+    """一个迁移步骤：先创建索引，再执行数据迁移函数"""
+
+    def __init__(self, version, description, indexes=None, apply=None):
+        self.version = version
+        self.description = description
+        self.indexes = indexes or {}  # 集合名 -> [(键列表, 选项)]
+        self.apply = apply
+
+    def run(self, db):
+        for collection, specs in self.indexes.items():
+            db[collection].create_indexes([IndexModel(keys, background=True, **options)
+                                           for keys, options in specs])
+        if self.apply:
+            self.apply(db)
+
+
+def _chapter_number(chapter_id):
+    """解析 CHnnn 形式章节ID中的序号"""
+    match = re.fullmatch(r'CH(\d+)', chapter_id or '')
+    return int(match.group(1)) if match else 0
+
+
+def _migrate_novel_chapters(db, novel):
+    """迁移单部小说内嵌的章节正文"""
+    from models import ChapterModel, count_words
+
+    seen_ids = set()
+    chapter_docs = []
+    for order, chapter in enumerate(novel.get('chapters', []), start=1):
+        # 旧数据中可能存在重复的章节ID（重复导入导致），重新编号保证唯一
+        chapter_id = chapter.get('chapterId')
+        if not chapter_id or chapter_id in seen_ids:
+            chapter_id = f"CH{order:03d}"
+            suffix = 1
+            while chapter_id in seen_ids:
+                chapter_id = f"CH{order:03d}-{suffix}"
+                suffix += 1
+        seen_ids.add(chapter_id)
+
+        content = chapter.get('content') or ''
+        chapter_docs.append({
+            "novelId": novel['_id'],
+            "chapterId": chapter_id,
+            "order": order,
+            "title": chapter.get('title'),
+            "content": content,
+            "isFree": bool(chapter.get('isFree', False)),
+            "wordCount": count_words(content),
+            "createTime": chapter.get('createTime')
+        })
+
+    # 先写入正文，再替换目录，中途失败可重新执行
+    db.chapters.delete_many({"novelId": novel['_id']})
+    if chapter_docs:
+        db.chapters.insert_many(chapter_docs)
+
+    chapter_seq = max([len(chapter_docs)] + [_chapter_number(c['chapterId']) for c in chapter_docs])
+    db.novels.update_one(
+        {"_id": novel['_id']},
+        {"$set": {
+            "chapters": [ChapterModel.toc_entry(c) for c in chapter_docs],
+            "chapterCount": len(chapter_docs),
+            "chapterSeq": chapter_seq
+        }}
+    )
+
+
+def split_chapters(db):
+    """旧版内嵌在 novels.chapters 中的章节正文迁移到 chapters 集合，小说只保留目录"""
+    # 没有章节的旧小说只需补齐计数字段
+    db.novels.update_many(
+        {"chapterCount": {"$exists": False}, "chapters": {"$size": 0}},
+        {"$set": {"chapterCount": 0, "chapterSeq": 0}}
+    )
+    # 目录中仍带content字段的小说视为未迁移
+    for novel in db.novels.find({"chapters.content": {"$exists": True}}):
+        _migrate_novel_chapters(db, novel)
+        print(f"  ✓ {novel.get('title')}：{len(novel.get('chapters', []))} 章")
+
+
+def _migrate_novel_comments(db, novel):
+    """迁移单部小说内嵌的评论和回复"""
+    comments = novel.get('comments', [])
+    comment_docs = [{
+        "novelId": novel['_id'],
+        "parentId": None,
+        "userId": comment.get('userId'),
+        "username": comment.get('username') or '匿名用户',
+        "content": comment.get('content'),
+        "replyCount": len(comment.get('replies', [])),
+        "createTime": comment.get('createTime')
+    } for comment in comments]
+
+    reply_docs = []
+    if comment_docs:
+        inserted_ids = db.comments.insert_many(comment_docs).inserted_ids
+        for comment, comment_id in zip(comments, inserted_ids):
+            for reply in comment.get('replies', []):
+                reply_docs.append({
+                    "novelId": novel['_id'],
+                    "parentId": comment_id,
+                    "userId": reply.get('userId'),
+                    "username": reply.get('username') or '匿名用户',
+                    "content": reply.get('content'),
+                    "replyCount": 0,
+                    "createTime": reply.get('createTime')
+                })
+    if reply_docs:
+        db.comments.insert_many(reply_docs)
+
+    db.novels.update_one(
+        {"_id": novel['_id']},
+        {"$set": {"commentCount": len(comment_docs)}, "$unset": {"comments": ""}}
+    )
+
+
+def split_comments(db):
+    """旧版内嵌在 novels.comments 中的评论迁移到 comments 集合，并补齐评论数、回复数"""
+    for novel in db.novels.find({"comments": {"$exists": True}}, {"title": 1, "comments": 1}):
+        _migrate_novel_comments(db, novel)
+        print(f"  ✓ {novel.get('title')}：{len(novel.get('comments', []))} 条评论")
+
+
+def compress_chapters(db):
+    """章节正文按配置压缩存储，章节足够的小说生成共享字典（格式见 chapter_codec.py）"""
+    from chapter_codec import from_config
+    print(f"  共重新编码 {from_config(db).compress_all()} 章")
+
+
+def add_versions(db):
+    """小说和章节补齐版本号和更新时间（详情页、阅读页的 ETag 和 Last-Modified 使用）"""
+    for name in ("novels", "chapters"):
+        result = db[name].update_many({"version": {"$exists": False}}, [{"$set": {
+            "version": 1,
+            "updateTime": {"$ifNull": ["$updateTime", "$createTime"]}
+        }}])
+        print(f"  ✓ {name}：{result.modified_count} 条")
+
+
+MIGRATIONS = [
+    Migration(1, "基础索引", indexes={
+        "users": [
+            ([("username", ASCENDING)], {"unique": True}),
+            ([("role", ASCENDING)], {}),
+        ],
+        "novels": [
+            ([("novelId", ASCENDING)], {"unique": True}),
+            ([("category", ASCENDING)], {}),
+            ([("status", ASCENDING)], {}),
+            ([("authorId", ASCENDING)], {}),
+            ([("createTime", DESCENDING)], {}),
+            ([("category", ASCENDING), ("status", ASCENDING)], {}),
+            # 游标分页索引：(筛选条件, 排序键, _id)
+            ([("status", ASCENDING), ("createTime", DESCENDING), ("_id", DESCENDING)], {}),
+            ([("status", ASCENDING), ("category", ASCENDING), ("createTime", DESCENDING), ("_id", DESCENDING)], {}),
+            ([("authorId", ASCENDING), ("createTime", DESCENDING), ("_id", DESCENDING)], {}),
+        ],
+        "orders": [
+            ([("orderId", ASCENDING)], {"unique": True}),
+            ([("readerId", ASCENDING)], {}),
+            ([("readerId", ASCENDING), ("createTime", DESCENDING), ("_id", DESCENDING)], {}),
+            ([("novelId", ASCENDING)], {}),
+            ([("status", ASCENDING), ("payTime", ASCENDING)], {}),
+        ],
+        "chapters": [
+            ([("novelId", ASCENDING), ("order", ASCENDING)], {"unique": True}),
+            ([("novelId", ASCENDING), ("chapterId", ASCENDING)], {"unique": True}),
+        ],
+        "comments": [
+            ([("novelId", ASCENDING), ("parentId", ASCENDING), ("createTime", DESCENDING), ("_id", DESCENDING)], {}),
+            ([("parentId", ASCENDING), ("createTime", ASCENDING)], {}),
+        ],
+        "search_terms": [
+            ([("term", ASCENDING), ("category", ASCENDING), ("novelId", ASCENDING)], {}),
+            ([("novelId", ASCENDING)], {}),
+        ],
+        "stats": [
+            ([("kind", ASCENDING), ("novelCount", DESCENDING)], {}),
+            ([("kind", ASCENDING), ("count", DESCENDING)], {}),
+        ],
+        "rollups": [
+            ([("scope", ASCENDING), ("key", ASCENDING), ("bucket", ASCENDING), ("granularity", ASCENDING)],
+             {"unique": True}),
+            ([("scope", ASCENDING), ("bucket", ASCENDING)], {}),
+            ([("granularity", ASCENDING), ("bucket", ASCENDING)], {}),
+        ],
+        "item_neighbours": [([("neighbours.novelId", ASCENDING)], {})],
+        "content_neighbours": [([("neighbours.novelId", ASCENDING)], {})],
+        "content_queue": [([("queuedAt", ASCENDING)], {})],
+        "import_jobs": [([("novelId", ASCENDING), ("createTime", DESCENDING)], {})],
+        "reading_records": [
+            ([("readerId", ASCENDING), ("novelId", ASCENDING)], {"unique": True}),
+            ([("readerId", ASCENDING), ("updateTime", DESCENDING), ("_id", DESCENDING)], {}),
+            ([("updateTime", ASCENDING)], {}),
+        ],
+    }),
+    Migration(2, "章节正文迁出小说文档", apply=split_chapters),
+    Migration(3, "评论迁出小说文档", apply=split_comments),
+    Migration(4, "热门排序索引", indexes={
+        "novels": [([("status", ASCENDING), ("readCount", DESCENDING), ("_id", DESCENDING)], {})],
+    }),
+    # 由 query_advisor.py 检查出的缺失索引
+    Migration(5, "购买检查、销量排行、用户列表索引", indexes={
+        "orders": [([("readerId", ASCENDING), ("novelId", ASCENDING), ("status", ASCENDING)], {})],
+        "novels": [([("status", ASCENDING), ("saleCount", DESCENDING), ("_id", DESCENDING)], {})],
+        "users": [([("status", ASCENDING), ("role", ASCENDING)], {})],
+    }),
+    Migration(6, "章节正文压缩存储", indexes={
+        "chapter_dicts": [([("novelId", ASCENDING)], {})],
+    }, apply=compress_chapters),
+    Migration(7, "小说与章节版本号", apply=add_versions),
+    # 搜索每个词项按权重读取前若干条（只读索引），再按(词项, 小说)查询候选的得分
+    Migration(8, "搜索词项权重索引", indexes={
+        "search_terms": [
+            ([("term", ASCENDING), ("weight", DESCENDING), ("novelId", DESCENDING)], {}),
+            ([("term", ASCENDING), ("category", ASCENDING), ("weight", DESCENDING), ("novelId", DESCENDING)], {}),
+            ([("term", ASCENDING), ("novelId", ASCENDING)], {}),
+        ],
+    }),
+    # 评论的回复按(时间, _id)倒序游标分页
+    Migration(9, "评论回复分页索引", indexes={
+        "comments": [([("parentId", ASCENDING), ("createTime", DESCENDING), ("_id", DESCENDING)], {})],
+    }),
+    # 书架按已支付订单游标分页
+    Migration(10, "已支付订单分页索引", indexes={
+        "orders": [([("readerId", ASCENDING), ("status", ASCENDING), ("createTime", DESCENDING), ("_id", DESCENDING)], {})],
+    }),
+    # 趋势分桶合并按批次号读取、删除小时桶
+    Migration(11, "分桶合并批次索引", indexes={
+        "rollups": [([("scope", ASCENDING), ("compacting", ASCENDING)],
+                     {"partialFilterExpression": {"compacting": {"$exists": True}}})],
+    }),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(db):
+    """数据库当前的结构版本，未执行过迁移时为0"""
+    doc = db.schema_version.find_one({"_id": SCHEMA_ID}, {"version": 1})
+    return doc['version'] if doc else 0
+
+
+def check_version(db):
+    """启动检查：数据库版本低于代码要求时抛出 SchemaVersionError
+
+    数据库版本高于代码（滚动发布期间旧进程仍在运行）时允许启动，新版本的迁移需保持向后兼容。
+    """
+    version = current_version(db)
+    if version < LATEST_VERSION:
+        raise SchemaVersionError(
+            f"数据库结构版本 {version} 低于代码要求的 {LATEST_VERSION}，请先执行 python migrations.py")
+    return version
+
+
+def pending(db, target=None):
+    """待执行的迁移"""
+    version = current_version(db)
+    target = LATEST_VERSION if target is None else target
+    return [m for m in MIGRATIONS if version < m.version <= target]
+
+
+def _acquire_lock(db, owner):
+    now = datetime.utcnow()
+    try:
+        db.schema_version.update_one({"_id": SCHEMA_ID}, {"$setOnInsert": {"version": 0, "history": []}},
+                                     upsert=True)
+    except DuplicateKeyError:
+        pass  # 其他进程同时插入
+    return db.schema_version.find_one_and_update(
+        {"_id": SCHEMA_ID, "$or": [{"lock": None}, {"lock.lockedAt": {"$lt": now - LOCK_TIMEOUT}}]},
+        {"$set": {"lock": {"owner": owner, "lockedAt": now}}}
+    ) is not None
+
+
+def migrate(db, target=None):
+    """执行到目标版本（默认最新），返回执行的迁移列表；其他进程正在迁移时抛出 SchemaVersionError"""
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    if not _acquire_lock(db, owner):
+        raise SchemaVersionError("其他进程正在执行迁移，请稍后重试")
+    applied = []
+    try:
+        for step in pending(db, target):
+            started = time.time()
+            print(f"执行迁移 {step.version}：{step.description}")
+            step.run(db)
+            db.schema_version.update_one({"_id": SCHEMA_ID}, {
+                "$set": {"version": step.version},
+                "$push": {"history": {
+                    "version": step.version,
+                    "description": step.description,
+                    "appliedAt": datetime.utcnow(),
+                    "seconds": round(time.time() - started, 3)
+                }}
+            })
+            applied.append(step)
+    finally:
+        db.schema_version.update_one({"_id": SCHEMA_ID, "lock.owner": owner}, {"$set": {"lock": None}})
+    return applied
+
+
+if __name__ == '__main__':
+    import sys
+    from pymongo import MongoClient
+    from config import Config
+
+    try:
+        db = MongoClient(Config.MONGODB_URI)[Config.MONGODB_DB]
+        command = sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].startswith('--') else 'apply'
+        target = int(sys.argv[sys.argv.index('--to') + 1]) if '--to' in sys.argv else None
+        steps = pending(db, target)
+
+        if command == 'status':
+            print(f"当前版本 {current_version(db)}，代码要求版本 {LATEST_VERSION}")
+            for step in steps:
+                print(f"  待执行 {step.version}：{step.description}")
+        elif command == 'plan':
+            for step in steps:
+                print(f"{step.version}：{step.description}")
+                for collection, specs in step.indexes.items():
+                    for keys, options in specs:
+                        print(f"  db.{collection}.createIndex({dict(keys)}, {options})")
+                if step.apply:
+                    print(f"  数据迁移：{step.apply.__doc__}")
+        elif command == 'check':
+            if steps:
+                print(f"✗ 有 {len(steps)} 个待执行的迁移（当前版本 {current_version(db)}）")
+                sys.exit(1)
+            print(f"✓ 数据库结构已是最新版本 {current_version(db)}")
+        else:
+            applied = migrate(db, target)
+            print(f"✓ 已执行 {len(applied)} 个迁移，当前版本 {current_version(db)}")
+    except (SchemaVersionError, ValueError) as e:
+        print(f"\n错误: {str(e)}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n错误: {str(e)}")
+        print("请确保 MongoDB 服务已启动，并检查连接配置。")
+        sys.exit(1)
@@ -1,60 +1,334 @@
-from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError
 from datetime import datetime
 from bson.objectid import ObjectId
-import bcrypt
+from bson import json_util
+from collections import OrderedDict
+import base64
+from itertools import islice
+import logging
+from search import SearchIndex
+from stats import StatsStore
+from rollups import RollupStore
+from similar import ContentIndex
+from chapter_codec import ChapterCodec
+from migrations import check_version
+from passwords import PasswordHasher, HasherBusy
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+def count_words(content):
+    """统计章节字数（不计空白字符）"""
+    return len(re.sub(r'\s', '', content or ''))
+
+
+def touch(update):
+    """为小说/章节的更新附加版本号递增和更新时间（页面的 ETag、Last-Modified 由此生成）"""
+    update = dict(update)
+    update['$inc'] = dict(update.get('$inc', {}), version=1)
+    update['$set'] = dict(update.get('$set', {}), updateTime=datetime.utcnow())
+    return update
+
+
+def touch_comments(update):
+    """为评论变化附加评论版本号递增和评论更新时间：只有详情页显示评论，阅读页的缓存不受影响"""
+    update = dict(update)
+    update['$inc'] = dict(update.get('$inc', {}), commentVersion=1)
+    update['$set'] = dict(update.get('$set', {}), commentTime=datetime.utcnow())
+    return update
+
+
+def encode_page_token(doc, sort_key, direction):
+    """将文档的(sort_key, _id)位置编码为不透明的分页游标"""
+    payload = json_util.dumps({"v": doc.get(sort_key), "id": doc['_id'], "d": direction})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_page_token(token):
+    """解析分页游标，返回(排序值, _id, 方向)，格式无效时返回None"""
+    try:
+        payload = json_util.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        if payload['d'] not in ('next', 'prev'):
+            return None
+        return payload['v'], ObjectId(payload['id']), payload['d']
+    except Exception:
+        return None
+
+
+def keyset_query(query, sort_key, cursor=None):
+    """构造游标分页的查询，返回(查询条件, 排序, 游标位置)，同步与异步模型共用"""
+    position = decode_page_token(cursor) if cursor else None
+    direction = position[2] if position else 'next'
+    
+    if position:
+        value, last_id, _ = position
+        op = "$lt" if direction == 'next' else "$gt"
+        query = {"$and": [query, {"$or": [
+            {sort_key: {op: value}},
+            {sort_key: value, "_id": {op: last_id}}
+        ]}]}
+    
+    order = DESCENDING if direction == 'next' else ASCENDING
+    return query, [(sort_key, order), ("_id", order)], position
+
+
+def keyset_result(docs, sort_key, limit, position):
+    """由多取一条的查询结果得到(文档列表, 下一页游标, 上一页游标)"""
+    direction = position[2] if position else 'next'
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    
+    if direction == 'next':
+        has_next, has_prev = has_more, position is not None
+    else:
+        docs.reverse()
+        has_next, has_prev = True, has_more
+    
+    next_cursor = encode_page_token(docs[-1], sort_key, 'next') if docs and has_next else None
+    prev_cursor = encode_page_token(docs[0], sort_key, 'prev') if docs and has_prev else None
+    return docs, next_cursor, prev_cursor
+
+
+def keyset_page(collection, query, sort_key, cursor=None, limit=12, projection=None):
+    """按(sort_key, _id)倒序做游标分页
+    
+    返回(文档列表, 下一页游标, 上一页游标)，没有下一页/上一页时对应游标为None。
+    每页只需一次索引范围扫描，翻到第几页代价都相同。
+    """
+    query, sort, position = keyset_query(query, sort_key, cursor)
+    docs = list(collection.find(query, projection).sort(sort).limit(limit + 1))
+    return keyset_result(docs, sort_key, limit, position)
+
+
+class BatchLoader:
+    """批量加载器
+    
+    收集待加载的ID，用一次$in查询取回，并在加载器生命周期内缓存结果，
+    避免循环中逐条查询（N+1问题）。
+    """
+    
+    def __init__(self, fetch_many):
+        # fetch_many: 接收ObjectId列表，返回文档列表
+        self.fetch_many = fetch_many
+        self.cache = {}
+    
+    def load_many(self, ids):
+        """按输入顺序返回文档，不存在的ID对应None"""
+        object_ids = [ObjectId(i) for i in ids]
+        missing = list({i for i in object_ids if i not in self.cache})
+        if missing:
+            for doc in self.fetch_many(missing):
+                self.cache[doc['_id']] = doc
+            for i in missing:
+                self.cache.setdefault(i, None)
+        return [self.cache[i] for i in object_ids]
+    
+    def load(self, id_):
+        """加载单个文档"""
+        return self.load_many([id_])[0]
+    
+    def prime(self, doc):
+        """将已查询到的文档放入缓存"""
+        self.cache[doc['_id']] = doc
+
+
+class TTLCache:
+    """进程内TTL+LRU缓存
+    
+    条目超过ttl秒即过期，容量满时淘汰最久未使用的条目；记录命中/未命中次数。
+    """
+    
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        """获取缓存值，不存在或已过期时返回None"""
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.data[key]
+            self.misses += 1
+            return None
+    
+    def set(self, key, value):
+        """写入缓存"""
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+    
+    def invalidate(self, key):
+        """使缓存条目失效"""
+        with self.lock:
+            self.data.pop(key, None)
+    
+    def stats(self):
+        """缓存统计信息"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+class SequenceAllocator:
+    """序列号分配器
+    
+    基于counters集合的find_one_and_update + $inc原子分配，多进程安全。
+    每个进程一次预取block_size个号段，号段用完前分配序列号无需访问数据库；
+    进程重启会跳过未用完的号段，序列号唯一但不保证连续。
+    """
+    
+    def __init__(self, db, block_size=20):
+        self.collection = db.get_collection('counters')
+        self.block_size = block_size
+        self.blocks = {}  # 序列名 -> [下一个可用值, 号段末尾值]
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+    
+    def _allocate_block(self, name, initial):
+        """从数据库预取一个号段"""
+        if self.collection.find_one({"_id": name}, {"_id": 1}) is None:
+            # 首次使用时以现有数据量为起点，避免与旧ID冲突
+            self.collection.update_one(
+                {"_id": name},
+                {"$setOnInsert": {"seq": initial() if initial else 0}},
+                upsert=True
+            )
+        counter = self.collection.find_one_and_update(
+            {"_id": name},
+            {"$inc": {"seq": self.block_size}},
+            return_document=ReturnDocument.AFTER
+        )
+        end = counter['seq']
+        return [end - self.block_size + 1, end]
+    
+    def next(self, name, initial=None):
+        """获取序列的下一个值，initial为计数器不存在时返回起始值的函数"""
+        with self.lock:
+            # fork出的子进程不能沿用父进程已预取的号段
+            if self.pid != os.getpid():
+                self.blocks = {}
+                self.pid = os.getpid()
+            block = self.blocks.get(name)
+            if block is None or block[0] > block[1]:
+                block = self.blocks[name] = self._allocate_block(name, initial)
+            value = block[0]
+            block[0] += 1
+            return value
+
+
+class LazyCollection:
+    """集合代理：每次访问时从当前进程的连接取得集合，模块导入时不建立连接"""
+    
+    def __init__(self, database, name):
+        self._database = database
+        self._name = name
+    
+    def __getattr__(self, attr):
+        return getattr(self._database.db[self._name], attr)
+
 
 class Database:
-    """数据库连接管理类"""
+    """数据库连接管理类
+    
+    MongoClient 在第一次访问时按进程创建：多进程服务器fork出的工作进程各自建立连接，
+    不共享父进程中的客户端。第一次连接时检查数据库结构版本（一次读取），
+    索引和数据迁移由 python migrations.py 执行。
+    """
     
     def __init__(self, uri, db_name):
         # 如果 uri 中没有用户名密码（本地开发模式），使用简单连接
         if not uri or uri == "mongodb://localhost:27017/novel_platform":
-            self.client = MongoClient('mongodb://localhost:27017/')
-        else:
-            self.client = MongoClient(uri)
-        self.db = self.client[db_name]
-        self._create_indexes()
-    
-    def _create_indexes(self):
-        """创建索引以提升查询效率"""
-        # users集合索引
-        self.db.users.create_index([("username", ASCENDING)], unique=True)
-        self.db.users.create_index([("role", ASCENDING)])
-        
-        # novels集合索引
-        self.db.novels.create_index([("novelId", ASCENDING)], unique=True)
-        self.db.novels.create_index([("category", ASCENDING)])
-        self.db.novels.create_index([("status", ASCENDING)])
-        self.db.novels.create_index([("authorId", ASCENDING)])
-        self.db.novels.create_index([("createTime", DESCENDING)])
-        # 复合索引用于多条件查询
-        self.db.novels.create_index([("category", ASCENDING), ("status", ASCENDING)])
-        
-        # orders集合索引
-        self.db.orders.create_index([("orderId", ASCENDING)], unique=True)
-        self.db.orders.create_index([("readerId", ASCENDING)])
-        self.db.orders.create_index([("novelId", ASCENDING)])
-        
-        # reading_records集合索引
-        self.db.reading_records.create_index([("readerId", ASCENDING), ("novelId", ASCENDING)], unique=True)
+            uri = 'mongodb://localhost:27017/'
+        self.uri = uri
+        self.db_name = db_name
+        self.lock = threading.Lock()
+        self.pid = None
+        self._client = None
+        self._db = None
+        self.schema_checked = False
+    
+    @property
+    def client(self):
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    client = MongoClient(self.uri)
+                    db = client[self.db_name]
+                    # 版本检查通过后才记录连接，检查失败时之后的每次访问都会重新检查
+                    if not self.schema_checked:
+                        try:
+                            check_version(db)
+                        except Exception:
+                            client.close()
+                            raise
+                        self.schema_checked = True
+                    self._client = client
+                    self._db = db
+                    self.pid = os.getpid()
+        return self._client
+    
+    @property
+    def db(self):
+        self.client
+        return self._db
+    
+    def close(self):
+        """关闭当前进程的连接（fork前调用，子进程会重新连接）"""
+        with self.lock:
+            if self._client is not None and self.pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._db = None
+            self.pid = None
     
     def get_collection(self, name):
         """获取集合"""
-        return self.db[name]
+        return LazyCollection(self, name)
 
 
 class UserModel:
     """用户数据模型"""
     
-    def __init__(self, db):
+    def __init__(self, db, cache_size=1024, cache_ttl=60, hasher=None):
         self.collection = db.get_collection('users')
+        # 密码哈希在有界线程池中执行，线程池已满时抛出 passwords.HasherBusy
+        self.hasher = hasher or PasswordHasher()
+        # 已登录用户（principal）缓存：多进程部署时其他进程的修改最多延迟cache_ttl秒生效
+        self.principal_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.stats = StatsStore(db)
     
     def create_user(self, username, password, role='reader', avatar=None, tags=None):
         """创建用户"""
         # 密码加密
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        hashed_password = self.hasher.hash(password)
         
-        user_doc = {
+        result = self.collection.insert_one(self._user_doc(username, hashed_password, role, avatar, tags))
+        self.stats.user_changed(role, 1)
+        return result.inserted_id
+    
+    def _user_doc(self, username, hashed_password, role, avatar=None, tags=None):
+        return {
             "username": username,
             "role": role,  # reader/creator/admin
             "password": hashed_password,
@@ -63,9 +337,43 @@ class UserModel:
             "status": 1,  # 1-正常，0-注销
             "createTime": datetime.utcnow()
         }
+    
+    def create_users(self, users):
+        """批量创建用户，users为(用户名, 密码, 角色)列表；密码并行哈希，用户名已存在的跳过，
+        列表中重复的用户名只创建第一个
         
-        result = self.collection.insert_one(user_doc)
-        return result.inserted_id
+        返回(创建数, 已存在的用户名列表, 重复的用户名列表)
+        """
+        unique = {}
+        duplicates = set()
+        for user in users:
+            if user[0] in unique:
+                duplicates.add(user[0])
+            else:
+                unique[user[0]] = user
+        existing = {doc['username'] for doc in self.collection.find(
+            {"username": {"$in": list(unique)}}, {"username": 1})}
+        users = [u for u in unique.values() if u[0] not in existing]
+        if not users:
+            return 0, sorted(existing), sorted(duplicates)
+        
+        hashed = self.hasher.hash_many([password for _, password, _ in users])
+        docs = [self._user_doc(username, h, role) for (username, _, role), h in zip(users, hashed)]
+        error = None
+        try:
+            self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # 无序写入时其余用户照常写入；检查之后被其他请求注册的用户名按已存在处理
+            error = e
+            failed = {err['index'] for err in e.details.get('writeErrors', [])}
+            existing.update(docs[i]['username'] for i in failed)
+            docs = [doc for i, doc in enumerate(docs) if i not in failed]
+        # 统计只计入实际写入的用户
+        for role in {doc['role'] for doc in docs}:
+            self.stats.user_changed(role, sum(1 for doc in docs if doc['role'] == role))
+        if error and any(err.get('code') != 11000 for err in error.details.get('writeErrors', [])):
+            raise error
+        return len(docs), sorted(existing), sorted(duplicates)
     
     def find_by_username(self, username):
         """根据用户名查找用户"""
@@ -75,24 +383,54 @@ class UserModel:
         """根据ID查找用户"""
         return self.collection.find_one({"_id": ObjectId(user_id), "status": 1})
     
+    def find_principal(self, user_id):
+        """查找已登录用户（不含密码），优先读取缓存"""
+        user = self.principal_cache.get(user_id)
+        if user is None:
+            user = self.collection.find_one({"_id": ObjectId(user_id), "status": 1}, {"password": 0})
+            if user is not None:
+                self.principal_cache.set(user_id, user)
+        return user
+    
+    def find_by_ids(self, user_ids):
+        """根据ID列表批量查找用户"""
+        return list(self.collection.find({"_id": {"$in": [ObjectId(i) for i in user_ids]}, "status": 1}))
+    
     def update_user(self, user_id, update_data):
         """更新用户信息"""
-        return self.collection.update_one(
+        result = self.collection.update_one(
             {"_id": ObjectId(user_id)},
             {"$set": update_data}
         )
+        self.principal_cache.invalidate(str(user_id))
+        return result
     
     def delete_user(self, user_id):
         """逻辑删除用户"""
-        return self.collection.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": {"status": 0}}
+        before = self.collection.find_one_and_update(
+            {"_id": ObjectId(user_id), "status": 1},
+            {"$set": {"status": 0}},
+            projection={"role": 1}
         )
+        if before:
+            self.stats.user_changed(before['role'], -1)
+        self.principal_cache.invalidate(str(user_id))
+        return before
     
     def verify_password(self, username, password):
         """验证用户密码"""
         user = self.find_by_username(username)
-        if user and bcrypt.checkpw(password.encode('utf-8'), user['password']):
+        if user and self.hasher.verify(password, user['password']):
+            # 计算成本配置变化后，用本次登录的明文透明地重新哈希
+            # （线程池已满时跳过，下次登录再处理）
+            if self.hasher.needs_rehash(user['password']):
+                try:
+                    self.collection.update_one(
+                        {"_id": user['_id'], "password": user['password']},
+                        {"$set": {"password": self.hasher.hash(password)}}
+                    )
+                except HasherBusy:
+                    pass
             return user
         return None
     
@@ -107,13 +445,42 @@ class UserModel:
 class NovelModel:
     """小说数据模型"""
     
-    def __init__(self, db):
+    # 卡片视图：列表页只需渲染的字段，不含目录和评论
+    CARD_FIELDS = ("novelId", "title", "authorId", "category", "tags", "intro", "cover",
+                   "price", "status", "review", "readCount", "saleCount", "chapterCount",
+                   "commentCount", "version", "createTime", "updateTime")
+    
+    # 评论版本：评论变化时递增，只有详情页的缓存校验使用
+    COMMENT_VERSION_FIELDS = {"commentVersion": 1, "commentTime": 1}
+    
+    # 命名投影：card-列表卡片，toc-卡片+目录，detail-详情页所需的全部字段
+    # （评论存放在comments集合，按页单独查询），version-详情页缓存校验所需的版本字段
+    PROJECTIONS = {
+        "version": dict({"status": 1, "version": 1, "updateTime": 1}, **COMMENT_VERSION_FIELDS),
+        "card": {field: 1 for field in CARD_FIELDS},
+        "toc": dict({field: 1 for field in CARD_FIELDS}, chapters=1),
+        "detail": dict({field: 1 for field in CARD_FIELDS}, chapters=1, **COMMENT_VERSION_FIELDS),
+    }
+    
+    def __init__(self, db, rollups=None):
         self.collection = db.get_collection('novels')
+        self.sequences = SequenceAllocator(db)
+        self.search_index = SearchIndex(db)
+        self.content_index = ContentIndex(db)
+        self.stats = StatsStore(db)
+        self.rollups = rollups or RollupStore(db)
+        self.count_cache = TTLCache(maxsize=256, ttl=60)
+    
+    def projection(self, view):
+        """获取命名投影，view为None时返回完整文档"""
+        if view is None:
+            return None
+        return self.PROJECTIONS[view]
     
     def generate_novel_id(self):
         """生成小说ID"""
-        count = self.collection.count_documents({})
-        return f"NOVEL{datetime.now().strftime('%Y%m%d')}{count+1:04d}"
+        seq = self.sequences.next('novelId', initial=lambda: self.collection.estimated_document_count())
+        return f"NOVEL{datetime.now().strftime('%Y%m%d')}{seq:04d}"
     
     def create_novel(self, title, author_id, category, tags, intro, cover=None, 
                     price=0.0, chapters=None):
@@ -128,20 +495,33 @@ class NovelModel:
             "cover": cover,
             "price": float(price),
             "status": "draft",  # draft/pending/online/rejected
-            "chapters": chapters or [],
-            "comments": [],
+            "chapters": chapters or [],  # 目录：仅含章节元数据，正文存于chapters集合
+            "chapterCount": len(chapters or []),
+            "chapterSeq": len(chapters or []),
+            "commentCount": 0,
             "review": None,
             "readCount": 0,
             "saleCount": 0,
+            "version": 1,  # 页面内容相关的修改时递增（阅读量、销量等计数除外）
             "createTime": datetime.utcnow()
         }
+        novel_doc['updateTime'] = novel_doc['createTime']
         
         result = self.collection.insert_one(novel_doc)
+        self.search_index.index_novel(result.inserted_id)
+        self.content_index.enqueue(result.inserted_id)
         return result.inserted_id
     
-    def find_by_id(self, novel_id):
-        """根据ID查找小说"""
-        return self.collection.find_one({"_id": ObjectId(novel_id)})
+    def find_by_id(self, novel_id, view=None):
+        """根据ID查找小说，view指定命名投影"""
+        return self.collection.find_one({"_id": ObjectId(novel_id)}, self.projection(view))
+    
+    def find_by_ids(self, novel_ids, view="card"):
+        """根据ID列表批量查找小说"""
+        return list(self.collection.find(
+            {"_id": {"$in": [ObjectId(i) for i in novel_ids]}},
+            self.projection(view)
+        ))
     
     def find_by_novel_id(self, novel_id):
         """根据小说ID查找"""
@@ -149,38 +529,17 @@ class NovelModel:
     
     def update_novel(self, novel_id, update_data):
         """更新小说信息"""
-        return self.collection.update_one(
-            {"_id": ObjectId(novel_id)},
-            {"$set": update_data}
-        )
-    
-    def add_chapter(self, novel_id, chapter_data):
-        """添加章节"""
-        return self.collection.update_one(
-            {"_id": ObjectId(novel_id)},
-            {"$push": {"chapters": chapter_data}}
-        )
-    
-    def update_chapter(self, novel_id, chapter_id, chapter_data):
-        """更新章节"""
-        return self.collection.update_one(
-            {"_id": ObjectId(novel_id), "chapters.chapterId": chapter_id},
-            {"$set": {"chapters.$": chapter_data}}
-        )
-    
-    def delete_chapter(self, novel_id, chapter_id):
-        """删除章节"""
-        return self.collection.update_one(
-            {"_id": ObjectId(novel_id)},
-            {"$pull": {"chapters": {"chapterId": chapter_id}}}
-        )
+        result = self.stats.update_novel(novel_id, touch({"$set": update_data}))
+        self.search_index.index_novel(novel_id)
+        self.content_index.enqueue(novel_id)
+        return result
     
     def submit_for_review(self, novel_id):
         """提交审核"""
-        return self.collection.update_one(
-            {"_id": ObjectId(novel_id)},
-            {"$set": {"status": "pending"}}
-        )
+        result = self.stats.update_novel(novel_id, touch({"$set": {"status": "pending"}}))
+        self.search_index.index_novel(novel_id)
+        self.content_index.enqueue(novel_id)
+        return result
     
     def review_novel(self, novel_id, admin_id, opinion, approved):
         """审核小说"""
@@ -190,47 +549,330 @@ class NovelModel:
             "opinion": opinion,
             "time": datetime.utcnow()
         }
-        return self.collection.update_one(
-            {"_id": ObjectId(novel_id)},
-            {"$set": {"status": status, "review": review_doc}}
-        )
+        result = self.stats.update_novel(novel_id, touch({"$set": {"status": status, "review": review_doc}}))
+        self.search_index.index_novel(novel_id)
+        self.content_index.enqueue(novel_id)
+        return result
     
     def find_novels(self, query=None, skip=0, limit=12, sort_by="createTime", 
-                   sort_order=DESCENDING):
-        """查询小说列表"""
+                   sort_order=DESCENDING, view="card"):
+        """查询小说列表，默认只返回卡片字段"""
         query = query or {}
-        cursor = self.collection.find(query).sort(sort_by, sort_order).skip(skip).limit(limit)
+        cursor = self.collection.find(query, self.projection(view))
+        cursor = cursor.sort(sort_by, sort_order).skip(skip).limit(limit)
         return list(cursor)
     
+    def find_novels_page(self, query=None, cursor=None, limit=12, sort_by="createTime", view="card"):
+        """游标分页查询小说列表，返回(小说列表, 下一页游标, 上一页游标)"""
+        return keyset_page(self.collection, query or {}, sort_by, cursor=cursor, limit=limit,
+                           projection=self.projection(view))
+    
     def count_novels(self, query=None):
         """统计小说数量"""
         query = query or {}
         return self.collection.count_documents(query)
     
+    def count_novels_cached(self, query=None):
+        """统计小说数量（结果缓存一段时间，用于列表页显示总数）"""
+        query = query or {}
+        if not query:
+            return self.collection.estimated_document_count()
+        key = json_util.dumps(query, sort_keys=True)
+        count = self.count_cache.get(key)
+        if count is None:
+            count = self.collection.count_documents(query)
+            self.count_cache.set(key, count)
+        return count
+    
+    def record_sale(self, novel_id):
+        """增加销量"""
+        result = self.stats.update_novel(novel_id, {"$inc": {"saleCount": 1}})
+        self.rollups.record({ObjectId(novel_id): {"sales": 1}})
+        return result
+    
     def increment_read_count(self, novel_id):
         """增加阅读量"""
-        return self.collection.update_one(
+        result = self.collection.update_one(
             {"_id": ObjectId(novel_id)},
             {"$inc": {"readCount": 1}}
         )
+        self.rollups.record({ObjectId(novel_id): {"reads": 1}})
+        self.stats.record_reads({ObjectId(novel_id): 1})
+        return result
+
+
+class ChapterModel:
+    """章节数据模型
+    
+    章节正文存放在独立的chapters集合中，以(novelId, order)为键；
+    小说文档的chapters字段只保留轻量目录（chapterId、标题、是否免费、字数）。
+    正文压缩存储，新旧格式共存，读写都通过本模型（见 chapter_codec.py）。
+    """
+    
+    # 目录条目保留的字段
+    TOC_FIELDS = ("chapterId", "order", "title", "isFree", "wordCount", "createTime")
+    
+    # 阅读页缓存校验和购买检查所需的字段（不含正文），页面未变化时不读取正文
+    VERSION_FIELDS = {"order": 1, "isFree": 1, "version": 1, "contentFormat": 1, "createTime": 1, "updateTime": 1}
+    
+    def __init__(self, db, codec=None):
+        self.collection = db.get_collection('chapters')
+        self.novels = db.get_collection('novels')
+        self.stats = StatsStore(db)
+        # 正文压缩存储，格式见 chapter_codec.py
+        self.codec = codec or ChapterCodec(db)
+    
+    @classmethod
+    def toc_entry(cls, chapter_doc):
+        """由章节文档生成目录条目"""
+        return {field: chapter_doc.get(field) for field in cls.TOC_FIELDS}
+    
+    def _next_order(self, novel_id, count=1):
+        """原子地为小说分配章节序号，返回(分配到的第一个序号, 小说当前的正文压缩字典_id)"""
+        novel = self.novels.find_one_and_update(
+            {"_id": ObjectId(novel_id)},
+            {"$inc": {"chapterSeq": count}},
+            projection={"chapterSeq": 1, "chapterDict": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return novel['chapterSeq'] - count + 1, novel.get('chapterDict')
     
-    def add_comment(self, novel_id, user_id, content):
-        """添加评论"""
-        # 获取用户信息
-        from pymongo import MongoClient
-        user = self.collection.database.users.find_one({"_id": ObjectId(user_id)})
+    def build_chapter(self, novel_id, order, chapter_data, dict_id=None):
+        """构建章节文档，章节ID由序号生成，正文按配置压缩"""
+        content = chapter_data.get('content') or ''
+        create_time = chapter_data.get('createTime') or datetime.utcnow()
+        return dict({
+            "novelId": ObjectId(novel_id),
+            "chapterId": f"CH{order:03d}",
+            "order": order,
+            "title": chapter_data.get('title'),
+            "isFree": bool(chapter_data.get('isFree', False)),
+            "wordCount": count_words(content),
+            "version": 1,
+            "createTime": create_time,
+            "updateTime": create_time
+        }, **self.codec.encode(content, dict_id))
+    
+    def add_chapter(self, novel_id, chapter_data):
+        """添加章节：写入正文并追加目录条目"""
+        order, dict_id = self._next_order(novel_id)
+        chapter_doc = self.build_chapter(novel_id, order, chapter_data, dict_id)
+        self.collection.insert_one(chapter_doc)
+        self.stats.update_novel(novel_id, touch({
+            "$push": {"chapters": self.toc_entry(chapter_doc)},
+            "$inc": {"chapterCount": 1}
+        }))
+        self._train_dictionary(novel_id)
+        return chapter_doc['chapterId']
+    
+    def add_chapters(self, novel_id, chapters, batch_size=200, progress=None, import_job_id=None):
+        """批量添加章节
+        
+        chapters可以是任意可迭代对象，每batch_size章一次insert_many写入正文、
+        一次$push/$each追加目录；progress(已导入章数)用于报告进度。
+        中途失败时回滚本次已写入的全部章节并重新抛出异常。
+        import_job_id记录在章节上，导入进程意外退出后可由rollback_import撤销。
+        """
+        chapters = iter(chapters)
+        chapter_ids = []  # 本次已分配的章节ID
+        try:
+            while True:
+                batch = list(islice(chapters, batch_size))
+                if not batch:
+                    break
+                first_order, dict_id = self._next_order(novel_id, len(batch))
+                chapter_docs = [self.build_chapter(novel_id, first_order + i, data, dict_id)
+                                for i, data in enumerate(batch)]
+                if import_job_id:
+                    for doc in chapter_docs:
+                        doc['importJobId'] = ObjectId(import_job_id)
+                # 先记录ID再写入，insert_many部分成功时也能回滚
+                chapter_ids.extend(doc['chapterId'] for doc in chapter_docs)
+                self.collection.insert_many(chapter_docs)
+                self.stats.update_novel(novel_id, touch({
+                    "$push": {"chapters": {"$each": [self.toc_entry(doc) for doc in chapter_docs]}},
+                    "$inc": {"chapterCount": len(chapter_docs)}
+                }))
+                if progress:
+                    progress(len(chapter_ids))
+        except Exception:
+            self.rollback_chapters(novel_id, chapter_ids)
+            raise
         
+        self._train_dictionary(novel_id)
+        return len(chapter_ids)
+    
+    def _train_dictionary(self, novel_id):
+        """章节数达到阈值时生成正文压缩字典，失败不影响已写入的章节"""
+        try:
+            self.codec.train_if_needed(novel_id)
+        except Exception:
+            logger.exception("生成小说 %s 的章节字典失败", novel_id)
+    
+    def rollback_chapters(self, novel_id, chapter_ids):
+        """撤销一批章节：删除正文及目录条目"""
+        if not chapter_ids:
+            return
+        self.collection.delete_many({"novelId": ObjectId(novel_id), "chapterId": {"$in": chapter_ids}})
+        # 只有已写入目录的章节需要扣减章节数
+        id_set = set(chapter_ids)
+        novel = self.novels.find_one({"_id": ObjectId(novel_id)}, {"chapters.chapterId": 1})
+        removed = sum(1 for c in (novel or {}).get('chapters', []) if c['chapterId'] in id_set)
+        self.stats.update_novel(novel_id, touch({
+            "$pull": {"chapters": {"chapterId": {"$in": chapter_ids}}},
+            "$inc": {"chapterCount": -removed}
+        }))
+    
+    def rollback_import(self, novel_id, job_id):
+        """撤销某个导入任务写入的全部章节"""
+        chapter_ids = self.collection.distinct("chapterId", {
+            "novelId": ObjectId(novel_id),
+            "importJobId": ObjectId(job_id)
+        })
+        self.rollback_chapters(novel_id, chapter_ids)
+        return len(chapter_ids)
+    
+    def find_chapter(self, novel_id, chapter_id):
+        """查找单个章节（含正文，压缩的正文在渲染时才解压）"""
+        return self.codec.load(self.collection.find_one({
+            "novelId": ObjectId(novel_id),
+            "chapterId": chapter_id
+        }))
+    
+    def find_chapter_version(self, novel_id, chapter_id):
+        """查找章节的版本字段（不含正文）"""
+        return self.collection.find_one({
+            "novelId": ObjectId(novel_id),
+            "chapterId": chapter_id
+        }, self.VERSION_FIELDS)
+    
+    def find_neighbours(self, novel_id, order):
+        """查找相邻的上一章和下一章（不含正文）"""
+        projection = {"content": 0}
+        prev_chapter = self.collection.find_one(
+            {"novelId": ObjectId(novel_id), "order": {"$lt": order}},
+            projection,
+            sort=[("order", DESCENDING)]
+        )
+        next_chapter = self.collection.find_one(
+            {"novelId": ObjectId(novel_id), "order": {"$gt": order}},
+            projection,
+            sort=[("order", ASCENDING)]
+        )
+        return prev_chapter, next_chapter
+    
+    def update_chapter(self, novel_id, chapter_id, chapter_data):
+        """更新章节正文及目录条目"""
+        content = chapter_data.get('content') or ''
+        novel = self.novels.find_one({"_id": ObjectId(novel_id)}, {"chapterDict": 1}) or {}
+        update_data = dict({
+            "title": chapter_data.get('title'),
+            "isFree": bool(chapter_data.get('isFree', False)),
+            "wordCount": count_words(content)
+        }, **self.codec.encode(content, novel.get('chapterDict')))
+        self.collection.update_one(
+            {"novelId": ObjectId(novel_id), "chapterId": chapter_id},
+            touch({"$set": update_data})
+        )
+        return self.novels.update_one(
+            {"_id": ObjectId(novel_id), "chapters.chapterId": chapter_id},
+            touch({"$set": {
+                "chapters.$.title": update_data['title'],
+                "chapters.$.isFree": update_data['isFree'],
+                "chapters.$.wordCount": update_data['wordCount']
+            }})
+        )
+    
+    def delete_chapter(self, novel_id, chapter_id):
+        """删除章节正文及目录条目"""
+        result = self.collection.delete_one({
+            "novelId": ObjectId(novel_id),
+            "chapterId": chapter_id
+        })
+        if result.deleted_count:
+            self.stats.update_novel(novel_id, touch({
+                "$pull": {"chapters": {"chapterId": chapter_id}},
+                "$inc": {"chapterCount": -1}
+            }))
+        return result
+
+
+class CommentModel:
+    """评论数据模型
+    
+    评论与回复存放在独立的comments集合中：顶层评论parentId为None，
+    回复的parentId指向所属评论。顶层评论的回复数、小说的评论数均冗余存储。
+    """
+    
+    def __init__(self, db):
+        self.collection = db.get_collection('comments')
+        self.novels = db.get_collection('novels')
+    
+    def add_comment(self, novel_id, user_id, username, content, parent_id=None):
+        """添加评论或回复"""
         comment_doc = {
+            "novelId": ObjectId(novel_id),
+            "parentId": ObjectId(parent_id) if parent_id else None,
             "userId": ObjectId(user_id),
-            "username": user['username'] if user else '匿名用户',
+            "username": username or '匿名用户',
             "content": content,
-            "createTime": datetime.utcnow(),
-            "replies": []
+            "replyCount": 0,
+            "createTime": datetime.utcnow()
         }
-        return self.collection.update_one(
-            {"_id": ObjectId(novel_id)},
-            {"$push": {"comments": comment_doc}}
-        )
+        result = self.collection.insert_one(comment_doc)
+        
+        # 评论和回复都显示在详情页，小说的评论版本号随之递增
+        if parent_id:
+            self.collection.update_one({"_id": ObjectId(parent_id)}, {"$inc": {"replyCount": 1}})
+            self.novels.update_one({"_id": ObjectId(novel_id)}, touch_comments({}))
+        else:
+            self.novels.update_one({"_id": ObjectId(novel_id)}, touch_comments({"$inc": {"commentCount": 1}}))
+        return result.inserted_id
+    
+    def find_comment(self, novel_id, comment_id):
+        """查找单条评论"""
+        return self.collection.find_one({
+            "_id": ObjectId(comment_id),
+            "novelId": ObjectId(novel_id)
+        })
+    
+    def find_comments(self, novel_id, cursor=None, limit=10, reply_limit=3):
+        """按时间倒序分页获取顶层评论，每条评论附带最新的reply_limit条回复
+        
+        返回(评论列表, 下一页游标, 上一页游标)。评论的replies按时间正序排列，
+        replies_cursor不为None时还有更早的回复，由find_replies继续分页读取。
+        """
+        comments, next_cursor, prev_cursor = keyset_page(
+            self.collection, {"novelId": ObjectId(novel_id), "parentId": None},
+            "createTime", cursor=cursor, limit=limit)
+        
+        # 每条评论只读取最新的几条回复，回复再多页面的查询量也不变
+        for comment in comments:
+            replies, replies_cursor = [], None
+            if comment.get('replyCount'):
+                replies, replies_cursor = self.find_replies(comment['_id'], limit=reply_limit)
+                replies.reverse()
+            comment['replies'] = replies
+            comment['replies_cursor'] = replies_cursor
+        
+        return comments, next_cursor, prev_cursor
+    
+    def find_replies(self, comment_id, cursor=None, limit=20):
+        """按时间倒序游标分页获取评论的回复，返回(回复列表, 更早回复的游标)"""
+        replies, next_cursor, _ = keyset_page(
+            self.collection, {"parentId": ObjectId(comment_id)}, "createTime", cursor=cursor, limit=limit)
+        return replies, next_cursor
+    
+    def delete_comment(self, comment):
+        """删除评论及其回复，并维护冗余计数"""
+        if comment.get('parentId'):
+            self.collection.delete_one({"_id": comment['_id']})
+            self.collection.update_one({"_id": comment['parentId']}, {"$inc": {"replyCount": -1}})
+            self.novels.update_one({"_id": comment['novelId']}, touch_comments({}))
+        else:
+            self.collection.delete_many({"parentId": comment['_id']})
+            self.collection.delete_one({"_id": comment['_id']})
+            self.novels.update_one({"_id": comment['novelId']}, touch_comments({"$inc": {"commentCount": -1}}))
 
 
 class OrderModel:
@@ -238,11 +880,13 @@ class OrderModel:
     
     def __init__(self, db):
         self.collection = db.get_collection('orders')
+        self.sequences = SequenceAllocator(db)
+        self.stats = StatsStore(db)
     
     def generate_order_id(self):
         """生成订单ID"""
-        count = self.collection.count_documents({})
-        return f"ORDER{datetime.now().strftime('%Y%m%d')}{count+1:04d}"
+        seq = self.sequences.next('orderId', initial=lambda: self.collection.estimated_document_count())
+        return f"ORDER{datetime.now().strftime('%Y%m%d')}{seq:04d}"
     
     def create_order(self, reader_id, novel_id, amount):
         """创建订单"""
@@ -257,6 +901,7 @@ class OrderModel:
         }
         
         result = self.collection.insert_one(order_doc)
+        self.stats.order_created()
         return result.inserted_id
     
     def find_by_id(self, order_id):
@@ -264,15 +909,32 @@ class OrderModel:
         return self.collection.find_one({"_id": ObjectId(order_id)})
     
     def pay_order(self, order_id):
-        """支付订单"""
-        return self.collection.update_one(
-            {"_id": ObjectId(order_id)},
+        """支付订单（只有待支付订单可以支付）"""
+        order = self.collection.find_one_and_update(
+            {"_id": ObjectId(order_id), "status": "pending"},
             {"$set": {"status": "paid", "payTime": datetime.utcnow()}}
         )
+        if order:
+            self.stats.order_paid(order['amount'])
+        return order
+    
+    def find_user_orders_page(self, reader_id, cursor=None, limit=10, status=None):
+        """游标分页查找用户订单（可按状态筛选），返回(订单列表, 下一页游标, 上一页游标)"""
+        query = {"readerId": ObjectId(reader_id)}
+        if status:
+            query["status"] = status
+        return keyset_page(self.collection, query, "createTime", cursor=cursor, limit=limit)
     
-    def find_user_orders(self, reader_id):
-        """查找用户订单"""
-        return list(self.collection.find({"readerId": ObjectId(reader_id)}).sort("createTime", DESCENDING))
+    def count_user_orders(self, reader_id):
+        """按状态统计用户订单数"""
+        counts = {"total": 0, "paid": 0, "pending": 0}
+        for stat in self.collection.aggregate([
+            {"$match": {"readerId": ObjectId(reader_id)}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ]):
+            counts[stat['_id']] = stat['count']
+            counts["total"] += stat['count']
+        return counts
     
     def check_purchased(self, reader_id, novel_id):
         """检查是否已购买"""
@@ -283,6 +945,69 @@ class OrderModel:
         }) is not None
 
 
+class ImportJobModel:
+    """章节导入任务数据模型"""
+    
+    def __init__(self, db):
+        self.collection = db.get_collection('import_jobs')
+    
+    def create_job(self, novel_id, author_id, filename, kind):
+        """创建导入任务"""
+        job_doc = {
+            "novelId": ObjectId(novel_id),
+            "authorId": ObjectId(author_id),
+            "filename": filename,
+            "kind": kind,  # txt/pdf
+            "status": "queued",  # queued/running/done/failed
+            "pagesTotal": 0,
+            "pagesProcessed": 0,
+            "chaptersFound": 0,
+            "error": None,
+            "worker": None,  # 执行任务的 主机名:进程号
+            "startedAt": None,
+            "heartbeatTime": datetime.utcnow(),  # 所在进程定时刷新，停止刷新说明进程已退出
+            "createTime": datetime.utcnow(),
+            "updateTime": datetime.utcnow()
+        }
+        result = self.collection.insert_one(job_doc)
+        return result.inserted_id
+    
+    def find_by_id(self, job_id):
+        """根据ID查找导入任务"""
+        return self.collection.find_one({"_id": ObjectId(job_id)})
+    
+    def update_job(self, job_id, update_data, status=None):
+        """更新导入任务状态，指定status时只在任务仍处于该状态时更新"""
+        update_data = dict(update_data, updateTime=datetime.utcnow())
+        query = {"_id": ObjectId(job_id)}
+        if status:
+            query["status"] = status
+        return self.collection.update_one(query, {"$set": update_data})
+    
+    def heartbeat(self, job_ids):
+        """刷新本进程中排队和执行中任务的心跳时间"""
+        if not job_ids:
+            return
+        self.collection.update_many(
+            {"_id": {"$in": list(job_ids)}, "status": {"$in": ["queued", "running"]}},
+            {"$set": {"heartbeatTime": datetime.utcnow()}}
+        )
+    
+    def fail_if_stale(self, job, max_age, error):
+        """任务的心跳超过max_age秒未刷新（所在进程已退出）时标记为失败，返回是否标记"""
+        if job['status'] not in ("queued", "running"):
+            return False
+        heartbeat = job.get('heartbeatTime') or job['updateTime']
+        if (datetime.utcnow() - heartbeat).total_seconds() < max_age:
+            return False
+        # 心跳时间未变才标记，避免与仍在执行的任务竞争
+        result = self.collection.update_one(
+            {"_id": job['_id'], "status": job['status'], "heartbeatTime": job.get('heartbeatTime')},
+            {"$set": {"status": "failed", "error": error, "updateTime": datetime.utcnow()}}
+        )
+        return result.modified_count == 1
+
+
 class ReadingRecordModel:
     """阅读记录数据模型"""
     
@@ -310,8 +1035,7 @@ class ReadingRecordModel:
             "novelId": ObjectId(novel_id)
         })
     
-    def get_user_reading_history(self, reader_id, limit=10):
-        """获取用户阅读历史"""
-        return list(self.collection.find(
-            {"readerId": ObjectId(reader_id)}
-        ).sort("updateTime", DESCENDING).limit(limit))
\ No newline at end of file
+    def get_reading_history_page(self, reader_id, cursor=None, limit=10):
+        """游标分页获取用户阅读历史，返回(记录列表, 下一页游标, 上一页游标)"""
+        return keyset_page(self.collection, {"readerId": ObjectId(reader_id)}, "updateTime",
+                           cursor=cursor, limit=limit)
\ No newline at end of file
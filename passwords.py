@@ -0,0 +1,92 @@
+"""
+密码哈希（bcrypt）
+bcrypt 每次计算需要数百毫秒，放在请求线程中执行时，登录高峰会占满工作进程的全部线程，其他页面也无法响应。
+这里把哈希和校验交给每个进程一个的有界线程池（bcrypt 计算期间释放 GIL，可以并行）：
+排队的任务超过上限时立即抛出 HasherBusy，由路由返回“请稍后重试”，而不是让请求线程一直等待。
+哈希的计算成本由 BCRYPT_ROUNDS 配置，登录时发现旧哈希的成本不同会透明地重新哈希。
+"""
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import bcrypt
+import os
+import threading
+
+
+class HasherBusy(Exception):
+    """密码哈希线程池已满，请稍后重试"""
+
+
+def hash_rounds(hashed):
+    """从bcrypt哈希中解析计算成本（$2b$12$...），无法解析时返回None"""
+    try:
+        return int(hashed.split(b'$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """有界线程池中的bcrypt哈希与校验"""
+
+    def __init__(self, rounds=12, threads=2, max_queue=16, timeout=10):
+        self.rounds = rounds
+        self.threads = threads
+        self.max_queue = max_queue
+        self.timeout = timeout  # 请求等待排队与计算的最长秒数
+        self.lock = threading.Lock()
+        self.pid = None
+        self.executor = None
+        self.slots = None
+
+    def _ensure_executor(self):
+        """按需创建线程池（fork后在子进程中重新创建）"""
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.executor = ThreadPoolExecutor(self.threads, thread_name_prefix='password-hash')
+                # 正在计算和排队的任务总数上限
+                self.slots = threading.BoundedSemaphore(self.threads + self.max_queue)
+                self.pid = os.getpid()
+
+    def _submit(self, fn, *args, block=False):
+        """提交任务到线程池；block=False时线程池已满立即抛出HasherBusy"""
+        self._ensure_executor()
+        slots = self.slots
+        if not slots.acquire(blocking=block):
+            raise HasherBusy()
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def _run(self, fn, *args):
+        """在线程池中执行fn并等待结果，超过timeout秒未完成时抛出HasherBusy"""
+        future = self._submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # 任务仍会执行完并释放名额，只是不再等待结果
+            raise HasherBusy()
+
+    def _hash(self, password):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds))
+
+    def hash(self, password):
+        """哈希密码"""
+        return self._run(self._hash, password)
+
+    def verify(self, password, hashed):
+        """校验密码"""
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed)
+
+    def needs_rehash(self, hashed):
+        """哈希的计算成本与当前配置不同时需要重新哈希"""
+        return hash_rounds(hashed) != self.rounds
+
+    def hash_many(self, passwords):
+        """并行哈希一批密码（批量创建用户），线程池已满时等待空位而不是拒绝"""
+        futures = [self._submit(self._hash, password, block=True) for password in passwords]
+        return [future.result() for future in futures]
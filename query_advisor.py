@@ -0,0 +1,361 @@
+"""
+查询形状登记与索引检查
+在独立的检查库中写入示例数据，用测试客户端以各角色访问页面、执行离线任务，
+通过 pymongo 命令监听记录期间发出的每一种查询形状（条件中的取值替换为 ?），
+再对每种形状的一条样例执行 explain("executionStats")，标出：
+  - COLLSCAN    带条件的查询没有可用索引，退化为全表扫描
+  - SORT        排序没有索引支持，在内存中排序
+  - 扫描比      扫描的文档数远大于返回的文档数
+并按“等值 - 排序 - 范围”的顺序给出建议的复合索引。
+
+  python query_advisor.py              输出报告
+  python query_advisor.py --check      有查询退化为全表扫描或内存排序时以状态码1退出（用于CI）
+  python query_advisor.py --scale 500  示例数据规模（小说数，默认200）
+  python query_advisor.py --keep       保留检查库
+
+需要真实的 MongoDB（mongomock 不支持 explain）。检查库为 <MONGODB_DB>_advisor，先执行全部迁移再写入数据，
+检查的就是迁移定义的索引。确认可以接受的问题登记在 ACCEPTED 中，--check 时不计为失败。
+测试 tests/test_query_shapes.py 以 --check 执行本检查，新增的查询形状退化时测试失败（MongoDB 不可用时跳过）。
+"""
+
+from pymongo import monitoring
+from datetime import datetime, timedelta
+import copy
+import json
+import os
+import random
+
+# 可以解释执行计划的命令
+EXPLAINABLE = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+
+# 样例命令中不能出现在 explain 里的字段
+SESSION_FIELDS = {"lsid", "$db", "$clusterTime", "txnNumber", "$readPreference", "readConcern",
+                  "writeConcern", "startTransaction", "autocommit", "apiVersion", "apiStrict"}
+
+# 扫描文档数超过返回文档数的倍数（且扫描数不少于 MIN_EXAMINED）时提示
+EXAMINED_RATIO = 10
+MIN_EXAMINED = 100
+
+# 确认可以接受的问题：查询形状 -> 原因
+ACCEPTED = {}
+
+
+def shape_of(value):
+    """把查询条件中的取值替换为?，保留字段名和操作符"""
+    if isinstance(value, dict):
+        return {k: shape_of(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = [shape_of(v) for v in value]
+        # $in 等取值列表只保留一个元素的形状，条件列表（$and/$or、聚合管道）全部保留
+        if shapes and all(not isinstance(s, dict) for s in shapes):
+            return [shapes[0]]
+        return shapes
+    return "?"
+
+
+def command_filter(command):
+    """命令的(查询条件, 排序)"""
+    name = next(iter(command))
+    if name == "find":
+        return command.get("filter") or {}, command.get("sort")
+    if name in ("count", "distinct", "findAndModify"):
+        return command.get("query") or {}, command.get("sort")
+    if name == "update":
+        return command["updates"][0].get("q") or {}, None
+    if name == "delete":
+        return command["deletes"][0].get("q") or {}, None
+    if name == "aggregate":
+        pipeline = command.get("pipeline") or []
+        match = pipeline[0].get("$match", {}) if pipeline else {}
+        sort = None
+        rest = pipeline[1:] if match else pipeline
+        if rest and "$sort" in rest[0]:
+            sort = rest[0]["$sort"]
+        return match, sort
+    return {}, None
+
+
+class ShapeRecorder(monitoring.CommandListener):
+    """记录查询形状：形状 -> {样例命令, 次数}"""
+
+    def __init__(self, database_name):
+        self.database_name = database_name
+        self.enabled = False
+        self.shapes = {}
+
+    def _record(self, command):
+        name = next(iter(command))
+        collection = command[name]
+        if name == "aggregate":
+            body = shape_of(command.get("pipeline"))
+        elif name == "distinct":
+            body = {"key": command.get("key"), "query": shape_of(command.get("query") or {})}
+        else:
+            query, sort = command_filter(command)
+            body = {"filter": shape_of(query), "sort": sort}
+        key = f"{collection}.{name} {json.dumps(body, ensure_ascii=False, sort_keys=False, default=str)}"
+        entry = self.shapes.setdefault(key, {"command": command, "count": 0})
+        entry["count"] += 1
+
+    def started(self, event):
+        if not self.enabled or event.database_name != self.database_name:
+            return
+        if event.command_name not in EXPLAINABLE:
+            return
+        command = {k: copy.deepcopy(v) for k, v in event.command.items() if k not in SESSION_FIELDS}
+        # 批量更新/删除按语句拆开，每条语句单独记录
+        if event.command_name in ("update", "delete"):
+            field = "updates" if event.command_name == "update" else "deletes"
+            for statement in command.get(field, []):
+                self._record(dict(command, **{field: [statement]}))
+        else:
+            self._record(command)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def plan_stages(plan):
+    """执行计划树中的全部阶段名"""
+    if not plan:
+        return []
+    plan = plan.get("queryPlan", plan)
+    stages = [plan.get("stage")]
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            stages += plan_stages(child)
+    return stages
+
+
+def explain_summary(explain):
+    """从explain结果中取出(阶段列表, 返回数, 扫描文档数, 扫描索引键数)"""
+    if "stages" in explain and "queryPlanner" not in explain:
+        # 聚合管道：第一个阶段是下推到查询层的 $cursor
+        explain = explain["stages"][0].get("$cursor", {})
+    planner = explain.get("queryPlanner", {})
+    stats = explain.get("executionStats", {})
+    return (plan_stages(planner.get("winningPlan")), stats.get("nReturned", 0),
+            stats.get("totalDocsExamined", 0), stats.get("totalKeysExamined", 0))
+
+
+def suggest_index(query, sort=None):
+    """按“等值 - 排序 - 范围”的顺序建议复合索引，无法建议时返回None"""
+    equality, ranges = [], []
+    clauses = list(query.items())
+    while clauses:
+        field, condition = clauses.pop(0)
+        if field == "$and":
+            for sub in condition:
+                clauses += list(sub.items())
+            continue
+        if field == "$or":
+            # 游标分页的 (排序键 < 值) 或 (排序键 = 值 且 _id < 值) 由排序键覆盖，其他 $or 需要为每个分支分别建索引
+            if all(f in (sort or {}) for branch in condition for f in branch):
+                continue
+            return None
+        if field.startswith("$"):
+            return None
+        if isinstance(condition, dict) and any(k.startswith("$") for k in condition):
+            target = equality if set(condition) <= {"$eq", "$in"} else ranges
+        else:
+            target = equality
+        if field not in equality and field not in ranges:
+            target.append(field)
+
+    keys = [(field, 1) for field in equality]
+    for field, direction in (sort or {}).items():
+        if field not in equality:
+            keys.append((field, direction))
+    keys += [(field, 1) for field in ranges if field not in dict(keys)]
+    if not keys or keys == [("_id", 1)]:
+        return None
+    return keys
+
+
+def analyze(command, explain):
+    """分析一种查询形状，返回问题列表 [(级别, 说明)] 和建议索引"""
+    name = next(iter(command))
+    query, sort = command_filter(command)
+    stages, returned, docs_examined, keys_examined = explain_summary(explain)
+    issues = []
+
+    if "EOF" in stages and len(stages) == 1:
+        issues.append(("info", "集合为空，未能检查"))
+    if "COLLSCAN" in stages:
+        if query:
+            issues.append(("error", "全表扫描（COLLSCAN）"))
+        else:
+            issues.append(("info", "无条件读取全部文档"))
+    if "SORT" in stages:
+        issues.append(("error", "内存排序（SORT）"))
+    if name in ("find", "aggregate") and docs_examined >= MIN_EXAMINED \
+            and docs_examined > EXAMINED_RATIO * max(returned, 1):
+        issues.append(("warning", f"扫描 {docs_examined} 个文档只返回 {returned} 个"))
+
+    suggestion = None
+    if any(level != "info" for level, _ in issues):
+        suggestion = suggest_index(query, sort)
+    return issues, suggestion
+
+
+def explain(db, command):
+    return db.command({"explain": command, "verbosity": "executionStats"})
+
+
+def seed(db, scale):
+    """在初始化数据基础上批量写入示例小说、读者、订单、阅读记录和评论"""
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    categories = ["玄幻", "都市", "科幻", "历史", "言情", "悬疑"]
+    creators = [u['_id'] for u in db.users.find({"role": "creator"}, {"_id": 1})]
+    readers = db.users.insert_many([{
+        "username": f"advisor_reader_{i}", "role": "reader", "password": b"", "avatar": None,
+        "tags": rng.sample(categories, 2), "status": 1, "createTime": now
+    } for i in range(scale // 2)]).inserted_ids
+
+    novels = []
+    for i in range(scale):
+        status = rng.choice(["online"] * 8 + ["pending", "draft"])
+        novels.append({
+            "novelId": f"ADVISOR{i:06d}", "title": f"示例小说{i}", "authorId": rng.choice(creators),
+            "category": rng.choice(categories), "tags": rng.sample(categories, 2), "intro": "示例简介",
+            "cover": None, "price": 9.9, "status": status, "chapters": [], "chapterCount": 0, "chapterSeq": 0,
+            "commentCount": 0, "review": None, "readCount": rng.randint(0, 10000),
+            "saleCount": rng.randint(0, 500), "createTime": now - timedelta(minutes=i)
+        })
+    novel_ids = db.novels.insert_many(novels).inserted_ids
+
+    orders, records, comments = [], [], []
+    for reader in readers:
+        for novel_id in rng.sample(novel_ids, min(10, len(novel_ids))):
+            orders.append({
+                "orderId": f"ADVISOR{len(orders):08d}", "readerId": reader, "novelId": novel_id, "amount": 9.9,
+                "status": rng.choice(["paid", "paid", "pending"]), "createTime": now, "payTime": now
+            })
+            records.append({"readerId": reader, "novelId": novel_id, "currentChapterId": "CH001",
+                            "page": 0, "updateTime": now - timedelta(minutes=rng.randint(0, 10000))})
+            comments.append({"novelId": novel_id, "parentId": None, "userId": reader, "username": "示例读者",
+                             "content": "示例评论", "replyCount": 0, "createTime": now})
+    db.orders.insert_many(orders)
+    db.reading_records.insert_many(records)
+    db.comments.insert_many(comments)
+
+
+def exercise(app_module):
+    """以各角色访问页面并执行离线任务，产生查询"""
+    app = app_module.app
+    app.config['TESTING'] = True
+    client = app.test_client()
+    db = app_module.db.db
+    novel = db.novels.find_one({"status": "online", "chapterCount": {"$gt": 0}}) \
+        or db.novels.find_one({"status": "online"})
+    novel_id = str(novel['_id'])
+    chapter_id = novel['chapters'][0]['chapterId'] if novel.get('chapters') else 'CH001'
+    category = novel.get('category') or ''
+
+    def visit(url, method='get', **kwargs):
+        response = getattr(client, method)(url, **kwargs)
+        if response.status_code >= 400:
+            print(f"访问 {url} 返回 {response.status_code}，该页面的查询可能未被记录")
+        return response
+
+    def login(username, password):
+        visit('/logout')
+        visit('/login', 'post', data={'username': username, 'password': password})
+
+    login('读者小红', 'reader123')
+    for url in ['/', '/reader/dashboard', '/reader/novels', f'/reader/novels?category={category}',
+                '/reader/novels?keyword=示例', f'/reader/novels/{novel_id}',
+                f'/reader/novels/{novel_id}/read/{chapter_id}', '/reader/orders', '/reader/recommendations']:
+        visit(url)
+    first_page = visit('/reader/novels').get_data(as_text=True)
+    if 'cursor=' in first_page:
+        cursor = first_page.split('cursor=', 1)[1].split('"', 1)[0].split('&', 1)[0]
+        visit(f'/reader/novels?cursor={cursor}')
+    visit(f'/reader/novels/{novel_id}/comment', 'post', data={'content': '检查'})
+    visit(f'/reader/novels/{novel_id}/purchase', 'post')
+
+    login('作家小明', 'creator123')
+    author_novel = db.novels.find_one({"authorId": db.users.find_one({"username": '作家小明'})['_id']})
+    for url in ['/creator/dashboard', '/creator/novels', f'/creator/novels/{author_novel["_id"]}/chapters',
+                f'/stats/trends?scope=novel&key={author_novel["_id"]}']:
+        visit(url)
+
+    login('admin', 'admin123')
+    for url in ['/admin/dashboard', '/admin/users', '/admin/review', '/admin/statistics']:
+        visit(url)
+
+    # 离线任务
+    app_module.activity_buffer.flush()
+    app_module.novel_model.stats.reconcile()
+    app_module.novel_model.rollups.compact()
+    try:
+        from recommend import ItemCF
+        from similar import ContentIndex
+        ItemCF(app_module.db).rebuild()
+        ContentIndex(app_module.db).rebuild()
+    except ImportError:
+        print("未安装 numpy/scipy，跳过推荐离线任务")
+
+
+def report(db, recorder):
+    """explain全部形状并打印报告，返回未接受的错误数"""
+    failures = 0
+    for key, entry in sorted(recorder.shapes.items()):
+        command = entry["command"]
+        try:
+            issues, suggestion = analyze(command, explain(db, command))
+        except Exception as e:
+            issues, suggestion = [("warning", f"explain 失败：{e}")], None
+        errors = [msg for level, msg in issues if level == "error"]
+        if errors and key not in ACCEPTED:
+            failures += 1
+        mark = "✗" if errors else ("!" if any(level == "warning" for level, _ in issues) else "✓")
+        print(f"{mark} {key}  ×{entry['count']}")
+        for level, message in issues:
+            print(f"    [{level}] {message}")
+        if key in ACCEPTED:
+            print(f"    已接受：{ACCEPTED[key]}")
+        if suggestion:
+            collection = key.split('.', 1)[0]
+            print(f"    建议索引：db.{collection}.createIndex({dict(suggestion)})")
+    print(f"\n共 {len(recorder.shapes)} 种查询形状，{failures} 种存在全表扫描或内存排序")
+    return failures
+
+
+def main(argv):
+    scale = int(argv[argv.index('--scale') + 1]) if '--scale' in argv else 200
+    database_name = os.environ.get('MONGODB_DB', 'novel_platform') + '_advisor'
+    # 配置、初始化脚本和应用都从环境变量读取库名，需在导入前设置
+    os.environ['MONGODB_DB'] = database_name
+    recorder = ShapeRecorder(database_name)
+    monitoring.register(recorder)
+
+    import init_data
+    init_data.init_database()
+    import app as app_module
+    db = app_module.db.db
+    try:
+        seed(db, scale)
+        recorder.enabled = True
+        exercise(app_module)
+        recorder.enabled = False
+        return report(db, recorder)
+    finally:
+        if '--keep' not in argv:
+            app_module.db.client.drop_database(database_name)
+
+
+if __name__ == '__main__':
+    import sys
+
+    try:
+        failures = main(sys.argv)
+        sys.exit(1 if failures and '--check' in sys.argv else 0)
+    except Exception as e:
+        print(f"\n错误: {str(e)}")
+        print("请确保 MongoDB 服务已启动，并检查连接配置。")
+        sys.exit(1)
@@ -0,0 +1,234 @@
+"""
+基于物品的协同过滤（离线计算）
+从已支付订单和阅读记录构建 读者×小说 稀疏交互矩阵（阅读权重1，购买权重3，两者都有时相加），
+按列归一化后分块计算小说之间的余弦相似度，每部小说只保留最相似的 top_k 部，
+写入 item_neighbours 集合；推荐时只需读取读者历史小说的近邻列表并加权合并。
+
+全量重建：python recommend.py
+增量刷新：python recommend.py --refresh
+  读取上次计算后有新行为的读者，从源数据重新加载这些读者的整行交互，
+  替换矩阵中对应的行后只重算受影响小说的近邻列表。矩阵状态保存在 state_path。
+近邻列表的对称性只在全量重建时保证，建议每天全量重建一次、每小时增量刷新一次。
+
+矩阵计算依赖 numpy/scipy，只在离线任务中导入，Web 进程只读取近邻列表。
+"""
+
+from pymongo import ReplaceOne
+from bson.objectid import ObjectId
+from datetime import datetime, timedelta
+import os
+
+# 交互权重
+READ_WEIGHT = 1.0
+PURCHASE_WEIGHT = 3.0
+
+# 增量刷新时回看的重叠时间，覆盖写缓冲尚未落库的阅读记录
+REFRESH_OVERLAP = timedelta(minutes=10)
+
+
+def pack_ids(ids):
+    """ObjectId列表按12字节一行打包为uint8矩阵，便于随矩阵状态一起保存"""
+    import numpy as np
+    return np.frombuffer(b''.join(i.binary for i in ids), dtype=np.uint8).reshape(-1, 12)
+
+
+def unpack_ids(packed):
+    return [ObjectId(row.tobytes()) for row in packed]
+
+
+def merge_neighbours(collection, history, exclude=(), limit=6):
+    """按历史 {小说_id: 权重} 加权合并近邻列表，返回按得分排序的小说_id列表"""
+    if not history:
+        return []
+    excluded = set(exclude) | set(history)
+    scores = {}
+    for doc in collection.find({"_id": {"$in": list(history)}}):
+        weight = history[doc['_id']]
+        for neighbour in doc['neighbours']:
+            novel_id = neighbour['novelId']
+            if novel_id not in excluded:
+                scores[novel_id] = scores.get(novel_id, 0) + weight * neighbour['score']
+    return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+
+class ItemCF:
+    """物品协同过滤"""
+
+    def __init__(self, db, top_k=20, block_size=1024, state_path=None):
+        self.collection = db.get_collection('item_neighbours')
+        self.orders = db.get_collection('orders')
+        self.reading_records = db.get_collection('reading_records')
+        self.top_k = top_k
+        self.block_size = block_size
+        self.state_path = state_path
+
+    # ---------- 离线计算 ----------
+
+    def iter_interactions(self, reader_ids=None):
+        """产出(读者_id, 小说_id, 权重)，reader_ids不为空时只读取这些读者"""
+        query = {"readerId": {"$in": list(reader_ids)}} if reader_ids is not None else {}
+        for order in self.orders.find(dict(query, status="paid"), {"readerId": 1, "novelId": 1}):
+            yield order['readerId'], order['novelId'], PURCHASE_WEIGHT
+        for record in self.reading_records.find(query, {"readerId": 1, "novelId": 1}):
+            yield record['readerId'], record['novelId'], READ_WEIGHT
+
+    @staticmethod
+    def build_matrix(interactions, readers=None, novels=None):
+        """将交互转换为CSR矩阵，readers/novels为 _id->行/列号 的映射（会追加新的读者和小说）"""
+        import numpy as np
+        from scipy import sparse
+        from array import array
+
+        readers = {} if readers is None else readers
+        novels = {} if novels is None else novels
+        rows, cols, data = array('i'), array('i'), array('f')
+        for reader_id, novel_id, weight in interactions:
+            rows.append(readers.setdefault(reader_id, len(readers)))
+            cols.append(novels.setdefault(novel_id, len(novels)))
+            data.append(weight)
+
+        shape = (len(readers), len(novels))
+        matrix = sparse.coo_matrix(
+            (np.frombuffer(data, dtype=np.float32),
+             (np.frombuffer(rows, dtype=np.int32), np.frombuffer(cols, dtype=np.int32))),
+            shape=shape)
+        # 重复的(读者, 小说)交互权重相加
+        return matrix.tocsr(), readers, novels
+
+    def top_neighbours(self, matrix, items=None):
+        """分块计算指定列（默认全部）的top_k余弦近邻，产出(列号, 近邻列号数组, 相似度数组)"""
+        import numpy as np
+        from scipy import sparse
+
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+        inv_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        normalized = (matrix @ sparse.diags(inv_norms.astype(np.float32))).tocsc()
+        transposed = normalized.T.tocsr()
+
+        items = np.arange(matrix.shape[1]) if items is None else np.asarray(items)
+        for start in range(0, len(items), self.block_size):
+            block = items[start:start + self.block_size]
+            # (块大小 × 读者) @ (读者 × 小说) -> 该块小说与全部小说的相似度
+            similarity = (transposed[block] @ normalized).tocsr()
+            for i, item in enumerate(block):
+                lo, hi = similarity.indptr[i], similarity.indptr[i + 1]
+                neighbours = similarity.indices[lo:hi]
+                scores = similarity.data[lo:hi]
+                keep = (neighbours != item) & (scores > 0)
+                neighbours, scores = neighbours[keep], scores[keep]
+                if len(scores) > self.top_k:
+                    top = np.argpartition(-scores, self.top_k)[:self.top_k]
+                    neighbours, scores = neighbours[top], scores[top]
+                order = np.argsort(-scores, kind='stable')
+                yield item, neighbours[order], scores[order]
+
+    def _save_neighbours(self, matrix, novel_ids, items=None):
+        """计算并写入近邻列表，返回写入的小说数"""
+        now = datetime.utcnow()
+        ops = []
+        count = 0
+        for item, neighbours, scores in self.top_neighbours(matrix, items):
+            ops.append(ReplaceOne({"_id": novel_ids[item]}, {
+                "neighbours": [{"novelId": novel_ids[n], "score": round(float(s), 6)}
+                               for n, s in zip(neighbours, scores)],
+                "updateTime": now
+            }, upsert=True))
+            if len(ops) >= 1000:
+                self.collection.bulk_write(ops, ordered=False)
+                count += len(ops)
+                ops = []
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+            count += len(ops)
+        return count
+
+    def _save_state(self, matrix, readers, novels, watermark):
+        import numpy as np
+
+        if not self.state_path:
+            return
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        np.savez_compressed(
+            self.state_path,
+            data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+            shape=np.array(matrix.shape),
+            readers=pack_ids(readers),
+            novels=pack_ids(novels),
+            watermark=np.array([watermark.isoformat()]))
+
+    def _load_state(self):
+        import numpy as np
+        from scipy import sparse
+
+        state = np.load(self.state_path)
+        matrix = sparse.csr_matrix((state['data'], state['indices'], state['indptr']),
+                                   shape=tuple(state['shape']))
+        readers = {reader_id: i for i, reader_id in enumerate(unpack_ids(state['readers']))}
+        novels = {novel_id: i for i, novel_id in enumerate(unpack_ids(state['novels']))}
+        return matrix, readers, novels, datetime.fromisoformat(str(state['watermark'][0]))
+
+    def rebuild(self):
+        """全量重建交互矩阵和全部近邻列表，返回写入的小说数"""
+        started = datetime.utcnow()
+        matrix, readers, novels = self.build_matrix(self.iter_interactions())
+        novel_ids = list(novels)
+        count = self._save_neighbours(matrix, novel_ids)
+        # 清除已没有任何交互的小说的近邻列表
+        self.collection.delete_many({"updateTime": {"$lt": started}})
+        self._save_state(matrix, readers, novels, started)
+        return count
+
+    def refresh(self):
+        """增量刷新：替换有新行为的读者所在行，只重算受影响小说的近邻，返回更新的小说数"""
+        import numpy as np
+        from scipy import sparse
+
+        if not self.state_path or not os.path.exists(self.state_path):
+            return self.rebuild()
+
+        started = datetime.utcnow()
+        matrix, readers, novels, watermark = self._load_state()
+        since = watermark - REFRESH_OVERLAP
+        changed = set(self.orders.distinct("readerId", {"status": "paid", "payTime": {"$gte": since}}))
+        changed.update(self.reading_records.distinct("readerId", {"updateTime": {"$gte": since}}))
+        if not changed:
+            self._save_state(matrix, readers, novels, started)
+            return 0
+
+        # 重新加载这些读者的全部交互（新的读者和小说追加到映射末尾）
+        new_rows, readers, novels = self.build_matrix(self.iter_interactions(changed), readers, novels)
+        shape = new_rows.shape
+        matrix.resize(shape)
+        # 清空旧矩阵中这些读者的行，再叠加新加载的行
+        keep = np.ones(shape[0], dtype=np.float32)
+        keep[[readers[r] for r in changed if r in readers]] = 0
+        old_items = matrix[keep == 0].indices
+        matrix = (sparse.diags(keep) @ matrix + new_rows).tocsr()
+        matrix.eliminate_zeros()
+
+        affected = np.unique(np.concatenate([old_items, new_rows.indices]))
+        count = self._save_neighbours(matrix, list(novels), affected)
+        self._save_state(matrix, readers, novels, started)
+        return count
+
+    # ---------- 在线推荐 ----------
+
+    def recommend(self, history, exclude=(), limit=6):
+        """根据读者历史 {小说_id: 权重} 合并近邻列表，返回按得分排序的小说_id列表"""
+        return merge_neighbours(self.collection, history, exclude, limit)
+
+if __name__ == '__main__':
+    import sys
+    from config import Config
+    from models import Database
+
+    try:
+        database = Database(Config.MONGODB_URI, Config.MONGODB_DB)
+        cf = ItemCF(database, Config.RECOMMEND_TOP_K, state_path=Config.RECOMMEND_STATE_PATH)
+        if '--refresh' in sys.argv:
+            print(f"✓ 已增量刷新 {cf.refresh()} 部小说的相似列表")
+        else:
+            print(f"✓ 已重建 {cf.rebuild()} 部小说的相似列表")
+    except Exception as e:
+        print(f"\n错误: {str(e)}")
+        print("请确保 MongoDB 服务已启动，并检查连接配置。")
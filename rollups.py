@@ -0,0 +1,174 @@
+"""
+阅读量/销量按时间分桶汇总（rollups 集合）
+每条文档是某个维度在一个时间桶内的计数：
+  scope        维度：site（全站）/ novel / category / author
+  key          维度取值：all / 小说_id / 分类名 / 作者_id
+  granularity  hour / day
+  bucket       桶起始时间（UTC）
+阅读量随写缓冲批量写入小时桶，销量在购买时写入；超过保留期的小时桶由 compact()
+合并为日桶。查询一段时间的趋势只需按 (scope, key, bucket) 做一次范围查询。
+
+合并可以在任意一步中断后重新执行：先给一天一个维度的小时桶打上合并批次号（compacting），
+日桶记录已累加过的批次号（compactions），累加时跳过已记录的批次，最后按批次号删除小时桶。
+重新执行时先完成遗留的批次，不会重复累加，也不会丢失计数。
+"""
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from bson.objectid import ObjectId
+from datetime import datetime, timedelta
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+METRICS = ("reads", "sales")
+
+# 合并时每次批量写入的日桶数、日桶保留的最近批次号个数
+COMPACT_BATCH_SIZE = 1000
+COMPACTION_HISTORY = 16
+
+
+def floor_hour(t):
+    return t.replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(t):
+    return t.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class RollupStore:
+    """时间分桶汇总"""
+
+    def __init__(self, db, hourly_retention_days=2):
+        self.collection = db.get_collection('rollups')
+        self.novels = db.get_collection('novels')
+        self.hourly_retention = timedelta(days=hourly_retention_days)
+
+    @staticmethod
+    def scope_keys(novel):
+        """一部小说的计数需要累加到的各个维度"""
+        return [("site", "all"),
+                ("novel", str(novel['_id'])),
+                ("category", novel.get('category')),
+                ("author", str(novel.get('authorId')))]
+
+    def _upsert_ops(self, counts, granularity, bucket):
+        return [UpdateOne(
+            {"scope": scope, "key": key, "bucket": bucket, "granularity": granularity},
+            {"$inc": fields},
+            upsert=True
+        ) for (scope, key), fields in counts.items()]
+
+    def record(self, counts, when=None):
+        """记录计数，counts为 {小说_id: {"reads": n, "sales": m}}，写入当前小时桶"""
+        if not counts:
+            return
+        bucket = floor_hour(when or datetime.utcnow())
+        merged = {}
+        for novel in self.novels.find({"_id": {"$in": list(counts)}}, {"category": 1, "authorId": 1}):
+            for scope_key in self.scope_keys(novel):
+                target = merged.setdefault(scope_key, {})
+                for metric, value in counts[novel['_id']].items():
+                    target[metric] = target.get(metric, 0) + value
+        if merged:
+            self.collection.bulk_write(self._upsert_ops(merged, "hour", bucket), ordered=False)
+
+    def compact(self, now=None):
+        """把超过保留期的小时桶按天合并为日桶，返回合并的小时桶数"""
+        cutoff = floor_day((now or datetime.utcnow()) - self.hourly_retention)
+        compacted = 0
+        while True:
+            oldest = self.collection.find_one(
+                {"granularity": "hour", "bucket": {"$lt": cutoff}}, {"bucket": 1},
+                sort=[("granularity", ASCENDING), ("bucket", ASCENDING)])
+            if not oldest:
+                return compacted
+            # 逐天、逐维度合并，每批只涉及一天一个维度的小时桶
+            day = floor_day(oldest['bucket'])
+            day_range = {"granularity": "hour", "bucket": {"$gte": day, "$lt": day + DAY}}
+            for scope in self.collection.distinct("scope", day_range):
+                hourly = dict(day_range, scope=scope)
+                # 先完成中断遗留的批次，再给剩余的小时桶打上新批次号
+                run_ids = self.collection.distinct("compacting", dict(hourly, compacting={"$exists": True}))
+                run_id = ObjectId()
+                if self.collection.update_many(dict(hourly, compacting={"$exists": False}),
+                                               {"$set": {"compacting": run_id}}).modified_count:
+                    run_ids.append(run_id)
+                for run in run_ids:
+                    compacted += self._merge_run(scope, day, run)
+
+    def _merge_run(self, scope, day, run_id):
+        """把同一批次的小时桶累加到日桶（已累加过该批次的日桶跳过）后删除，返回删除的小时桶数"""
+        merged = self.collection.aggregate([
+            {"$match": {"scope": scope, "compacting": run_id}},
+            {"$group": {"_id": "$key", **{m: {"$sum": f"${m}"} for m in METRICS}}}
+        ], allowDiskUse=True)
+        batch = []
+        for stat in merged:
+            batch.append(stat)
+            if len(batch) >= COMPACT_BATCH_SIZE:
+                self._apply_run(scope, day, run_id, batch)
+                batch = []
+        self._apply_run(scope, day, run_id, batch)
+        return self.collection.delete_many({"scope": scope, "compacting": run_id}).deleted_count
+
+    def _apply_run(self, scope, day, run_id, stats):
+        if not stats:
+            return
+        keys = [{"scope": scope, "key": stat['_id'], "bucket": day, "granularity": "day"} for stat in stats]
+        # 日桶不存在时先建好，累加时按批次号过滤，不依赖upsert
+        self.collection.bulk_write([UpdateOne(key, {"$setOnInsert": dict.fromkeys(METRICS, 0)}, upsert=True)
+                                    for key in keys], ordered=False)
+        self.collection.bulk_write([UpdateOne(
+            dict(key, compactions={"$ne": run_id}),
+            {"$inc": {m: stat[m] for m in METRICS},
+             "$push": {"compactions": {"$each": [run_id], "$slice": -COMPACTION_HISTORY}}}
+        ) for key, stat in zip(keys, stats)], ordered=False)
+
+    def series(self, scope, key, start, end, granularity="day"):
+        """查询[start, end)内的时间序列，缺失的桶补零
+
+        按天查询时日桶与尚未合并的小时桶一并读取后按天累加；按小时查询只包含保留期内的数据。
+        """
+        floor, step = (floor_day, DAY) if granularity == "day" else (floor_hour, HOUR)
+        start, end = floor(start), floor(end - timedelta(microseconds=1)) + step
+        totals = {}
+        for doc in self.collection.find({"scope": scope, "key": key, "bucket": {"$gte": start, "$lt": end}}):
+            if granularity == "hour" and doc['granularity'] != "hour":
+                continue
+            target = totals.setdefault(floor(doc['bucket']), dict.fromkeys(METRICS, 0))
+            for metric in METRICS:
+                target[metric] += doc.get(metric, 0)
+
+        points = []
+        t = start
+        while t < end:
+            points.append(dict(totals.get(t, dict.fromkeys(METRICS, 0)), time=t))
+            t += step
+        return points
+
+    def recent_series(self, scope, key, days=90):
+        """最近days天（含今天）的按天序列"""
+        today = floor_day(datetime.utcnow())
+        return self.series(scope, key, today - timedelta(days=days - 1), today + DAY)
+
+    def top(self, scope, start, end, metric="reads", limit=10):
+        """[start, end)内按指标排名的维度取值，返回[{key, reads, sales}]"""
+        return [dict(stat, key=stat.pop('_id')) for stat in self.collection.aggregate([
+            {"$match": {"scope": scope, "bucket": {"$gte": start, "$lt": end}}},
+            {"$group": {"_id": "$key", **{m: {"$sum": f"${m}"} for m in METRICS}}},
+            {"$sort": {metric: DESCENDING}},
+            {"$limit": limit}
+        ])]
+
+
+if __name__ == '__main__':
+    # 合并超过保留期的小时桶（建议由 cron 每天执行）：python rollups.py
+    from config import Config
+    from models import Database
+
+    try:
+        database = Database(Config.MONGODB_URI, Config.MONGODB_DB)
+        store = RollupStore(database, Config.ROLLUP_HOURLY_RETENTION_DAYS)
+        print(f"✓ 已合并 {store.compact()} 个小时桶")
+    except Exception as e:
+        print(f"\n错误: {str(e)}")
+        print("请确保 MongoDB 服务已启动，并检查连接配置。")
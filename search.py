@@ -0,0 +1,240 @@
+"""
+小说全文搜索
+对书名、作者、标签、分类和简介建立倒排索引（search_terms 集合），
+中文按字二元组（bigram）切分并结合题材词典，检索时所有查询词都必须命中，按加权得分排序。
+索引只收录已上线的小说，在小说创建、修改、审核时增量维护。
+
+命中数是精确值：各必需词项的记录数由 (term, category) 索引计数，从记录最少的词项开始，
+按权重从高到低分批读取它的倒排记录，每批用 (term, novelId) 索引与其余词项求交集，直到读完。
+只有一个必需词项时命中数就是它的记录数，不需要求交集。交集中按该词项权重排在前面的
+MAX_TERM_POSTINGS 部小说作为候选，只对候选计算得分排序，结果页最多翻到该位置。
+每个查询和聚合设 SEARCH_TIMEOUT_MS 超时。
+"""
+
+from pymongo import DESCENDING, InsertOne
+from bson.objectid import ObjectId
+import re
+import unicodedata
+
+# 中文连续片段 / 英文数字单词
+TOKEN_PATTERN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]+|[a-z0-9]+')
+
+# 题材词典：命中的词作为额外的词项，提升整词匹配的得分
+DICTIONARY = {
+    '玄幻', '奇幻', '言情', '武侠', '仙侠', '科幻', '悬疑', '推理', '历史', '架空', '校园', '都市',
+    '穿越', '重生', '系统', '修仙', '修真', '洪荒', '末世', '丧尸', '星际', '机甲', '无限流',
+    '宫斗', '宅斗', '种田', '甜宠', '虐恋', '总裁', '快穿', '穿书', '灵异', '盗墓', '异能',
+    '江湖', '朝堂', '权谋', '热血', '科技', '争霸', '升级流', '废柴', '逆袭',
+}
+MAX_WORD_LENGTH = max(len(word) for word in DICTIONARY)
+
+# 参与排序的候选数（也是求交集时每批读取的倒排记录数）、检索超时
+MAX_TERM_POSTINGS = 2000
+SEARCH_TIMEOUT_MS = 2000
+
+# 各字段词项权重
+FIELD_WEIGHTS = {
+    "title": 5,
+    "author": 4,
+    "tags": 3,
+    "category": 2,
+    "intro": 1,
+}
+
+
+def normalize(text):
+    """全角转半角、统一小写"""
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def dictionary_words(run):
+    """正向最大匹配找出中文片段中的词典词"""
+    words = []
+    i = 0
+    while i < len(run):
+        for length in range(min(MAX_WORD_LENGTH, len(run) - i), 1, -1):
+            if run[i:i + length] in DICTIONARY:
+                words.append(run[i:i + length])
+                i += length
+                break
+        else:
+            i += 1
+    return words
+
+
+def tokenize(text, unigrams=False):
+    """切分文档字段：中文二元组（可选单字）+ 词典词，英文数字按单词"""
+    tokens = []
+    for run in TOKEN_PATTERN.findall(normalize(text)):
+        if run.isascii():
+            tokens.append(run)
+            continue
+        if unigrams or len(run) == 1:
+            tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        tokens.extend(dictionary_words(run))
+    return tokens
+
+
+def tokenize_query(keyword):
+    """切分查询，返回(必须命中的词项, 加分词项)
+
+    单个汉字按单字检索（只对书名、作者、标签建立了单字索引），其余按二元组检索。
+    """
+    required = []
+    boosts = []
+    for run in TOKEN_PATTERN.findall(normalize(keyword)):
+        if run.isascii() or len(run) == 1:
+            required.append(run)
+        else:
+            required.extend(run[i:i + 2] for i in range(len(run) - 1))
+            boosts.extend(w for w in dictionary_words(run) if len(w) > 2)
+    return list(dict.fromkeys(required)), list(dict.fromkeys(boosts))
+
+
+class SearchIndex:
+    """倒排索引"""
+
+    def __init__(self, db, max_postings=MAX_TERM_POSTINGS, timeout_ms=SEARCH_TIMEOUT_MS):
+        self.collection = db.get_collection('search_terms')
+        self.novels = db.get_collection('novels')
+        self.users = db.get_collection('users')
+        self.max_postings = max_postings
+        self.timeout_ms = timeout_ms
+
+    def build_postings(self, novel, author_name):
+        """计算一部小说的词项及权重"""
+        weights = {}
+
+        def add(text, field, unigrams=False):
+            for token in tokenize(text, unigrams=unigrams):
+                weights[token] = weights.get(token, 0) + FIELD_WEIGHTS[field]
+
+        add(novel.get('title'), "title", unigrams=True)
+        add(author_name, "author", unigrams=True)
+        for tag in novel.get('tags', []):
+            add(tag, "tags", unigrams=True)
+        add(novel.get('category'), "category")
+        add(novel.get('intro'), "intro")
+        return weights
+
+    def index_novel(self, novel_id):
+        """重建单部小说的索引，未上线的小说从索引中移除"""
+        novel_id = ObjectId(novel_id)
+        self.collection.delete_many({"novelId": novel_id})
+
+        novel = self.novels.find_one(
+            {"_id": novel_id},
+            {"title": 1, "authorId": 1, "tags": 1, "category": 1, "intro": 1, "status": 1}
+        )
+        if not novel or novel.get('status') != 'online':
+            return 0
+
+        author = self.users.find_one({"_id": novel['authorId']}, {"username": 1})
+        weights = self.build_postings(novel, author['username'] if author else '')
+        if weights:
+            self.collection.bulk_write([
+                InsertOne({
+                    "term": term,
+                    "novelId": novel_id,
+                    "category": novel.get('category'),
+                    "weight": weight
+                })
+                for term, weight in weights.items()
+            ], ordered=False)
+        return len(weights)
+
+    def rebuild(self):
+        """重建全部索引"""
+        self.collection.delete_many({})
+        count = 0
+        for novel in self.novels.find({"status": "online"}, {"_id": 1}):
+            self.index_novel(novel['_id'])
+            count += 1
+        return count
+
+    @staticmethod
+    def term_query(term, category=None):
+        query = {"term": term}
+        if category:
+            query["category"] = category
+        return query
+
+    def term_count(self, term, category=None):
+        """词项的倒排记录数（只读索引）"""
+        return self.collection.count_documents(self.term_query(term, category), maxTimeMS=self.timeout_ms)
+
+    def top_postings(self, term, category=None, limit=None):
+        """按权重从高到低读取词项的倒排记录，limit为None时读取全部（游标分批返回）"""
+        cursor = self.collection.find(self.term_query(term, category), {"novelId": 1, "_id": 0}) \
+            .sort([("weight", DESCENDING), ("novelId", DESCENDING)]) \
+            .batch_size(self.max_postings).max_time_ms(self.timeout_ms)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return (doc['novelId'] for doc in cursor)
+
+    def matching(self, term, novel_ids):
+        """novel_ids中包含该词项的小说"""
+        cursor = self.collection.find({"term": term, "novelId": {"$in": novel_ids}}, {"novelId": 1, "_id": 0}) \
+            .max_time_ms(self.timeout_ms)
+        return {doc['novelId'] for doc in cursor}
+
+    def candidates(self, required, category=None):
+        """返回(候选小说, 命中总数)
+
+        候选为所有必需词项的交集中按最稀有词项权重排在前面的max_postings部小说，命中总数是精确的交集大小。
+        """
+        counts = {term: self.term_count(term, category) for term in required}
+        # 有词项没有命中时不可能有结果
+        if not all(counts.values()):
+            return [], 0
+
+        terms = sorted(required, key=counts.get)
+        rarest, others = terms[0], terms[1:]
+        if not others:
+            return list(self.top_postings(rarest, category, limit=self.max_postings)), counts[rarest]
+
+        # 按批读取最稀有词项的全部记录，逐个与其余词项求交集
+        candidates, total = [], 0
+        postings = self.top_postings(rarest, category)
+        while True:
+            batch = [novel_id for _, novel_id in zip(range(self.max_postings), postings)]
+            if not batch:
+                break
+            matched = set(batch)
+            for term in others:
+                matched &= self.matching(term, list(matched))
+                if not matched:
+                    break
+            total += len(matched)
+            candidates.extend(n for n in batch if n in matched and len(candidates) < self.max_postings)
+        return candidates, total
+
+    def search(self, keyword, category=None, skip=0, limit=12):
+        """检索小说，返回(按得分排序的小说ID列表, 命中总数)"""
+        required, boosts = tokenize_query(keyword)
+        if not required:
+            return [], 0
+
+        candidates, total = self.candidates(required, category)
+        if not candidates or skip >= len(candidates):
+            return [], total
+
+        pipeline = [
+            # 候选已按分类筛选，且命中所有必需词项
+            {"$match": {"term": {"$in": required + boosts}, "novelId": {"$in": candidates}}},
+            {"$group": {"_id": "$novelId", "score": {"$sum": "$weight"}}},
+            {"$sort": {"score": DESCENDING, "_id": DESCENDING}},
+            {"$skip": skip},
+            {"$limit": limit}
+        ]
+        page = self.collection.aggregate(pipeline, maxTimeMS=self.timeout_ms)
+        return [doc['_id'] for doc in page], total
+
+if __name__ == '__main__':
+    # 重建搜索索引：python search.py
+    from config import Config
+    from models import Database
+
+    database = Database(Config.MONGODB_URI, Config.MONGODB_DB)
+    print(f"✓ 已重建 {SearchIndex(database).rebuild()} 部小说的搜索索引")
@@ -0,0 +1,77 @@
+"""
+生产环境启动入口：python serve.py
+使用 gunicorn 预先fork多个工作进程（每个进程多线程）处理请求：
+  - 主进程预加载应用并检查数据库结构版本（低于代码要求时拒绝启动），fork前关闭连接，工作进程第一次访问数据库时各自建立连接
+  - kill -HUP <主进程>  平滑重载：启动新工作进程后再让旧进程处理完当前请求退出
+  - kill -TERM <主进程> 优雅停止：等待进行中的请求完成（最长 SERVER_GRACEFUL_TIMEOUT 秒）
+  - 主进程加载应用时载入全部模板，工作进程启动后先预热（建立数据库连接、访问预热地址）再接收请求
+  - 工作进程退出前刷写阅读量/阅读进度写缓冲
+开发调试仍可使用 python app.py。
+"""
+
+from gunicorn.app.base import BaseApplication
+from config import Config
+from warmup import compile_templates, warm_up
+
+
+def post_fork(server, worker):
+    """工作进程启动：丢弃继承自主进程的连接状态，按配置预热"""
+    from app import app, db
+    db.close()
+    if Config.WARMUP_ENABLED:
+        try:
+            server.log.info(f"工作进程 {worker.pid} 预热完成，用时 {warm_up(app, db):.2f} 秒")
+        except Exception as e:
+            server.log.warning(f"工作进程 {worker.pid} 预热失败：{e}")
+
+
+def worker_exit(server, worker):
+    """工作进程退出：刷写写缓冲"""
+    from app import activity_buffer
+    activity_buffer.shutdown()
+
+
+class Server(BaseApplication):
+    """gunicorn 应用封装"""
+
+    def __init__(self, options=None):
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key.lower(), value)
+
+    def load(self):
+        from app import app, db
+        # 主进程中检查结构版本后断开，fork出的工作进程各自重新连接
+        db.client
+        db.close()
+        # 模板编译后留在内存中，fork出的工作进程直接使用
+        compile_templates(app)
+        return app
+
+
+def serve():
+    Server({
+        "bind": Config.SERVER_BIND,
+        "workers": Config.SERVER_WORKERS,
+        "threads": Config.SERVER_THREADS,
+        "worker_class": "gthread",
+        "preload_app": True,
+        "timeout": Config.SERVER_TIMEOUT,
+        "graceful_timeout": Config.SERVER_GRACEFUL_TIMEOUT,
+        "keepalive": 5,
+        # 每个工作进程处理一定数量请求后重启，避免内存持续增长（0为不限制）
+        "max_requests": Config.SERVER_MAX_REQUESTS,
+        "max_requests_jitter": Config.SERVER_MAX_REQUESTS // 10,
+        "accesslog": "-",
+        "errorlog": "-",
+        "post_fork": post_fork,
+        "worker_exit": worker_exit,
+    }).run()
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,278 @@
+"""
+基于内容的相似小说
+对已上线小说的简介、标签和分类建立 TF-IDF 向量（中文按 search.tokenize 切分为二元组和题材词），
+L2 归一化后存为 float32 稀疏矩阵；分块做矩阵乘法得到余弦相似度（结果保持稀疏，每块的行数按
+SCORE_BLOCK_CELLS 限制），每部小说保留 top_k 部最相似的小说，写入 content_neighbours 集合。新书没有购买和阅读记录，也能通过内容相似被推荐。
+
+全量重建：python similar.py
+增量刷新：python similar.py --refresh
+  小说创建、修改、审核时登记到 content_queue，刷新时沿用上次全量重建的词表和 IDF 只重算这些小说的向量，
+  并重算受影响小说（原列表中包含它们，或与它们的相似度超过自身第 top_k 名）的相似列表。
+  新出现的词要到下次全量重建才会计入。
+
+矩阵计算依赖 numpy/scipy，只在离线任务中导入，Web 进程只读取相似列表。
+"""
+
+from pymongo import ReplaceOne, UpdateOne
+from bson.objectid import ObjectId
+from datetime import datetime
+from recommend import merge_neighbours, pack_ids, unpack_ids
+from search import normalize, tokenize
+import json
+import math
+import os
+
+# 各字段词项权重
+FIELD_WEIGHTS = {
+    "intro": 1.0,
+    "tags": 2.0,
+    "category": 1.5,
+}
+
+NOVEL_FIELDS = {"intro": 1, "tags": 1, "category": 1, "status": 1}
+
+# 一块相似度最多覆盖的(行, 列)数：即使相似度接近稠密，一块也只占几十到一百多MB
+SCORE_BLOCK_CELLS = 16 * 1024 * 1024
+
+
+def novel_terms(novel):
+    """小说的加权词频 {词项: 权重}"""
+    counts = {}
+
+    def add(term, weight):
+        counts[term] = counts.get(term, 0) + weight
+
+    for token in tokenize(novel.get('intro')):
+        add(token, FIELD_WEIGHTS["intro"])
+    for tag in novel.get('tags', []):
+        # 标签整体作为一个词项，同时切分以匹配相近的标签
+        add(f"tag:{normalize(tag)}", FIELD_WEIGHTS["tags"])
+        for token in tokenize(tag, unigrams=True):
+            add(token, FIELD_WEIGHTS["tags"])
+    if novel.get('category'):
+        add(f"category:{novel['category']}", FIELD_WEIGHTS["category"])
+    return counts
+
+
+class ContentIndex:
+    """内容相似索引"""
+
+    def __init__(self, db, top_k=20, block_size=256, state_path=None):
+        self.collection = db.get_collection('content_neighbours')
+        self.queue = db.get_collection('content_queue')
+        self.novels = db.get_collection('novels')
+        self.top_k = top_k
+        self.block_size = block_size
+        self.state_path = state_path
+
+    # ---------- 在线部分 ----------
+
+    def enqueue(self, novel_id):
+        """登记内容有变化的小说，等待增量刷新"""
+        self.queue.update_one({"_id": ObjectId(novel_id)},
+                              {"$set": {"queuedAt": datetime.utcnow()}}, upsert=True)
+
+    def similar(self, novel_id, limit=6):
+        """与一部小说内容最相似的小说_id列表"""
+        doc = self.collection.find_one({"_id": ObjectId(novel_id)})
+        return [n['novelId'] for n in doc['neighbours'][:limit]] if doc else []
+
+    def updated_at(self, novel_id):
+        """相似列表的更新时间（详情页缓存校验用）"""
+        doc = self.collection.find_one({"_id": ObjectId(novel_id)}, {"updateTime": 1})
+        return doc and doc.get('updateTime')
+
+    def recommend(self, history, exclude=(), limit=6):
+        """根据读者历史 {小说_id: 权重} 合并相似列表，返回按得分排序的小说_id列表"""
+        return merge_neighbours(self.collection, history, exclude, limit)
+
+    # ---------- 离线计算 ----------
+
+    @staticmethod
+    def vectorize(novels, vocab, idf):
+        """按给定词表和IDF计算TF-IDF矩阵（行已L2归一化，float32），词表外的词忽略"""
+        import numpy as np
+        from scipy import sparse
+        from array import array
+
+        rows, cols, data = array('i'), array('i'), array('f')
+        for i, novel in enumerate(novels):
+            for term, tf in novel_terms(novel).items():
+                j = vocab.get(term)
+                if j is not None:
+                    rows.append(i)
+                    cols.append(j)
+                    data.append((1 + math.log(tf)) * idf[j])
+        matrix = sparse.csr_matrix(
+            (np.frombuffer(data, dtype=np.float32),
+             (np.frombuffer(rows, dtype=np.int32), np.frombuffer(cols, dtype=np.int32))),
+            shape=(len(novels), len(vocab)))
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        inv_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        return (sparse.diags(inv_norms.astype(np.float32)) @ matrix).tocsr()
+
+    def top_neighbours(self, matrix, rows):
+        """分块计算指定行的top_k相似小说，产出(行号, 近邻行号数组, 相似度数组)
+
+        每块的相似度保持为稀疏矩阵，直接在每行的非零项（indptr/indices/data）中选top_k。
+        """
+        import numpy as np
+
+        transposed = matrix.T.tocsc()
+        k = self.top_k
+        block_size = max(1, min(self.block_size, SCORE_BLOCK_CELLS // max(matrix.shape[0], 1)))
+        for start in range(0, len(rows), block_size):
+            block = np.asarray(rows[start:start + block_size])
+            scores = (matrix[block] @ transposed).tocsr()
+            for i, row in enumerate(block):
+                cols = scores.indices[scores.indptr[i]:scores.indptr[i + 1]]
+                values = scores.data[scores.indptr[i]:scores.indptr[i + 1]]
+                keep = (values > 0) & (cols != row)  # 排除自身
+                cols, values = cols[keep], values[keep]
+                if len(values) > k:
+                    top = np.argpartition(-values, k)[:k]
+                    cols, values = cols[top], values[top]
+                order = np.argsort(-values, kind='stable')
+                yield row, cols[order], values[order]
+
+    def _save_neighbours(self, matrix, novel_ids, rows, kth):
+        """计算并写入指定行的相似列表，同时更新每行第top_k名的相似度，返回写入数"""
+        now = datetime.utcnow()
+        ops = []
+        count = 0
+        for row, neighbours, scores in self.top_neighbours(matrix, rows):
+            kth[row] = scores[-1] if len(scores) >= self.top_k else 0
+            if len(scores):
+                ops.append(ReplaceOne({"_id": novel_ids[row]}, {
+                    "neighbours": [{"novelId": novel_ids[n], "score": round(float(s), 6)}
+                                   for n, s in zip(neighbours, scores)],
+                    "updateTime": now
+                }, upsert=True))
+            else:
+                ops.append(UpdateOne({"_id": novel_ids[row]}, {"$set": {"neighbours": [], "updateTime": now}}))
+            if len(ops) >= 1000:
+                self.collection.bulk_write(ops, ordered=False)
+                count += len(ops)
+                ops = []
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+            count += len(ops)
+        return count
+
+    def _save_state(self, matrix, novel_ids, vocab, idf, kth):
+        import numpy as np
+
+        if not self.state_path:
+            return
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        terms = sorted(vocab, key=vocab.get)
+        np.savez_compressed(
+            self.state_path,
+            data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+            shape=np.array(matrix.shape),
+            novels=pack_ids(novel_ids),
+            vocab=np.array([json.dumps(terms, ensure_ascii=False)]),
+            idf=idf, kth=kth)
+
+    def _load_state(self):
+        import numpy as np
+        from scipy import sparse
+
+        state = np.load(self.state_path)
+        matrix = sparse.csr_matrix((state['data'], state['indices'], state['indptr']),
+                                   shape=tuple(state['shape']))
+        terms = json.loads(str(state['vocab'][0]))
+        return (matrix, unpack_ids(state['novels']), {t: i for i, t in enumerate(terms)},
+                state['idf'], state['kth'].copy())
+
+    def rebuild(self):
+        """全量重建词表、IDF、TF-IDF矩阵和全部相似列表，返回小说数"""
+        import numpy as np
+
+        started = datetime.utcnow()
+        novels = list(self.novels.find({"status": "online"}, NOVEL_FIELDS))
+        doc_freq = {}
+        for novel in novels:
+            for term in novel_terms(novel):
+                doc_freq[term] = doc_freq.get(term, 0) + 1
+        # 只出现在一部小说中的词对相似度没有贡献
+        terms = [t for t, df in doc_freq.items() if df > 1]
+        vocab = {t: i for i, t in enumerate(terms)}
+        idf = np.array([math.log((1 + len(novels)) / (1 + doc_freq[t])) + 1 for t in terms], dtype=np.float32)
+
+        matrix = self.vectorize(novels, vocab, idf)
+        novel_ids = [n['_id'] for n in novels]
+        kth = np.zeros(len(novels), dtype=np.float32)
+        self._save_neighbours(matrix, novel_ids, list(range(len(novels))), kth)
+        self.collection.delete_many({"updateTime": {"$lt": started}})
+        self.queue.delete_many({"queuedAt": {"$lt": started}})
+        self._save_state(matrix, novel_ids, vocab, idf, kth)
+        return len(novels)
+
+    def refresh(self):
+        """增量刷新登记过的小说，返回重算的相似列表数"""
+        import numpy as np
+        from scipy import sparse
+
+        if not self.state_path or not os.path.exists(self.state_path):
+            return self.rebuild()
+
+        started = datetime.utcnow()
+        queued = [doc['_id'] for doc in self.queue.find({"queuedAt": {"$lt": started}}, {"_id": 1})]
+        if not queued:
+            return 0
+        matrix, novel_ids, vocab, idf, kth = self._load_state()
+        index = {novel_id: i for i, novel_id in enumerate(novel_ids)}
+
+        # 已上线的小说重算向量（新书追加到末尾），下线的小说向量置零
+        online = list(self.novels.find({"_id": {"$in": queued}, "status": "online"}, NOVEL_FIELDS))
+        for novel in online:
+            if novel['_id'] not in index:
+                index[novel['_id']] = len(novel_ids)
+                novel_ids.append(novel['_id'])
+        dirty = np.array(sorted(index[n] for n in queued if n in index), dtype=np.int64)
+        size = len(novel_ids)
+        kth = np.concatenate([kth, np.zeros(size - len(kth), dtype=np.float32)])
+
+        keep = np.ones(size, dtype=np.float32)
+        keep[dirty] = 0
+        matrix.resize((size, matrix.shape[1]))
+        vectors = self.vectorize(online, vocab, idf).tocoo()
+        placed = sparse.csr_matrix(
+            (vectors.data, (np.array([index[n['_id']] for n in online], dtype=np.int64)[vectors.row], vectors.col)),
+            shape=matrix.shape)
+        matrix = (sparse.diags(keep) @ matrix + placed).tocsr()
+        matrix.eliminate_zeros()
+
+        # 受影响的小说：自身、原列表中包含它们的、与它们的相似度能进入自身前top_k的
+        affected = set(dirty.tolist())
+        for doc in self.collection.find({"neighbours.novelId": {"$in": queued}}, {"_id": 1}):
+            if doc['_id'] in index:
+                affected.add(index[doc['_id']])
+        if len(dirty):
+            best = np.asarray((matrix[dirty] @ matrix.T).max(axis=0).todense()).ravel()
+            affected.update(np.nonzero((best > 0) & (best >= kth))[0].tolist())
+
+        count = self._save_neighbours(matrix, novel_ids, sorted(affected), kth)
+        # 下线小说的相似列表删除
+        self.collection.delete_many({"_id": {"$in": [n for n in queued if n not in {o['_id'] for o in online}]}})
+        self.queue.delete_many({"_id": {"$in": queued}, "queuedAt": {"$lt": started}})
+        self._save_state(matrix, novel_ids, vocab, idf, kth)
+        return count
+
+
+if __name__ == '__main__':
+    import sys
+    from config import Config
+    from models import Database
+
+    try:
+        database = Database(Config.MONGODB_URI, Config.MONGODB_DB)
+        index = ContentIndex(database, Config.RECOMMEND_TOP_K, state_path=Config.CONTENT_STATE_PATH)
+        if '--refresh' in sys.argv:
+            print(f"✓ 已增量刷新 {index.refresh()} 部小说的内容相似列表")
+        else:
+            print(f"✓ 已重建 {index.rebuild()} 部小说的内容相似列表")
+    except Exception as e:
+        print(f"\n错误: {str(e)}")
+        print("请确保 MongoDB 服务已启动，并检查连接配置。")
@@ -54,6 +54,7 @@ if docker-compose ps | grep -q "Up"; then
     echo "  读者   - 用户名: 读者小红   密码: reader123"
     echo ""
     echo "查看日志: docker-compose logs -f"
+    echo "平滑重载: docker-compose kill -s HUP web"
     echo "停止服务: docker-compose down"
     echo "========================================"
 else
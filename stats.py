@@ -0,0 +1,255 @@
+"""
+统计数据物化
+管理后台统计页读取 stats 集合中预先计算好的文档，不再每次扫描 novels/orders：
+  totals              总体统计（用户、上线小说、章节、订单、收入）
+  category:<分类>      分类统计（上线小说数、阅读量、销量）
+  creator:<作者ID>     创作者统计（上线小说数、阅读量、销量、收入）
+  role:<角色>          用户角色统计
+  top_novels          阅读量/销量Top10快照
+购买、审核、章节写入等路径增量维护计数；阅读量由写缓冲在每次刷写确认后批量累加（record_reads）。
+定期校准任务（python stats.py，docker-compose 中的 scheduler 服务定时执行）按源数据全量重算并纠正增量误差。
+"""
+
+from pymongo import DESCENDING, ReplaceOne, ReturnDocument, UpdateOne
+from bson.objectid import ObjectId
+from datetime import datetime
+
+# 计算小说统计贡献所需的字段
+NOVEL_FIELDS = {"status": 1, "category": 1, "authorId": 1, "chapterCount": 1,
+                "readCount": 1, "saleCount": 1, "price": 1}
+
+# Top榜快照保留的字段、上榜数
+TOP_NOVEL_FIELDS = {"title": 1, "authorId": 1, "category": 1, "readCount": 1, "saleCount": 1}
+TOP_NOVEL_COUNT = 10
+
+
+def novel_contribution(novel):
+    """一部小说对各统计文档的贡献，未上线的小说不计入"""
+    if not novel or novel.get('status') != 'online':
+        return {}
+    reads = novel.get('readCount', 0)
+    sales = novel.get('saleCount', 0)
+    return {
+        "totals": {"novels": 1, "chapters": novel.get('chapterCount', 0), "totalRead": reads},
+        f"category:{novel.get('category')}": {"count": 1, "totalRead": reads, "totalSales": sales},
+        f"creator:{novel.get('authorId')}": {
+            "novelCount": 1,
+            "totalRead": reads,
+            "totalSales": sales,
+            "totalRevenue": sales * novel.get('price', 0)
+        },
+    }
+
+
+def apply_update(doc, update):
+    """在内存中对文档应用$set/$inc，得到更新后的统计相关字段"""
+    doc = dict(doc)
+    for field, value in update.get('$set', {}).items():
+        if field in NOVEL_FIELDS:
+            doc[field] = value
+    for field, value in update.get('$inc', {}).items():
+        if field in NOVEL_FIELDS:
+            doc[field] = doc.get(field, 0) + value
+    return doc
+
+
+class StatsStore:
+    """物化统计"""
+
+    def __init__(self, db):
+        self.collection = db.get_collection('stats')
+        self.users = db.get_collection('users')
+        self.novels = db.get_collection('novels')
+        self.orders = db.get_collection('orders')
+
+    @staticmethod
+    def _split_id(doc_id):
+        """统计文档ID拆分为(类型, 键)"""
+        kind, _, key = doc_id.partition(':')
+        return kind, key or None
+
+    def increment(self, deltas):
+        """按 {文档ID: {字段: 增量}} 批量累加计数"""
+        now = datetime.utcnow()
+        ops = []
+        for doc_id, fields in deltas.items():
+            fields = {k: v for k, v in fields.items() if v}
+            if not fields:
+                continue
+            kind, key = self._split_id(doc_id)
+            ops.append(UpdateOne(
+                {"_id": doc_id},
+                {"$inc": fields, "$set": {"updateTime": now}, "$setOnInsert": {"kind": kind, "key": key}},
+                upsert=True))
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+
+    def novel_changed(self, before, after):
+        """小说状态/分类/章节数/销量等变化后，按前后贡献之差更新统计"""
+        deltas = {}
+        for sign, novel in ((-1, before), (1, after)):
+            for doc_id, fields in novel_contribution(novel).items():
+                target = deltas.setdefault(doc_id, {})
+                for field, value in fields.items():
+                    target[field] = target.get(field, 0) + sign * value
+        self.increment(deltas)
+
+    def update_novel(self, novel_id, update):
+        """更新小说并同步维护统计，返回更新前的小说（统计相关字段）"""
+        before = self.novels.find_one_and_update(
+            {"_id": ObjectId(novel_id)}, update,
+            projection=NOVEL_FIELDS, return_document=ReturnDocument.BEFORE)
+        if before:
+            self.novel_changed(before, apply_update(before, update))
+        return before
+
+    def record_reads(self, read_deltas):
+        """累加已落库的阅读量 {小说_id: 增量}：全站、分类、创作者的totalRead，并刷新Top榜快照"""
+        novels = list(self.novels.find({"_id": {"$in": list(read_deltas)}, "status": "online"}, TOP_NOVEL_FIELDS))
+        deltas = {}
+        for novel in novels:
+            for doc_id in ("totals", f"category:{novel.get('category')}", f"creator:{novel.get('authorId')}"):
+                target = deltas.setdefault(doc_id, {"totalRead": 0})
+                target["totalRead"] += read_deltas[novel['_id']]
+        self.increment(deltas)
+        self._refresh_top_novels(novels)
+
+    def _refresh_top_novels(self, novels):
+        """用小说的最新数值更新Top榜快照：阅读榜合并后按阅读量重排，销量榜只更新已在榜的小说"""
+        top = self.collection.find_one({"_id": "top_novels"})
+        if not top or not novels:
+            return
+        latest = {novel['_id']: novel for novel in novels}
+        by_read = {novel['_id']: novel for novel in top.get('byRead', [])}
+        by_read.update(latest)
+        self.collection.update_one({"_id": "top_novels"}, {"$set": {
+            "byRead": sorted(by_read.values(), key=lambda n: n.get('readCount', 0), reverse=True)[:TOP_NOVEL_COUNT],
+            "bySales": [latest.get(novel['_id'], novel) for novel in top.get('bySales', [])],
+            "updateTime": datetime.utcnow()
+        }})
+
+    def user_changed(self, role, delta):
+        """用户注册(+1)或注销(-1)"""
+        self.increment({"totals": {"users": delta}, f"role:{role}": {"count": delta}})
+
+    def order_created(self):
+        self.increment({"totals": {"orders": 1}})
+
+    def order_paid(self, amount):
+        self.increment({"totals": {"paidOrders": 1, "revenue": amount}})
+
+    def reconcile(self):
+        """按源数据全量重算统计并覆盖，删除已不存在的分类/创作者/角色"""
+        now = datetime.utcnow()
+        docs = {}
+
+        def put(doc_id, fields):
+            kind, key = self._split_id(doc_id)
+            docs[doc_id] = dict(fields, _id=doc_id, kind=kind, key=key, updateTime=now, reconciledAt=now)
+
+        online = {"status": "online"}
+        novel_totals = next(self.novels.aggregate([
+            {"$match": online},
+            {"$group": {
+                "_id": None,
+                "novels": {"$sum": 1},
+                "chapters": {"$sum": "$chapterCount"},
+                "totalRead": {"$sum": "$readCount"}
+            }}
+        ]), {})
+        order_totals = next(self.orders.aggregate([
+            {"$group": {
+                "_id": None,
+                "orders": {"$sum": 1},
+                "paidOrders": {"$sum": {"$cond": [{"$eq": ["$status", "paid"]}, 1, 0]}},
+                "revenue": {"$sum": {"$cond": [{"$eq": ["$status", "paid"]}, "$amount", 0]}}
+            }}
+        ]), {})
+        put("totals", {
+            "users": self.users.count_documents({"status": 1}),
+            "novels": novel_totals.get('novels', 0),
+            "chapters": novel_totals.get('chapters', 0),
+            "totalRead": novel_totals.get('totalRead', 0),
+            "orders": order_totals.get('orders', 0),
+            "paidOrders": order_totals.get('paidOrders', 0),
+            "revenue": order_totals.get('revenue', 0),
+        })
+
+        for stat in self.novels.aggregate([
+            {"$match": online},
+            {"$group": {
+                "_id": "$category",
+                "count": {"$sum": 1},
+                "totalRead": {"$sum": "$readCount"},
+                "totalSales": {"$sum": "$saleCount"}
+            }}
+        ]):
+            put(f"category:{stat.pop('_id')}", stat)
+
+        for stat in self.novels.aggregate([
+            {"$match": online},
+            {"$group": {
+                "_id": "$authorId",
+                "novelCount": {"$sum": 1},
+                "totalRead": {"$sum": "$readCount"},
+                "totalSales": {"$sum": "$saleCount"},
+                "totalRevenue": {"$sum": {"$multiply": ["$saleCount", "$price"]}}
+            }}
+        ]):
+            put(f"creator:{stat.pop('_id')}", stat)
+
+        for stat in self.users.aggregate([
+            {"$match": {"status": 1}},
+            {"$group": {"_id": "$role", "count": {"$sum": 1}}}
+        ]):
+            put(f"role:{stat.pop('_id')}", stat)
+
+        put("top_novels", {
+            "byRead": list(self.novels.find(online, TOP_NOVEL_FIELDS).sort("readCount", DESCENDING)
+                           .limit(TOP_NOVEL_COUNT)),
+            "bySales": list(self.novels.find(online, TOP_NOVEL_FIELDS).sort("saleCount", DESCENDING)
+                            .limit(TOP_NOVEL_COUNT)),
+        })
+
+        self.collection.bulk_write([ReplaceOne({"_id": doc_id}, doc, upsert=True)
+                                    for doc_id, doc in docs.items()], ordered=False)
+        self.collection.delete_many({"kind": {"$in": ["category", "creator", "role"]},
+                                     "_id": {"$nin": list(docs)}})
+        return len(docs)
+
+    def snapshot(self, top_creators=10):
+        """读取统计页所需的全部统计文档，尚未生成时先做一次校准"""
+        totals = self.collection.find_one({"_id": "totals"})
+        if totals is None:
+            self.reconcile()
+            totals = self.collection.find_one({"_id": "totals"})
+
+        def by_kind(kind, sort_by, limit=0):
+            docs = self.collection.find({"kind": kind}).sort(sort_by, DESCENDING).limit(limit)
+            return [dict(doc, _id=doc['key']) for doc in docs]
+
+        creators = by_kind("creator", "novelCount", top_creators)
+        for stat in creators:
+            stat['_id'] = ObjectId(stat['_id'])
+        top_novels = self.collection.find_one({"_id": "top_novels"}) or {}
+        return {
+            "totals": totals,
+            "categories": by_kind("category", "count"),
+            "creators": creators,
+            "roles": by_kind("role", "count"),
+            "top_read": top_novels.get('byRead', []),
+            "top_sales": top_novels.get('bySales', []),
+        }
+
+
+if __name__ == '__main__':
+    # 校准统计数据（docker-compose 的 scheduler 服务定时执行）：python stats.py
+    from config import Config
+    from models import Database
+
+    try:
+        database = Database(Config.MONGODB_URI, Config.MONGODB_DB)
+        print(f"✓ 已校准 {StatsStore(database).reconcile()} 个统计文档")
+    except Exception as e:
+        print(f"\n错误: {str(e)}")
+        print("请确保 MongoDB 服务已启动，并检查连接配置。")
@@ -0,0 +1,40 @@
+"""
+章节解析：分块切分行与增量解码
+"""
+
+import io
+import random
+
+import pytest
+
+from chapter_parser import iter_lines, iter_text_lines, iter_txt_chapters
+
+
+def test_lines_split_across_chunks():
+    rng = random.Random(0)
+    pieces = ['第', '一章', '正文', '\n', '\r', '\r\n', ' ', ' ']
+    for _ in range(2000):
+        text = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 30)))
+        cuts = sorted(rng.randint(0, len(text)) for _ in range(rng.randint(0, 6)))
+        parts = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+        assert list(iter_text_lines(parts)) == text.splitlines(keepends=True)
+
+
+def test_long_line_without_newlines():
+    parts = ['字' * 1000] * 5000
+    assert list(iter_text_lines(parts)) == ['字' * 5000000]
+
+
+@pytest.mark.parametrize("encoding", ['utf-8', 'utf-8-sig', 'utf-16', 'gb18030'])
+def test_decode_small_chunks(encoding):
+    text = '第一章 开始\n正文一\r\n第二章 继续\n正文二\n'
+    chapters = list(iter_txt_chapters(io.BytesIO(text.encode(encoding)), chunk_size=3))
+    assert chapters == [{'title': '第一章 开始', 'content': '正文一'},
+                        {'title': '第二章 继续', 'content': '正文二'}]
+
+
+def test_undecodable_bytes_reported():
+    head = ('第一章 开始\n' + '正文' * 100).encode('utf-8')
+    data = head + '第二章 乱码\n'.encode('gbk')
+    with pytest.raises(ValueError, match=f"第 {len(head)} 字节"):
+        list(iter_lines(io.BytesIO(data), chunk_size=64))
@@ -0,0 +1,43 @@
+"""
+评论列表只附带每条评论最新的几条回复，更早的回复游标分页读取
+"""
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from bson import ObjectId
+
+from models import CommentModel
+
+
+@pytest.fixture
+def comment_model():
+    return CommentModel(mongomock.MongoClient().novel_platform)
+
+
+def test_replies_limited_and_paged(comment_model):
+    novel_id, user_id = ObjectId(), ObjectId()
+    comment_id = comment_model.add_comment(novel_id, user_id, "a", "评论")
+    for i in range(25):
+        comment_model.add_comment(novel_id, user_id, "b", f"回复{i}", parent_id=comment_id)
+
+    comments, _, _ = comment_model.find_comments(novel_id, reply_limit=3)
+    comment = comments[0]
+    assert comment["replyCount"] == 25
+    assert [r["content"] for r in comment["replies"]] == ["回复22", "回复23", "回复24"]
+
+    # 从预览之后继续往前翻，最后一页没有游标
+    seen = [r["content"] for r in comment["replies"]]
+    cursor = comment["replies_cursor"]
+    while cursor:
+        replies, cursor = comment_model.find_replies(comment_id, cursor=cursor, limit=10)
+        seen = [r["content"] for r in reversed(replies)] + seen
+    assert seen == [f"回复{i}" for i in range(25)]
+
+
+def test_comment_without_replies(comment_model):
+    novel_id = ObjectId()
+    comment_model.add_comment(novel_id, ObjectId(), "a", "评论")
+    comments, _, _ = comment_model.find_comments(novel_id)
+    assert comments[0]["replies"] == [] and comments[0]["replies_cursor"] is None
@@ -0,0 +1,25 @@
+"""
+数据库连接：结构版本检查未通过时不保留连接
+"""
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import models
+from migrations import LATEST_VERSION, SCHEMA_ID, SchemaVersionError
+
+
+def test_schema_check_repeats_until_migrated(monkeypatch):
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(models, "MongoClient", lambda uri: client)
+    database = models.Database("mongodb://localhost:27017/", "novel_platform")
+
+    for _ in range(2):
+        with pytest.raises(SchemaVersionError):
+            database.client
+        assert database._client is None
+
+    client.novel_platform.schema_version.insert_one({"_id": SCHEMA_ID, "version": LATEST_VERSION})
+    assert database.client is client
+    assert database.schema_checked
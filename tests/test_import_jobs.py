@@ -0,0 +1,105 @@
+"""
+章节导入任务：进程意外退出后，心跳超时的任务标记为失败并撤销已写入的章节
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from import_jobs import ImportJobRunner
+from models import ChapterModel, ImportJobModel
+
+
+class Upload:
+    """模拟上传文件"""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.data = data
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.data)
+
+
+@pytest.fixture
+def env(tmp_path):
+    db = mongomock.MongoClient().novel_platform
+    novel_id = db.novels.insert_one({"chapters": [], "chapterCount": 0, "chapterSeq": 0}).inserted_id
+    chapter_model = ChapterModel(db)
+    job_model = ImportJobModel(db)
+
+    def import_chapters(novel_id, chapters, progress=None, job_id=None):
+        return chapter_model.add_chapters(novel_id, chapters, batch_size=2, progress=progress,
+                                          import_job_id=job_id)
+
+    runner = ImportJobRunner(job_model, import_chapters, chapter_model.rollback_import, str(tmp_path),
+                             job_threads=1, pdf_workers=1, stale_seconds=60)
+    return db, novel_id, job_model, chapter_model, runner
+
+
+def book(count):
+    return ''.join(f"第{i + 1}章 标题\n正文{i}\n" for i in range(count)).encode('utf-8')
+
+
+def test_stale_running_job_failed_and_rolled_back(env, tmp_path):
+    db, novel_id, job_model, chapter_model, runner = env
+    chapter_model.add_chapter(novel_id, {"title": "已有章节", "content": "正文"})
+
+    # 模拟导入到一半时进程退出：章节已写入，任务停在running
+    job_id = job_model.create_job(novel_id, novel_id, "book.txt", "txt")
+    job_model.update_job(job_id, {"status": "running"})
+    chapter_model.add_chapters(novel_id, ({"title": f"第{i}章", "content": "x"} for i in range(5)),
+                               batch_size=2, import_job_id=job_id)
+    (tmp_path / f"{job_id}.txt").write_bytes(b"x")
+    assert db.chapters.count_documents({}) == 6
+
+    # 心跳未超时：保持不变
+    job = runner.recover_if_stale(job_model.find_by_id(job_id))
+    assert job['status'] == 'running'
+
+    db.import_jobs.update_one({"_id": job_id}, {"$set": {"heartbeatTime": datetime.utcnow() - timedelta(minutes=5)}})
+    job = runner.recover_if_stale(job_model.find_by_id(job_id))
+    assert job['status'] == 'failed' and job['error']
+    assert [c['title'] for c in db.chapters.find()] == ["已有章节"]
+    novel = db.novels.find_one({"_id": novel_id})
+    assert novel['chapterCount'] == 1 and len(novel['chapters']) == 1
+    assert not os.path.exists(tmp_path / f"{job_id}.txt")
+
+
+def test_job_marked_failed_stops_and_rolls_back(env):
+    db, novel_id, job_model, chapter_model, runner = env
+    job_id = job_model.create_job(novel_id, novel_id, "book.txt", "txt")
+    path = os.path.join(runner.upload_folder, f"{job_id}.txt")
+    Upload("book.txt", book(6)).save(path)
+    job_model.update_job(job_id, {"status": "queued"})
+
+    # 第一批写入后任务被判定超时
+    original = job_model.update_job
+
+    def update_job(job_id, update_data, status=None):
+        if "chaptersFound" in update_data and status == "running":
+            original(job_id, {"status": "failed", "error": "超时"})
+        return original(job_id, update_data, status)
+
+    job_model.update_job = update_job
+    runner.run(job_id, novel_id, "txt", path)
+
+    job = job_model.find_by_id(job_id)
+    assert job['status'] == 'failed' and job['error'] == "超时"
+    assert db.chapters.count_documents({}) == 0
+
+
+def test_submit_runs_to_completion(env):
+    db, novel_id, job_model, chapter_model, runner = env
+    job_id = runner.submit(novel_id, novel_id, Upload("book.txt", book(5)))
+    runner.job_executor.shutdown(wait=True)
+
+    job = job_model.find_by_id(job_id)
+    assert job['status'] == 'done' and job['chaptersFound'] == 5
+    assert job['worker'].endswith(f":{os.getpid()}")
+    assert db.chapters.count_documents({"importJobId": job_id}) == 5
+    assert not runner.active
@@ -0,0 +1,43 @@
+"""
+查询形状检查：以各角色访问页面、执行离线任务，每种查询形状都不能退化为全表扫描或内存排序
+需要真实的 MongoDB（mongomock 不支持 explain），连接不上时跳过。检查库为 <MONGODB_DB>_advisor，结束后删除。
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from config import Config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def mongodb_available():
+    try:
+        MongoClient(Config.MONGODB_URI, serverSelectionTimeoutMS=1000).admin.command('ping')
+        return True
+    except PyMongoError:
+        return False
+
+
+@pytest.mark.skipif(not mongodb_available(), reason="MongoDB 不可用")
+def test_no_collscan_or_in_memory_sort():
+    # 在子进程中执行：检查程序在导入应用前切换库名，不能影响其他测试已导入的配置
+    result = subprocess.run([sys.executable, 'query_advisor.py', '--check'], cwd=ROOT,
+                            capture_output=True, text=True, timeout=600)
+    # 报告中标记为 ✗ 的形状及其下方缩进的问题和建议索引
+    failed, block = [], None
+    for line in result.stdout.splitlines():
+        if line.startswith('✗'):
+            block = [line]
+            failed.append(block)
+        elif block is not None and line.startswith('    '):
+            block.append(line)
+        else:
+            block = None
+    summary = '\n'.join('\n'.join(block) for block in failed) or result.stdout[-2000:] + result.stderr[-2000:]
+    assert result.returncode == 0, f"存在全表扫描或内存排序的查询形状（可在 ACCEPTED 中登记原因）：\n{summary}"
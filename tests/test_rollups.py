@@ -0,0 +1,64 @@
+"""
+趋势分桶合并：中断后重新执行不会重复累加，也不会丢失计数
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+mongomock = pytest.importorskip("mongomock")
+
+from rollups import RollupStore
+
+NOW = datetime(2026, 10, 18, 12)
+
+
+@pytest.fixture
+def store():
+    db = mongomock.MongoClient().novel_platform
+    novel_ids = [db.novels.insert_one({"category": "玄幻", "authorId": "a"}).inserted_id for _ in range(3)]
+    store = RollupStore(db, hourly_retention_days=2)
+    # 5天前、4天前各24小时，每小时每部小说1次阅读
+    for day in (5, 4):
+        for hour in range(24):
+            when = NOW.replace(hour=0) - timedelta(days=day) + timedelta(hours=hour)
+            store.record({novel_id: {"reads": 1} for novel_id in novel_ids}, when=when)
+    store.record({novel_ids[0]: {"reads": 1, "sales": 1}}, when=NOW)
+    return store
+
+
+def daily_reads(store):
+    return [point["reads"] for point in store.series("site", "all", NOW - timedelta(days=5), NOW + timedelta(hours=1))]
+
+
+def test_compact_merges_old_hours(store):
+    before = daily_reads(store)
+    assert store.compact(now=NOW) == 2 * 24 * 6  # 全站、3部小说、分类、作者
+    assert daily_reads(store) == before == [72, 72, 0, 0, 0, 1]
+    assert store.collection.count_documents({"granularity": "hour"}) == 4
+    assert store.collection.count_documents({"granularity": "day", "scope": "novel"}) == 6
+
+
+def test_interrupted_compact_resumes(store):
+    before = daily_reads(store)
+    delete_many = store.collection.delete_many
+    calls = []
+
+    # 第二个批次累加到日桶后、删除小时桶前中断
+    def flaky_delete(query, *args, **kwargs):
+        calls.append(query)
+        if len(calls) == 2:
+            raise AutoReconnect("injected")
+        return delete_many(query, *args, **kwargs)
+
+    store.collection.delete_many = flaky_delete
+    with pytest.raises(AutoReconnect):
+        store.compact(now=NOW)
+    store.collection.delete_many = delete_many
+
+    store.compact(now=NOW)
+    assert daily_reads(store) == before
+    novel_days = store.collection.find({"granularity": "day", "scope": "novel"})
+    assert sorted(doc["reads"] for doc in novel_days) == [24] * 6
+    assert not store.collection.count_documents({"compacting": {"$exists": True}})
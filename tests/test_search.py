@@ -0,0 +1,61 @@
+"""
+全文搜索：命中数精确，只有排在前面的候选参与排序
+"""
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from search import SearchIndex
+
+
+@pytest.fixture
+def index():
+    db = mongomock.MongoClient().novel_platform
+    author_id = db.users.insert_one({"username": "作者"}).inserted_id
+    for i in range(50):
+        title = f"修仙传{i}" if i % 10 else f"修仙重生记{i}"
+        db.novels.insert_one({"title": title, "authorId": author_id, "tags": [], "status": "online",
+                              "category": "玄幻" if i % 2 else "仙侠", "intro": "修仙" * (i % 5 + 1)})
+    search_index = SearchIndex(db, max_postings=8)
+    search_index.rebuild()
+    return search_index
+
+
+def titles(index, novel_ids):
+    return [index.novels.find_one({"_id": novel_id})["title"] for novel_id in novel_ids]
+
+
+def test_rare_term_returns_every_match(index):
+    novel_ids, total = index.search("修仙重生", limit=20)
+    assert total == 5
+    assert sorted(titles(index, novel_ids)) == sorted(f"修仙重生记{i}" for i in range(0, 50, 10))
+
+    novel_ids, total = index.search("重生", category="仙侠", limit=20)
+    assert total == 5
+
+
+def test_common_term_reads_bounded_postings(index):
+    reads = []
+    top_postings = index.top_postings
+    index.top_postings = lambda term, category=None, limit=None: \
+        reads.append((term, limit)) or top_postings(term, category, limit)
+
+    novel_ids, total = index.search("修仙", limit=5)
+    assert reads == [("修仙", 8)]
+    assert total == 50 and len(novel_ids) == 5
+    assert index.search("修仙", skip=8) == ([], 50)
+
+
+def test_common_terms_intersect_all_postings(index):
+    # 两个词项都超过候选数，交集按批求出，命中数精确
+    novel_ids, total = index.search("修仙传", limit=20)
+    assert total == 45 and len(novel_ids) == 8
+    assert all(title.startswith("修仙传") for title in titles(index, novel_ids))
+
+    novel_ids, total = index.search("修仙传", category="玄幻", limit=20)
+    assert total == 25
+
+
+def test_missing_term_stops_early(index):
+    assert index.search("修仙 不存在") == ([], 0)
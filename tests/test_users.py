@@ -0,0 +1,48 @@
+"""
+批量创建用户：列表内重复、已存在和并发注册的用户名
+"""
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from models import UserModel
+from passwords import PasswordHasher
+
+
+@pytest.fixture
+def user_model():
+    db = mongomock.MongoClient().novel_platform
+    db.users.create_index("username", unique=True)
+    model = UserModel(db, hasher=PasswordHasher(rounds=4))
+    model.create_user("old", "x", "reader")
+    return model
+
+
+def role_count(model, role):
+    doc = model.stats.collection.find_one({"_id": f"role:{role}"}) or {}
+    return doc.get("count", 0)
+
+
+def test_duplicates_in_list_reported(user_model):
+    readers = role_count(user_model, "reader")
+    created, existing, duplicates = user_model.create_users(
+        [("a", "1", "reader"), ("a", "2", "creator"), ("old", "3", "reader"), ("b", "4", "reader")])
+    assert (created, existing, duplicates) == (2, ["old"], ["a"])
+    assert user_model.collection.find_one({"username": "a"})["role"] == "reader"
+    assert role_count(user_model, "reader") == readers + 2
+
+
+def test_registered_concurrently(user_model):
+    readers = role_count(user_model, "reader")
+    find = user_model.collection.find
+    # 检查存在之后、写入之前被其他请求注册
+    def find_then_register(*args, **kwargs):
+        result = list(find(*args, **kwargs))
+        user_model.collection.insert_one({"username": "c", "role": "reader"})
+        return result
+    user_model.collection.find = find_then_register
+
+    created, existing, duplicates = user_model.create_users([("c", "1", "reader"), ("d", "2", "reader")])
+    assert (created, existing, duplicates) == (1, ["c"], [])
+    assert role_count(user_model, "reader") == readers + 1
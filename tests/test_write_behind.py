@@ -0,0 +1,137 @@
+"""
+写缓冲：并发记录阅读与进度，刷写失败（包括已生效但未收到确认）后重试，计数不丢失也不重复
+"""
+
+import threading
+
+import pytest
+from bson.objectid import ObjectId
+from pymongo.errors import AutoReconnect
+
+mongomock = pytest.importorskip("mongomock")
+
+from models import NovelModel, ReadingRecordModel
+from write_behind import WriteBehindBuffer
+
+THREADS = 8
+READS_PER_THREAD = 500
+
+
+class FlakyCollection:
+    """代理集合：第一次 bulk_write 按 mode 注入失败
+    before-服务器未执行就出错，after-已执行但确认丢失（网络中断）"""
+
+    def __init__(self, collection, mode):
+        self.collection = collection
+        self.mode = mode
+        self.failures = 0
+
+    def bulk_write(self, ops, **kwargs):
+        if self.mode and not self.failures:
+            self.failures += 1
+            if self.mode == 'after':
+                self.collection.bulk_write(ops, **kwargs)
+            raise AutoReconnect("injected")
+        return self.collection.bulk_write(ops, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().novel_platform
+
+
+def make_buffer(db, mode=None):
+    novel_model = NovelModel(db)
+    reading_record_model = ReadingRecordModel(db)
+    buffer = WriteBehindBuffer(novel_model, reading_record_model, flush_interval=3600)
+    buffer.novels = FlakyCollection(buffer.novels, mode)
+    buffer.reading_records = FlakyCollection(buffer.reading_records, mode)
+    buffer._ensure_started = lambda: None  # 由测试控制刷写时机
+    return buffer
+
+
+def read_concurrently(buffer, novel_ids, readers):
+    """多个线程同时记录阅读和进度，同时另一个线程不断刷写"""
+    done = threading.Event()
+
+    def reader(index):
+        for i in range(READS_PER_THREAD):
+            novel_id = novel_ids[i % len(novel_ids)]
+            buffer.record_read(novel_id)
+            buffer.record_progress(readers[index], novel_id, f"CH{i:03d}")
+
+    def flusher():
+        while not done.is_set():
+            try:
+                buffer.flush()
+            except RuntimeError:
+                pass
+
+    flush_thread = threading.Thread(target=flusher)
+    flush_thread.start()
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    done.set()
+    flush_thread.join()
+
+
+@pytest.mark.parametrize("mode", [None, "before", "after"])
+def test_counts_exact_after_failed_flush(db, mode):
+    author_id = ObjectId()
+    novel_ids = [db.novels.insert_one({"readCount": 0, "category": "玄幻", "status": "online", "authorId": author_id,
+                                       "title": f"小说{i}"}).inserted_id for i in range(3)]
+    readers = [ObjectId() for _ in range(THREADS)]
+    buffer = make_buffer(db, mode)
+    buffer.novel_model.stats.reconcile()
+
+    read_concurrently(buffer, novel_ids, readers)
+    if mode:
+        assert buffer.novels.failures == 1
+    # 剩余缓冲和未确认批次在之后的刷写中写入
+    buffer.flush()
+    buffer.flush()
+
+    total = THREADS * READS_PER_THREAD
+    counts = [db.novels.find_one({"_id": novel_id})["readCount"] for novel_id in novel_ids]
+    assert sum(counts) == total
+    assert counts == [len(range(i, READS_PER_THREAD, len(novel_ids))) * THREADS for i in range(len(novel_ids))]
+    assert not buffer.unconfirmed and not buffer.read_deltas
+
+    # 每个读者每部小说一条进度，为最后一次阅读的章节
+    assert db.reading_records.count_documents({}) == THREADS * len(novel_ids)
+    last = {novel_ids[i % len(novel_ids)]: f"CH{i:03d}" for i in range(READS_PER_THREAD)}
+    for record in db.reading_records.find():
+        assert record["currentChapterId"] == last[record["novelId"]]
+
+    # 趋势分桶与阅读量一致
+    site = db.rollups.find_one({"scope": "site", "key": "all"})
+    assert site["reads"] == total
+
+    # 后台统计随刷写累加，Top榜按最新阅读量排序
+    for doc_id in ("totals", "category:玄幻", f"creator:{author_id}"):
+        assert db.stats.find_one({"_id": doc_id})["totalRead"] == total
+    top = db.stats.find_one({"_id": "top_novels"})
+    assert [n["readCount"] for n in top["byRead"]] == sorted(counts, reverse=True)
+
+
+def test_unconfirmed_batch_retried_once(db):
+    novel_id = db.novels.insert_one({"readCount": 10}).inserted_id
+    buffer = make_buffer(db, "after")
+    for _ in range(5):
+        buffer.record_read(novel_id)
+
+    with pytest.raises(RuntimeError):
+        buffer.flush()
+    assert db.novels.find_one({"_id": novel_id})["readCount"] == 15
+    assert len(buffer.unconfirmed) == 1
+
+    buffer.record_read(novel_id)
+    buffer.flush()
+    assert db.novels.find_one({"_id": novel_id})["readCount"] == 16
+    assert not buffer.unconfirmed
@@ -0,0 +1,141 @@
+"""
+冷启动优化与启动时间测量
+  - 模板字节码缓存：编译后的模板保存在 TEMPLATE_CACHE_DIR，新进程加载模板时无需重新编译
+  - 预编译：构建镜像时执行 python warmup.py，把全部模板编译进字节码缓存
+  - 预热：gunicorn 主进程加载应用时把全部模板载入内存（fork出的工作进程直接继承），
+    每个工作进程启动后先建立数据库连接并访问 WARMUP_URLS，再开始接收请求
+
+  python warmup.py                         预编译全部模板
+  python warmup.py --bench [--runs 5]      测量 python serve.py 从启动到第一个响应的时间（TTFB）
+      [--path /login] [--no-warmup] [--no-template-cache] [--output startup.jsonl]
+      每次运行单独启动一个 serve.py（1个工作进程），中位数可追加到 --output 指定的文件中跟踪变化
+"""
+
+from jinja2 import FileSystemBytecodeCache
+from datetime import datetime
+import json
+import os
+import sys
+import time
+
+
+def enable_template_cache(app):
+    """为应用启用模板字节码缓存"""
+    cache_dir = app.config.get('TEMPLATE_CACHE_DIR')
+    if not cache_dir:
+        return
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError as e:
+        print(f"模板字节码缓存目录不可用，已跳过：{e}")
+        return
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+
+def compile_templates(app):
+    """加载全部模板（写入字节码缓存并留在内存中），返回模板数"""
+    names = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def warm_up(app, db):
+    """工作进程预热：建立数据库连接，访问预热地址"""
+    started = time.perf_counter()
+    db.client.admin.command('ping')
+    client = app.test_client()
+    for url in app.config.get('WARMUP_URLS', []):
+        response = client.get(url)
+        if response.status_code >= 500:
+            print(f"预热地址 {url} 返回 {response.status_code}")
+    return time.perf_counter() - started
+
+
+def measure_startup(path='/login', env=None, timeout=60):
+    """启动 serve.py，返回(启动到第一个响应的秒数, 第二个请求的秒数)"""
+    import http.client
+    import socket
+    import subprocess
+    import tempfile
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, **(env or {}), SERVER_BIND=f'127.0.0.1:{port}', SERVER_WORKERS='1')
+
+    log = tempfile.TemporaryFile()
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'serve.py'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                               env=env, stdout=subprocess.DEVNULL, stderr=log)
+    try:
+        while True:
+            if process.poll() is not None:
+                log.seek(0)
+                raise RuntimeError(f"serve.py 启动失败：{log.read().decode(errors='replace')[-500:]}")
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError(f"{timeout} 秒内没有响应")
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+                conn.request('GET', path)
+                response = conn.getresponse()  # 读到状态行即收到第一个字节
+                first = time.perf_counter() - started
+                response.read()
+                break
+            except OSError:
+                time.sleep(0.01)
+
+        t = time.perf_counter()
+        conn.request('GET', path)
+        conn.getresponse().read()
+        second = time.perf_counter() - t
+        conn.close()
+        return first, second
+    finally:
+        process.terminate()
+        process.wait()
+        log.close()
+
+
+def benchmark(argv):
+    runs = int(argv[argv.index('--runs') + 1]) if '--runs' in argv else 5
+    path = argv[argv.index('--path') + 1] if '--path' in argv else '/login'
+    env = {}
+    if '--no-warmup' in argv:
+        env['WARMUP_ENABLED'] = 'false'
+    if '--no-template-cache' in argv:
+        env['TEMPLATE_CACHE_DIR'] = ''
+
+    results = []
+    for i in range(runs):
+        first, second = measure_startup(path, env)
+        results.append((first, second))
+        print(f"第 {i + 1} 次：首个响应 {first * 1000:.0f} ms，第二个请求 {second * 1000:.1f} ms")
+    first = sorted(r[0] for r in results)[len(results) // 2]
+    second = sorted(r[1] for r in results)[len(results) // 2]
+    print(f"\n中位数：首个响应（TTFB）{first * 1000:.0f} ms，第二个请求 {second * 1000:.1f} ms")
+
+    # 追加到记录文件，便于跟踪启动时间的变化
+    if '--output' in argv:
+        with open(argv[argv.index('--output') + 1], 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                "time": datetime.utcnow().isoformat(timespec='seconds'),
+                "path": path, "runs": runs, "options": env,
+                "ttfbMs": round(first * 1000), "secondMs": round(second * 1000, 1)
+            }, ensure_ascii=False) + "\n")
+
+
+if __name__ == '__main__':
+    try:
+        if '--bench' in sys.argv:
+            benchmark(sys.argv)
+        else:
+            from app import app
+            started = time.perf_counter()
+            count = compile_templates(app)
+            print(f"✓ 已编译 {count} 个模板到 {app.config['TEMPLATE_CACHE_DIR']}（{time.perf_counter() - started:.2f} 秒）")
+    except Exception as e:
+        print(f"\n错误: {str(e)}")
+        print("请确保 MongoDB 服务已启动，并检查连接配置。")
+        # 构建镜像时（RUN python warmup.py）模板或导入出错应使构建失败
+        sys.exit(1)
@@ -0,0 +1,192 @@
+"""
+阅读量与阅读进度的写缓冲（write-behind）
+每次阅读章节不再同步写库：阅读量增量按小说合并，阅读进度按(读者, 小说)只保留最后一次，
+由后台线程定时或在积压达到阈值时用一次 bulk_write 批量落库，进程正常退出时也会刷写。
+落库的阅读量同时累加到当前小时的趋势分桶（rollups）和后台统计（stats 的 totalRead、Top榜）。
+
+网络错误、超时或主从切换时无法确定批量写入是否已经生效，因此每批阅读量增量带一个批次号，
+只在小说文档的 writeBatches（最近 WRITE_BATCH_HISTORY 个批次号）中没有该批次号时才累加，
+同一批次原样重试不会重复计数；阅读进度是覆盖写，重试本身就是幂等的。
+"""
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from bson.objectid import ObjectId
+from datetime import datetime
+import atexit
+import os
+import threading
+
+# 每部小说记录的最近批次号个数；未确认的批次总在下一次刷写时最先重试，远小于这个数
+WRITE_BATCH_HISTORY = 32
+
+
+class WriteBehindBuffer:
+    """阅读量/阅读进度写缓冲"""
+
+    def __init__(self, novel_model, reading_record_model, enabled=True,
+                 flush_interval=5, max_pending=1000):
+        self.novels = novel_model.collection
+        self.reading_records = reading_record_model.collection
+        self.novel_model = novel_model
+        self.reading_record_model = reading_record_model
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self.lock = threading.Lock()
+        # 刷写过程互斥，保证失败回填与下一次刷写不交错
+        self.flush_lock = threading.Lock()
+        self.read_deltas = {}    # novelId -> 待累加的阅读量
+        self.progress = {}       # (readerId, novelId) -> 最后一次阅读进度
+        self.unconfirmed = []    # [(批次号, {novelId: 增量})] 写入结果未确认、待原样重试的阅读量
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+        atexit.register(self.shutdown)
+
+    def _ensure_started(self):
+        """按需启动后台刷写线程（fork后在子进程中重新启动）"""
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"写缓冲刷写失败，将在下次重试：{e}")
+
+    def shutdown(self):
+        """进程退出前刷写剩余缓冲"""
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"退出前写缓冲刷写失败：{e}")
+
+    def _pending_size(self):
+        return len(self.read_deltas) + len(self.progress)
+
+    def record_read(self, novel_id):
+        """记录一次阅读"""
+        if not self.enabled:
+            return self.novel_model.increment_read_count(novel_id)
+        self._ensure_started()
+        key = ObjectId(novel_id)
+        with self.lock:
+            self.read_deltas[key] = self.read_deltas.get(key, 0) + 1
+            full = self._pending_size() >= self.max_pending
+        if full:
+            self.wakeup.set()
+
+    def record_progress(self, reader_id, novel_id, chapter_id, page=0):
+        """记录阅读进度，同一读者同一小说只保留最后一次"""
+        if not self.enabled:
+            return self.reading_record_model.save_progress(reader_id, novel_id, chapter_id, page)
+        self._ensure_started()
+        key = (ObjectId(reader_id), ObjectId(novel_id))
+        with self.lock:
+            self.progress[key] = {
+                "currentChapterId": chapter_id,
+                "page": page,
+                "updateTime": datetime.utcnow()
+            }
+            full = self._pending_size() >= self.max_pending
+        if full:
+            self.wakeup.set()
+
+    def pending_progress(self, reader_id, novel_id):
+        """尚未落库的最新阅读进度，没有时返回None"""
+        key = (ObjectId(reader_id), ObjectId(novel_id))
+        with self.lock:
+            pending = self.progress.get(key)
+        if pending is not None:
+            return dict(pending, readerId=key[0], novelId=key[1])
+        return None
+
+    def get_progress(self, reader_id, novel_id):
+        """获取阅读进度，优先返回尚未落库的最新进度"""
+        pending = self.pending_progress(reader_id, novel_id)
+        if pending is not None:
+            return pending
+        return self.reading_record_model.get_progress(reader_id, novel_id)
+
+    def flush(self):
+        """将缓冲中的增量批量写入数据库，未确认写入的部分留待下次原样重试，不丢失也不重复计数"""
+        with self.flush_lock:
+            with self.lock:
+                read_deltas, self.read_deltas = self.read_deltas, {}
+                progress, self.progress = self.progress, {}
+
+            batches, self.unconfirmed = self.unconfirmed, []
+            if read_deltas:
+                batches.append((ObjectId(), read_deltas))
+            confirmed = {}
+            for batch_id, deltas in batches:
+                failed = self._bulk_write(self.novels, deltas, lambda novel_id, delta: UpdateOne(
+                    {"_id": novel_id, "writeBatches": {"$ne": batch_id}},
+                    {"$inc": {"readCount": delta},
+                     "$push": {"writeBatches": {"$each": [batch_id], "$slice": -WRITE_BATCH_HISTORY}}}))
+                if failed:
+                    self.unconfirmed.append((batch_id, failed))
+                for novel_id, delta in deltas.items():
+                    if novel_id not in failed:
+                        confirmed[novel_id] = confirmed.get(novel_id, 0) + delta
+
+            failed_progress = self._bulk_write(self.reading_records, progress, lambda key, record: UpdateOne(
+                {"readerId": key[0], "novelId": key[1]}, {"$set": record}, upsert=True))
+
+            # 趋势分桶和统计只累加本次确认写入的增量，每个增量只会被确认一次
+            self._record_rollups(confirmed)
+            self._record_stats(confirmed)
+
+            if self.unconfirmed or failed_progress:
+                self._restore_progress(failed_progress)
+                count = sum(len(deltas) for _, deltas in self.unconfirmed) + len(failed_progress)
+                raise RuntimeError(f"{count} 条缓冲写入未确认，将在下次刷写时重试")
+
+    def _record_rollups(self, read_deltas):
+        """累加趋势分桶；失败只影响趋势图，不回填缓冲以免重复计入阅读量"""
+        try:
+            self.novel_model.rollups.record({novel_id: {"reads": delta} for novel_id, delta in read_deltas.items()})
+        except PyMongoError as e:
+            print(f"阅读量趋势分桶写入失败：{e}")
+
+    def _record_stats(self, read_deltas):
+        """累加后台统计的阅读量；失败时的误差由定期校准纠正，同样不回填缓冲"""
+        if not read_deltas:
+            return
+        try:
+            self.novel_model.stats.record_reads(read_deltas)
+        except PyMongoError as e:
+            print(f"阅读量统计写入失败：{e}")
+
+    @staticmethod
+    def _bulk_write(collection, items, make_op):
+        """批量写入，返回未确认写入的条目"""
+        if not items:
+            return {}
+        keys = list(items)
+        try:
+            collection.bulk_write([make_op(key, items[key]) for key in keys], ordered=False)
+        except BulkWriteError as e:
+            # 无序批量写入中只有出错的操作未生效
+            return {keys[err['index']]: items[keys[err['index']]] for err in e.details.get('writeErrors', [])}
+        except PyMongoError:
+            # 网络错误、超时等：各操作可能已部分生效，只能整体重试
+            return items
+        return {}
+
+    def _restore_progress(self, progress):
+        """把未写入的阅读进度放回缓冲（缓冲中较新的进度优先）"""
+        with self.lock:
+            for key, record in progress.items():
+                self.progress.setdefault(key, record)